@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import pathlib
+import statistics
+import time
+
+from holoscope.datamodel import AwsConfiguration
+from holoscope.datamodel import Configuration
+from holoscope.datamodel import HoloduleConfiguration
+from holoscope.datamodel import YoutubeConfiguration
+from holoscope.importer_plugin import holodule
+from pipeline import generate_fixtures
+
+# 保存したページが指定されない場合に生成するページの推しの人数
+MEMBERS = [5, 30, 80, 200]
+
+
+def measure(func, html: str, repeat: int) -> tuple:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        programs = func(html)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), programs
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare holodule parsers on saved pages.')
+    parser.add_argument('pages', nargs='*', help='saved holodule html files (default: generated pages)')
+    parser.add_argument('-n', '--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.pages:
+        pages = [(path, pathlib.Path(path).read_text()) for path in args.pages]
+    else:
+        pages = [(f'generated members={m}', generate_fixtures(m, 0)['holodule_html']) for m in MEMBERS]
+    config = Configuration(aws=AwsConfiguration(), holodule=HoloduleConfiguration(holomenbers=[]),
+                           youtube=YoutubeConfiguration(api_key=''))
+    importer = holodule.Importer(config, None, load=False)
+
+    print(f'{"page":<32} {"KiB":>8} {"programs":>8} {"soup(ms)":>10} {"stream(ms)":>10} {"speedup":>8}')
+    for name, html in pages:
+        soup_time, soup_programs = measure(importer._parse_programs_with_soup, html, args.repeat)
+        stream_time, stream_programs = measure(holodule.holodule_parser.parse_programs, html, args.repeat)
+        if soup_programs != stream_programs:
+            print(f'{name}: streaming parser returned different programs from soup')
+        print(f'{name:<32} {len(html.encode()) / 1024:>8.1f} {len(stream_programs):>8} ' +
+              f'{soup_time:>10.1f} {stream_time:>10.1f} {soup_time / stream_time:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
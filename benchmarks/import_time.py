@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import statistics
+import subprocess
+import sys
+
+# Lambdaのコールドスタートで読み込まれるモジュール
+MODULES = [
+    'run',
+    'holoscope.core',
+    'holoscope.utils',
+    'holoscope.token_manager',
+    'holoscope.thumbnail_cache_manager',
+    'holoscope.importer_plugin.holodule',
+    'holoscope.exporter_plugin.gcwl',
+    'googleapiclient.discovery',
+    'boto3',
+    'linebot',
+    'bs4',
+]
+
+
+def measure_import(module: str) -> int:
+    # 新しいインタプリタで-X importtimeを使い、累積のimport時間(us)を取得する
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            capture_output=True, text=True, check=True)
+    for line in result.stderr.splitlines():
+        parts = line.split('|')
+        if len(parts) == 3 and parts[2].strip() == module:
+            return int(parts[1].strip())
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure import time of holoscope modules.')
+    parser.add_argument('-n', '--repeat', type=int, default=5)
+    parser.add_argument('modules', nargs='*', default=MODULES)
+    args = parser.parse_args()
+
+    print(f'{"module":<40} {"median(ms)":>10} {"min(ms)":>10}')
+    for module in args.modules:
+        samples = [measure_import(module) / 1000 for _ in range(args.repeat)]
+        print(f'{module:<40} {statistics.median(samples):>10.1f} {min(samples):>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import arrow
+import copy
+import json
+import logging
+import os
+import pathlib
+import random
+import tempfile
+import time
+import toml
+import tracemalloc
+
+from holoscope.clients import set_client_factory
+from holoscope.datamodel import AwsConfiguration
+from holoscope.datamodel import Configuration
+from holoscope.datamodel import GeneralConfiguration
+from holoscope.datamodel import GoogleCalendarConfiguration
+from holoscope.datamodel import HoloduleConfiguration
+from holoscope.datamodel import LineConfiguration
+from holoscope.datamodel import YoutubeConfiguration
+from holoscope.exporter_plugin import gcwl
+from holoscope.fake_backends import FakeBackend
+from holoscope.fake_backends import FakeClientFactory
+from holoscope.importer_plugin import holodule
+
+# 推し以外にholoduleへ載っているホロメンの数と、1人あたりの配信予定の数
+OTHER_MEMBERS = 20
+PROGRAMS_PER_MEMBER = 4
+COLLABORATION_RATE = 0.2
+SCALES = [(5, 50), (30, 500), (80, 2000)]
+
+PROGRAM_TEMPLATE = '''
+<div class="col-6 col-sm-4 col-md-3">
+  <a href="https://www.youtube.com/watch?v={video_id}">
+    <div class="col text-right name">
+      {actor}
+    </div>
+    {images}
+  </a>
+</div>'''
+IMAGE_TEMPLATE = '<div class="col col-sm col-md col-lg col-xl"><img src="{src}"></div>'
+
+
+def generate_fixtures(members: int, events: int, seed: int = 0) -> dict:
+    # 実際のholodule/YouTube/Calendarのレスポンスと同じ形式のデータを生成する
+    rng = random.Random(seed)
+    now = arrow.utcnow().floor('minute')
+    roster = [f'member{i:03d}' for i in range(members + OTHER_MEMBERS)]
+    thumbnail_cache = {
+        holomen: {'channel': f'UC{i:022d}',
+                  'holodule_url': f'https://yt3.ggpht.com/holodule/{i}',
+                  'youtube_url': f'https://yt3.ggpht.com/youtube/{i}',
+                  'youtube_checked_at': now.isoformat()}
+        for i, holomen in enumerate(roster)}
+    channels = [{'id': thumbnail_cache[holomen]['channel'],
+                 'snippet': {'title': holomen,
+                             'thumbnails': {'default': {'url': thumbnail_cache[holomen]['youtube_url']}}}}
+                for holomen in roster]
+
+    html = []
+    videos = []
+    for holomen in roster:
+        for _ in range(PROGRAMS_PER_MEMBER):
+            video_id = f'v{len(videos):010d}'
+            collaborators = []
+            if rng.random() < COLLABORATION_RATE:
+                collaborators = rng.sample([m for m in roster if m != holomen], rng.randint(1, 3))
+            images = [IMAGE_TEMPLATE.format(src=thumbnail_cache[m]['holodule_url'])
+                      for m in [holomen] + collaborators]
+            html.append(PROGRAM_TEMPLATE.format(video_id=video_id, actor=holomen, images=''.join(images)))
+            scheduled_start_time = now.shift(minutes=rng.randint(-48 * 60, 72 * 60))
+            details = {'scheduledStartTime': scheduled_start_time.isoformat()}
+            if scheduled_start_time < now:
+                actual_start_time = scheduled_start_time.shift(minutes=rng.randint(0, 10))
+                details['actualStartTime'] = actual_start_time.isoformat()
+                if scheduled_start_time < now.shift(hours=-2):
+                    details['actualEndTime'] = scheduled_start_time.shift(hours=2).isoformat()
+            videos.append({'id': video_id,
+                           'snippet': {'title': f'stream {video_id}',
+                                       'channelId': thumbnail_cache[holomen]['channel'],
+                                       'channelTitle': holomen},
+                           'liveStreamingDetails': details})
+
+    calendar_events = []
+    for i in range(events):
+        holomen = rng.choice(roster)
+        start = now.shift(minutes=rng.randint(-7 * 24 * 60, 120 * 24 * 60))
+        summary = f'{holomen}: stream old{i:06d}'
+        if rng.random() < COLLABORATION_RATE:
+            summary = f'[{" ".join(rng.sample(roster, 2))} コラボ] {summary}'
+        calendar_events.append({
+            'id': f'event{i:06d}',
+            'summary': summary,
+            'start': {'dateTime': start.isoformat(), 'timeZone': 'Asia/Tokyo'},
+            'end': {'dateTime': start.shift(hours=1).isoformat(), 'timeZone': 'Asia/Tokyo'},
+            'extendedProperties': {'private': {
+                'video_id': f'old{i:06d}',
+                'title': f'stream old{i:06d}',
+                'channel_id': thumbnail_cache[holomen]['channel'],
+                'actor': holomen,
+                'scheduled_start_time': start.format(gcwl.ISO861FORMAT)}}})
+
+    return {
+        'holomenbers': roster[:members],
+        'holodule_html': '\n'.join(html),
+        'videos': videos,
+        'channels': channels,
+        'events': calendar_events,
+        'thumbnail_cache': thumbnail_cache,
+    }
+
+
+def load_fixtures(fixtures_dir: str) -> dict:
+    # 記録したレスポンスを置いたディレクトリから読み込む
+    path = pathlib.Path(fixtures_dir)
+
+    def load_items(name):
+        with open(path / name, 'rt') as f:
+            data = json.load(f)
+        return data.get('items', []) if isinstance(data, dict) else data
+
+    thumbnail_cache = toml.load(path / 'thumbnail_cache.toml')
+    holomenbers = list(thumbnail_cache)
+    if (path / 'holomenbers.json').exists():
+        with open(path / 'holomenbers.json', 'rt') as f:
+            holomenbers = json.load(f)
+    return {
+        'holomenbers': holomenbers,
+        'holodule_html': (path / 'holodule.html').read_text(),
+        'videos': load_items('videos.json'),
+        'channels': load_items('channels.json'),
+        'events': load_items('events.json'),
+        'thumbnail_cache': thumbnail_cache,
+    }
+
+
+def create_config(fixtures: dict, args) -> Configuration:
+    return Configuration(
+        aws=AwsConfiguration(),
+        general=GeneralConfiguration(importer_plugin='holodule', exporter_plugin='gcwl'),
+        holodule=HoloduleConfiguration(holomenbers=fixtures['holomenbers']),
+        google_calendar=GoogleCalendarConfiguration(calendar_id='primary',
+                                                    enable_batch=args.batch,
+                                                    enable_incremental_sync=args.incremental_sync,
+                                                    max_workers=args.workers,
+                                                    max_requests_per_second=1e9),
+        youtube=YoutubeConfiguration(api_key='fake', enable_video_state=args.video_state),
+        line=LineConfiguration(line_channel_access_token='fake', enable_message_buffer=args.batch),
+    )
+
+
+def run_stages(config, factory, trace_memory=False) -> list:
+    # core.Holoscope.runと同じ順番で各段階を実行し、段階ごとの時間とメモリのピークを測る
+    results = []
+
+    def stage(name, func, *args):
+        if trace_memory:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        value = func(*args)
+        peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+        results.append((name, time.perf_counter() - start, peak))
+        return value
+
+    youtube = stage('clients', lambda: (factory.calendar(None), factory.youtube(config.youtube.api_key))[1])
+    importer = holodule.Importer(config, youtube, load=False)
+    all_programs = stage('holodule', importer._get_programs)
+    thumbnail_cache = stage('thumbnail_cache', importer.get_thumbnail_cache, all_programs)
+    programs = stage('filter_programs', importer.filter_programs, all_programs, thumbnail_cache)
+    events = stage('videos.list', importer.create_live_events, programs, thumbnail_cache)
+    stage('save_state', importer.save_state)
+    events = stage('deduplicate', importer._deduplicate_live_events, events)
+    exporter = stage('calendar.list', gcwl.Exporter, config)
+    stage('create_event', exporter.create_event, events)
+    stage('delete_duplicate_event', exporter.delete_duplicate_event, events)
+    stage('flush', exporter.flush)
+    return results
+
+
+def run_case(fixtures: dict, args) -> dict:
+    # 空のカレンダーに予定を作る1回目(cold)と、変更のない2回目(warm)を続けて測る
+    config = create_config(fixtures, args)
+    report = {}
+    for trace_memory in (False, True):
+        # holoduleの取得は再試行しないので、エラーはAPI呼び出しにだけ入れる
+        backend = FakeBackend(fixtures['holodule_html'], fixtures['videos'], fixtures['channels'],
+                              fixtures['events'], latency={'default': args.latency},
+                              error_rates={'default': args.error_rate, 'holodule': 0}, seed=args.seed)
+        factory = FakeClientFactory(backend)
+        previous = set_client_factory(factory)
+        cwd = os.getcwd()
+        try:
+            with tempfile.TemporaryDirectory() as workdir:
+                os.chdir(workdir)
+                with open('thumbnail_cache.toml', 'wt') as f:
+                    toml.dump(copy.deepcopy(fixtures['thumbnail_cache']), f)
+                if trace_memory:
+                    tracemalloc.start()
+                for run in ('cold', 'warm'):
+                    calls, errors = backend.calls.copy(), backend.errors.copy()
+                    results = run_stages(config, factory, trace_memory)
+                    report.setdefault(run, {'calls': backend.calls - calls,
+                                            'errors': backend.errors - errors})
+                    key = 'memory' if trace_memory else 'time'
+                    report[run][key] = {name: (peak if trace_memory else elapsed)
+                                        for name, elapsed, peak in results}
+        finally:
+            if trace_memory:
+                tracemalloc.stop()
+            os.chdir(cwd)
+            set_client_factory(previous)
+    return report
+
+
+def print_report(title: str, report: dict):
+    print(title)
+    print(f'  {"stage":<24} {"cold(ms)":>10} {"warm(ms)":>10} {"peak(KiB)":>10}')
+    cold, warm = report['cold'], report['warm']
+    for name in cold['time']:
+        print(f'  {name:<24} {cold["time"][name] * 1000:>10.1f} {warm["time"][name] * 1000:>10.1f} ' +
+              f'{max(cold["memory"][name], warm["memory"][name]) / 1024:>10.1f}')
+    print(f'  {"total":<24} {sum(cold["time"].values()) * 1000:>10.1f} ' +
+          f'{sum(warm["time"].values()) * 1000:>10.1f}')
+    for run in ('cold', 'warm'):
+        calls = ', '.join(f'{k}={v}' for k, v in sorted(report[run]['calls'].items()))
+        print(f'  {run} API calls: {calls}')
+        if report[run]['errors']:
+            errors = ', '.join(f'{k}={v}' for k, v in sorted(report[run]['errors'].items()))
+            print(f'  {run} injected errors: {errors}')
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark holoscope pipeline with fake backends.')
+    parser.add_argument('--scale', action='append', metavar='MEMBERS:EVENTS',
+                        help='favorite members and calendar events (default: 5:50 30:500 80:2000)')
+    parser.add_argument('--fixtures', help='directory of recorded responses instead of generated ones')
+    parser.add_argument('--batch', action='store_true', help='enable calendar batch and LINE buffer')
+    parser.add_argument('--incremental-sync', action='store_true')
+    parser.add_argument('--video-state', action='store_true', help='skip fetching ended videos')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--latency', type=float, default=0, help='seconds added to each API call')
+    parser.add_argument('--error-rate', type=float, default=0,
+                        help='rate of API calls answered with 429/5xx to measure retries')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-v', '--verbose', action='store_true')
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.disable(logging.INFO)
+    if args.fixtures:
+        fixtures = load_fixtures(args.fixtures)
+        print_report(f'fixtures={args.fixtures}', run_case(fixtures, args))
+        return
+    scales = [tuple(map(int, s.split(':'))) for s in args.scale] if args.scale else SCALES
+    for members, events in scales:
+        fixtures = generate_fixtures(members, events, args.seed)
+        print_report(f'members={members} events={events} programs={len(fixtures["videos"])}',
+                     run_case(fixtures, args))
+
+
+if __name__ == '__main__':
+    main()
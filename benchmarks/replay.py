@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import arrow
+import copy
+import logging
+import os
+import pathlib
+import tempfile
+import time
+import toml
+
+from dataclasses import replace
+
+from holoscope.clients import set_client_factory
+from holoscope.core import Holoscope
+from holoscope.datamodel import ReplayConfiguration
+from holoscope.fake_backends import FakeBackend
+from holoscope.fake_backends import FakeClientFactory
+from holoscope.metrics import profile
+from holoscope.snapshot import load_snapshots
+from pipeline import create_config
+from pipeline import generate_fixtures
+
+# 15分ごとに実行した場合の1日分
+TICKS = 96
+TICK_MINUTES = 15
+
+
+def advance(backend: FakeBackend, now):
+    # 予定開始時刻を過ぎた配信を開始し、開始から2時間経った配信を終了する
+    for video in backend.videos.values():
+        details = video['liveStreamingDetails']
+        scheduled_start_time = arrow.get(details['scheduledStartTime'])
+        if scheduled_start_time <= now and 'actualStartTime' not in details:
+            details['actualStartTime'] = now.isoformat()
+        if scheduled_start_time <= now.shift(hours=-2) and 'actualEndTime' not in details:
+            details['actualEndTime'] = now.isoformat()
+
+
+def summarize(backend: FakeBackend) -> list:
+    # 記録と再生でカレンダーに作られた予定を比べる、予定のIDは実行ごとに振られるので使わない
+    return sorted((e['extendedProperties']['private']['video_id'], e['summary'],
+                   e['start']['dateTime'], e['end']['dateTime'])
+                  for e in backend.calendar_events())
+
+
+def run_ticks(configs, backend: FakeBackend, workdir: str, thumbnail_cache: dict, before_tick=None) -> list:
+    factory = FakeClientFactory(backend)
+    previous = set_client_factory(factory)
+    cwd = os.getcwd()
+    samples = []
+    try:
+        os.chdir(workdir)
+        with open('thumbnail_cache.toml', 'wt') as f:
+            toml.dump(copy.deepcopy(thumbnail_cache), f)
+        for tick, config in enumerate(configs):
+            if before_tick:
+                before_tick(tick)
+            start = time.perf_counter()
+            Holoscope(config).run()
+            samples.append(time.perf_counter() - start)
+    finally:
+        os.chdir(cwd)
+        set_client_factory(previous)
+    return samples
+
+
+def record(fixtures: dict, args, snapshot_dir: str) -> tuple:
+    # 偽のバックエンドで1日分を実行し、各実行のsnapshotを記録する
+    config = create_config(fixtures, args)
+    config = replace(config, general=replace(config.general, snapshot_dir=snapshot_dir))
+    backend = FakeBackend(fixtures['holodule_html'], fixtures['videos'], fixtures['channels'])
+    now = arrow.utcnow().floor('minute')
+    with tempfile.TemporaryDirectory() as workdir:
+        samples = run_ticks([config] * args.ticks, backend, workdir, fixtures['thumbnail_cache'],
+                            lambda tick: advance(backend, now.shift(minutes=tick * TICK_MINUTES)))
+    return samples, summarize(backend)
+
+
+def replay(fixtures: dict, args, snapshot_path: str, ticks: int) -> tuple:
+    # カレンダーとLINEだけを偽のバックエンドにして、記録した順に再生する
+    config = create_config(fixtures, args)
+    config = replace(config, general=replace(config.general, importer_plugin='replay'))
+    configs = [replace(config, replay=ReplayConfiguration(path=snapshot_path, index=i))
+               for i in range(ticks)]
+    backend = FakeBackend()
+    with tempfile.TemporaryDirectory() as workdir, profile(args.profile):
+        samples = run_ticks(configs, backend, workdir, fixtures['thumbnail_cache'])
+    return samples, summarize(backend)
+
+
+def print_samples(name: str, samples: list):
+    print(f'{name:<8} ticks={len(samples):>4} total={sum(samples):>8.2f}s ' +
+          f'mean={sum(samples) / len(samples) * 1000:>8.1f}ms max={max(samples) * 1000:>8.1f}ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a day of holoscope runs from snapshots.')
+    parser.add_argument('--snapshot', help='recorded snapshot file or directory (default: record one)')
+    parser.add_argument('--members', type=int, default=30, help='favorite members of generated day')
+    parser.add_argument('--ticks', type=int, default=TICKS)
+    parser.add_argument('--batch', action='store_true', help='enable calendar batch and LINE buffer')
+    parser.add_argument('--incremental-sync', action='store_true')
+    parser.add_argument('--video-state', action='store_true',
+                        help='skip fetching ended videos while recording')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--profile', help='write cProfile stats of replay to this file')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-v', '--verbose', action='store_true')
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.disable(logging.INFO)
+    if args.snapshot:
+        snapshots = load_snapshots(args.snapshot)
+        # 記録したthumbnail cacheに載っているホロメンを全員推しとして再生する
+        thumbnail_cache = next((s['thumbnail_cache'] for s in snapshots if s['thumbnail_cache']), {})
+        fixtures = {'holomenbers': list(thumbnail_cache), 'thumbnail_cache': thumbnail_cache}
+        samples, _ = replay(fixtures, args, args.snapshot, len(snapshots))
+        print_samples('replay', samples)
+        return
+
+    fixtures = generate_fixtures(args.members, 0, args.seed)
+    with tempfile.TemporaryDirectory() as snapshot_dir:
+        recorded_samples, recorded_events = record(fixtures, args, snapshot_dir)
+        size = sum(p.stat().st_size for p in pathlib.Path(snapshot_dir).glob('*.jsonl.gz'))
+        replayed_samples, replayed_events = replay(fixtures, args, snapshot_dir, args.ticks)
+    print(f'members={args.members} programs={len(fixtures["videos"])} snapshot={size / 1024:.1f}KiB')
+    print_samples('record', recorded_samples)
+    print_samples('replay', replayed_samples)
+    if recorded_events != replayed_events:
+        print('replay created different calendar events from recording')
+    else:
+        print(f'replay created the same {len(replayed_events)} calendar events as recording')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import signal
+
+from holoscope.config import ConfigLoader
+from holoscope.daemon import Daemon
+from logging import NOTSET
+from run import set_file_handler
+from run import set_stream_handler
+
+
+if __name__ == '__main__':
+    cl = ConfigLoader()
+    cnf = cl.config
+    stream_handler = set_stream_handler(cnf.general.loglevel)
+    file_handler = set_file_handler(cnf.general.logdir,
+                                    cnf.general.logfile,
+                                    cnf.general.loglevel)
+    logging.basicConfig(level=NOTSET, handlers=[stream_handler, file_handler])
+
+    daemon = Daemon(cnf)
+    # systemdなどからの停止要求で、処理中のtickを終えてから止める
+    signal.signal(signal.SIGTERM, lambda signum, frame: daemon.stop())
+    signal.signal(signal.SIGINT, lambda signum, frame: daemon.stop())
+    daemon.run_forever()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import logging
+import os
+import zlib
+
+from holoscope.clients import get_client_factory
+from holoscope.errors import RestError
+
+
+log = logging.getLogger(__name__)
+
+# カレンダーの差分同期に必要な項目だけを保存する
+EVENT_FIELDS = ['id', 'status', 'summary', 'description', 'start', 'end',
+                'htmlLink', 'organizer', 'extendedProperties']
+
+
+class CalendarSyncManager(object):
+    def __init__(self, config):
+        if config.aws.access_key_id and config.aws.secret_access_key:
+            self.table = get_client_factory().dynamodb_table(config.aws)
+            self.hash_key_name = config.aws.dynamodb_hash_key_name
+            self.enable_dynamodb = True
+        else:
+            self.enable_dynamodb = False
+        self.calendar_id = config.google_calendar.calendar_id
+        # 同じテーブルを複数のテナントで使う場合は、トークンの種類とカレンダーごとに保存先を分ける
+        # カレンダーIDには@や#が含まれるので、ファイル名に使えるようにハッシュにする
+        token_type = config.google_calendar.token_type
+        calendar_hash = hashlib.sha256((self.calendar_id or '').encode()).hexdigest()[:16]
+        if token_type == 'google_calendar':
+            self.hash_key = f'calendar_sync_{calendar_hash}'
+        else:
+            self.hash_key = f'{token_type}_calendar_sync_{calendar_hash}'
+
+    def get_sync_state(self) -> dict:
+        if self.enable_dynamodb:
+            state = self._get_sync_state_from_dynamodb()
+        else:
+            state = self._get_sync_state_from_file()
+        if state and state.get('calendar_id') != self.calendar_id:
+            log.info('Calendar sync state belongs to another calendar, ignore it')
+            return None
+        return state
+
+    def set_sync_state(self, sync_token: str, events: dict) -> dict:
+        state = {
+            'calendar_id': self.calendar_id,
+            'sync_token': sync_token,
+            'events': {k: {f: v[f] for f in EVENT_FIELDS if f in v} for k, v in events.items()},
+        }
+        if self.enable_dynamodb:
+            self._set_sync_state_to_dynamodb(state)
+        else:
+            self._set_sync_state_to_file(state)
+        return state
+
+    def _get_sync_state_from_dynamodb(self) -> dict:
+        response = self.table.get_item(Key={self.hash_key_name: self.hash_key})
+        if 'Item' not in response:
+            log.info('Calendar sync state was not found in dynamodb')
+            return None
+        # The value method is used to cast from boto3 Binary type to byte type.
+        state = json.loads(zlib.decompress(response['Item'][self.hash_key].value))
+        log.info('Get calendar sync state from dynamodb')
+        return state
+
+    def _get_sync_state_from_file(self) -> dict:
+        if not os.path.exists(f'{self.hash_key}.json'):
+            log.info('Calendar sync state was not found')
+            return None
+        with open(f'{self.hash_key}.json', 'rt') as f:
+            state = json.load(f)
+        log.info('Get calendar sync state from file')
+        return state
+
+    def _set_sync_state_to_dynamodb(self, state):
+        # 1itemあたり400KBの制限があるので圧縮して保存する
+        compressed = zlib.compress(json.dumps(state).encode())
+        response = self.table.put_item(Item={self.hash_key_name: self.hash_key,
+                                       self.hash_key: compressed})
+        if response['ResponseMetadata']['HTTPStatusCode'] != 200:
+            raise RestError(response)
+        log.info('Update calendar sync state to dynamodb')
+
+    def _set_sync_state_to_file(self, state):
+        with open(f'{self.hash_key}.json', 'wt') as f:
+            json.dump(state, f)
+        log.info('Update calendar sync state to file')
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+
+from holoscope.metrics import instrument_boto3
+from holoscope.metrics import MeteredHttp
+from holoscope.metrics import record_requests_response
+from holoscope.response_cache import CachedHttp
+from holoscope.snapshot import RecordingHttp
+
+log = logging.getLogger(__name__)
+
+YOUTUBE_API_SERVICE_NAME = 'youtube'
+YOUTUBE_API_VERSION = 'v3'
+CALENDAR_API_SERVICE_NAME = 'calendar'
+CALENDAR_API_VERSION = 'v3'
+
+
+class ClientCache(object):
+    # Lambdaのwarm起動ではプロセスが使い回されるので、生成したクライアントをプロセス内で保持する
+    def __init__(self):
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, factory, is_valid=None):
+        with self._lock:
+            client = self._clients.get(key)
+        if client is not None and (is_valid is None or is_valid(client)):
+            return client
+        if client is not None:
+            log.info(f'Cached client {key[0]} was expired, rebuild it')
+        client = factory()
+        with self._lock:
+            self._clients[key] = client
+        return client
+
+    def clear(self):
+        with self._lock:
+            self._clients.clear()
+
+
+class ClientFactory(object):
+    def __init__(self):
+        self.cache = ClientCache()
+        # スレッドごとのboto3 resourceを置く枠と、その枠を使っているスレッド
+        self._slots = {}
+        self._slots_lock = threading.Lock()
+
+    def build_service(self, service_name, version, **kwargs):
+        from googleapiclient.discovery import build
+        # 同梱のdiscovery documentを使い、実行時のダウンロードを避ける
+        return build(service_name, version, static_discovery=True, cache_discovery=False, **kwargs)
+
+    def build_http(self, credentials=None):
+        from googleapiclient.http import build_http
+        if credentials:
+            from google_auth_httplib2 import AuthorizedHttp
+            return AuthorizedHttp(credentials, http=build_http())
+        return build_http()
+
+    def new_http(self, credentials=None):
+        # リクエストごとの時間とバイト数をmetricsに記録し、response cacheが有効ならETagで再利用する
+        # snapshotの記録中は、googleapiclientに渡す最終的なレスポンスを記録する
+        return RecordingHttp(CachedHttp(MeteredHttp(self.build_http(credentials))))
+
+    def youtube(self, api_key):
+        return self.cache.get(
+            ('youtube', api_key),
+            lambda: self.build_service(YOUTUBE_API_SERVICE_NAME, YOUTUBE_API_VERSION,
+                                       developerKey=api_key, http=self.new_http()))
+
+    def calendar(self, token_manager):
+        # 認証情報が期限切れになったらTokenManagerから取り直してクライアントを作り直す
+        def factory():
+            credentials = token_manager._get_token()
+            service = self.build_service(CALENDAR_API_SERVICE_NAME, CALENDAR_API_VERSION,
+                                         http=self.new_http(credentials))
+            return credentials, service
+
+        return self.cache.get(('calendar',) + token_manager.cache_key,
+                              factory,
+                              is_valid=lambda client: client[0].valid)
+
+    def _get_thread_slot(self) -> int:
+        # asyncio.to_threadのスレッドはwarm起動ごとに作り直されるので、終了したスレッドの枠を引き継いで
+        # 作ったresourceを使い回す、同時に1つの枠を使うスレッドは1つだけになる
+        ident = threading.get_ident()
+        with self._slots_lock:
+            for slot, owner in self._slots.items():
+                if owner == ident:
+                    return slot
+            alive = {thread.ident for thread in threading.enumerate()}
+            slot = next((s for s, owner in self._slots.items() if owner not in alive), len(self._slots))
+            self._slots[slot] = ident
+            return slot
+
+    def boto3_resource(self, service_name, aws_config):
+        # boto3のsessionとresourceはスレッドセーフではないので、スレッドごとにsessionから作る
+        return self.cache.get(
+            ('boto3_resource', service_name, aws_config.access_key_id, aws_config.secret_access_key,
+             self._get_thread_slot()),
+            lambda: self._instrument_resource(self._new_session(aws_config).resource(service_name)))
+
+    def boto3_client(self, service_name, aws_config):
+        # clientはスレッドセーフなので共有する、作る時だけデフォルトのsessionを使わない
+        return self.cache.get(
+            ('boto3_client', service_name, aws_config.access_key_id, aws_config.secret_access_key),
+            lambda: instrument_boto3(self._new_session(aws_config).client(service_name)))
+
+    @staticmethod
+    def _new_session(aws_config):
+        import boto3.session
+        return boto3.session.Session(aws_access_key_id=aws_config.access_key_id,
+                                     aws_secret_access_key=aws_config.secret_access_key)
+
+    @staticmethod
+    def _instrument_resource(resource):
+        instrument_boto3(resource.meta.client)
+        return resource
+
+    def dynamodb_table(self, aws_config):
+        return self.boto3_resource('dynamodb', aws_config).Table(aws_config.dynamodb_table)
+
+    def requests_session(self):
+        import requests
+
+        def factory():
+            session = requests.Session()
+            session.hooks['response'].append(record_requests_response)
+            return session
+
+        return self.cache.get(('requests',), factory)
+
+    def line_bot_api(self, channel_access_token):
+        from linebot import LineBotApi
+        return self.cache.get(('linebot', channel_access_token),
+                              lambda: LineBotApi(channel_access_token))
+
+
+_client_factory = ClientFactory()
+
+
+def get_client_factory() -> ClientFactory:
+    return _client_factory
+
+
+def set_client_factory(client_factory: ClientFactory) -> ClientFactory:
+    # テストやベンチマークで偽のバックエンドに差し替えるための入り口
+    global _client_factory
+    previous = _client_factory
+    _client_factory = client_factory
+    return previous
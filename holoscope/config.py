@@ -5,6 +5,9 @@ import dacite
 import pathlib
 import toml
 
+from dataclasses import replace
+
+from holoscope.clients import get_client_factory
 from holoscope.datamodel import Configuration
 from holoscope.errors import ConfigrationError
 
@@ -23,6 +26,41 @@ class ConfigLoader(object):
         return config
 
 
+_config_cache = {}
+
+
+def load_config(config_path='./config.toml'):
+    # warm起動では設定ファイルが変わっていなければ読み込み済みの設定を使い回す
+    config_path = pathlib.Path(config_path)
+    if not config_path.exists():
+        raise ConfigrationError(str(config_path) + ' was not found')
+    mtime = config_path.stat().st_mtime_ns
+    cached = _config_cache.get(config_path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    config = ConfigLoader(config_path).config
+    if cached:
+        # 設定が変わったらキャッシュ済みのクライアントも作り直す
+        get_client_factory().cache.clear()
+    _config_cache[config_path] = (mtime, config)
+    return config
+
+
+def create_import_config(config, holomenbers):
+    # 全テナントの推しをまとめて、holoduleとYouTubeの取得を1回で済ませるための設定
+    return replace(config, holodule=replace(config.holodule, holomenbers=holomenbers), tenants=None)
+
+
+def create_tenant_config(config, tenant):
+    # 共通の設定にテナントごとのカレンダー、LINE、AWSの設定を上書きする
+    return replace(config,
+                   holodule=replace(config.holodule, holomenbers=tenant.holomenbers),
+                   google_calendar=tenant.google_calendar,
+                   line=tenant.line,
+                   aws=tenant.aws or config.aws,
+                   tenants=None)
+
+
 if __name__ == '__main__':
     cl = ConfigLoader()
     print(cl.config)
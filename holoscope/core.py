@@ -1,16 +1,26 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import asyncio
 import importlib
 import logging
 import socket
 
-from apiclient.discovery import build
-
+from holoscope.clients import get_client_factory
 from holoscope.config import ConfigLoader
+from holoscope.config import create_import_config
+from holoscope.config import create_tenant_config
+from holoscope.metrics import get_metrics
+from holoscope.metrics import profile
+from holoscope.metrics import start_metrics
+from holoscope.response_cache import get_response_cache
+from holoscope.response_cache import set_response_cache
+from holoscope.response_cache_manager import ResponseCacheManager
+from holoscope.snapshot import save_snapshot
+from holoscope.snapshot import start_recorder
+from holoscope.snapshot import stop_recorder
+from holoscope.utils import MAX_VIDEO_IDS
 
-YOUTUBE_API_SERVICE_NAME = 'youtube'
-YOUTUBE_API_VERSION = 'v3'
 IMPOTER_PLUGIN_DIR = "holoscope.importer_plugin"
 EXPOTER_PLUGIN_DIR = "holoscope.exporter_plugin"
 
@@ -23,13 +33,7 @@ class Holoscope(object):
     def __init__(self, config):
         self.cnf = config
 
-    def run(self):
-        youtube = build(
-            YOUTUBE_API_SERVICE_NAME,
-            YOUTUBE_API_VERSION,
-            developerKey=self.cnf.youtube.api_key
-        )
-
+    def _load_plugins(self) -> tuple:
         importer_plugin_path = f'{IMPOTER_PLUGIN_DIR}.{self.cnf.general.importer_plugin}'
         exporter_plugin_path = f'{EXPOTER_PLUGIN_DIR}.{self.cnf.general.exporter_plugin}'
 
@@ -37,12 +41,154 @@ class Holoscope(object):
                                                   package='Importer')
         exporter_module = importlib.import_module(exporter_plugin_path,
                                                   package='Exporter')
+        return importer_module, exporter_module
+
+    def run(self):
+        metrics = start_metrics()
+        self._start_response_cache()
+        if self.cnf.general.snapshot_dir:
+            start_recorder()
+        try:
+            with profile(self.cnf.general.profile_output):
+                if self.cnf.tenants:
+                    return self.run_tenants()
+                if self.cnf.general.enable_async_pipeline:
+                    return self.run_async()
+                return self._run()
+        finally:
+            self._save_snapshot()
+            self._save_response_cache()
+            if self.cnf.general.enable_metrics:
+                metrics.emit()
 
-        importer = importer_module.Importer(self.cnf, youtube)
+    def _start_response_cache(self):
+        if not self.cnf.general.enable_response_cache:
+            set_response_cache(None)
+            return
+        # warm起動ではプロセス内に残っているキャッシュをそのまま使う
+        if get_response_cache() is None:
+            set_response_cache(ResponseCacheManager(self.cnf).load())
+
+    def _save_response_cache(self):
+        response_cache = get_response_cache()
+        if response_cache is not None:
+            ResponseCacheManager(self.cnf).save(response_cache)
+            response_cache.reset_counters()
+
+    def _save_snapshot(self):
+        recorder = stop_recorder()
+        if recorder is None:
+            return
+        # snapshotの保存に失敗しても、配信予定の登録は終わっているので処理は止めない
+        try:
+            save_snapshot(recorder, self.cnf.general.snapshot_dir)
+        except OSError as error:
+            log.warning(f'Failed to save snapshot: {error}.')
+
+    def _run(self):
+        metrics = get_metrics()
+        youtube = metrics.measure('clients', get_client_factory().youtube, self.cnf.youtube.api_key)
+        importer_module, exporter_module = self._load_plugins()
+
+        importer = metrics.measure('import', importer_module.Importer, self.cnf, youtube)
         events = importer.live_events
-        exporter = exporter_module.Exporter(self.cnf)
-        exporter.create_event(events)
-        exporter.delete_duplicate_event(events)
+        exporter = metrics.measure('export.load', exporter_module.Exporter, self.cnf)
+        self._export(exporter, events)
+
+    def _export(self, exporter, events, prefix='export'):
+        metrics = get_metrics()
+        metrics.measure(f'{prefix}.create_event', exporter.create_event, events)
+        metrics.measure(f'{prefix}.delete_duplicate_event', exporter.delete_duplicate_event, events)
+        metrics.measure(f'{prefix}.flush', exporter.flush)
+
+    def run_tenants(self):
+        youtube = get_client_factory().youtube(self.cnf.youtube.api_key)
+        importer_module, exporter_module = self._load_plugins()
+        if not hasattr(importer_module.Importer, 'create_live_events'):
+            log.info('Importer plugin does not support multi-tenant run, run each tenant separately.')
+            for tenant in self.cnf.tenants:
+                Holoscope(create_tenant_config(self.cnf, tenant))._run()
+            return
+
+        # holoduleのスクレイピングとvideos.listは全テナントの推しをまとめて1回だけ行う
+        holomenbers = list(dict.fromkeys(m for tenant in self.cnf.tenants for m in tenant.holomenbers))
+        import_config = create_import_config(self.cnf, holomenbers)
+        importer = importer_module.Importer(import_config, youtube, load=False)
+        metrics = get_metrics()
+        all_programs = metrics.measure('import.holodule', importer._get_programs)
+        thumbnail_cache = metrics.measure('import.thumbnail_cache', importer.get_thumbnail_cache,
+                                          all_programs)
+        programs = metrics.measure('import.filter_programs', importer.filter_programs, all_programs,
+                                   thumbnail_cache, keep_collaborate=True)
+        events = metrics.measure('import.videos', importer.create_live_events, programs, thumbnail_cache)
+        importer.save_state()
+
+        # 1つのテナントが失敗しても他のテナントの処理は続ける
+        errors = []
+        for tenant in self.cnf.tenants:
+            tenant_events = importer.project_live_events(events, tenant.holomenbers)
+            log.info(f'[{tenant.name}] Export {len(tenant_events)} live events.')
+            try:
+                exporter = metrics.measure(f'{tenant.name}.load', exporter_module.Exporter,
+                                           create_tenant_config(self.cnf, tenant))
+                self._export(exporter, tenant_events, prefix=tenant.name)
+            except Exception as error:
+                log.exception(f'[{tenant.name}] An error occurred: {error}.')
+                errors.append(error)
+        if errors:
+            raise errors[0]
+
+    def run_async(self):
+        return asyncio.run(self._run_pipeline())
+
+    async def _run_pipeline(self):
+        metrics = get_metrics()
+        youtube = get_client_factory().youtube(self.cnf.youtube.api_key)
+        importer_module, exporter_module = self._load_plugins()
+        if not hasattr(importer_module.Importer, 'create_live_events'):
+            log.info('Importer plugin does not support async pipeline, run sequentially.')
+            return await asyncio.to_thread(self._run)
+        importer = importer_module.Importer(self.cnf, youtube, load=False)
+
+        def run_in_thread(name, func, *args):
+            return asyncio.to_thread(metrics.measure, name, func, *args)
+
+        # holoduleの取得、DynamoDBのキャッシュ/トークン読み込み、カレンダーの取得は互いに独立しているので並行に行う
+        exporter_task = asyncio.create_task(run_in_thread('export.load', exporter_module.Exporter,
+                                                          self.cnf))
+        programs_task = asyncio.create_task(run_in_thread('import.holodule', importer._get_programs))
+        thumbnail_task = asyncio.create_task(run_in_thread('import.thumbnail_cache',
+                                                           importer.prefetch_thumbnail_cache))
+        all_programs = await programs_task
+        await thumbnail_task
+        thumbnail_cache = await run_in_thread('import.thumbnail_cache', importer.get_thumbnail_cache,
+                                              all_programs)
+        programs = metrics.measure('import.filter_programs', importer.filter_programs, all_programs,
+                                   thumbnail_cache)
+
+        # videos.listはチャンクごとに並行で取得し、届いた順にexporterへ流す
+        chunks = [programs[i:i + MAX_VIDEO_IDS] for i in range(0, len(programs), MAX_VIDEO_IDS)]
+        chunk_tasks = [asyncio.create_task(run_in_thread('import.videos', importer.create_live_events,
+                                                         chunk, thumbnail_cache))
+                       for chunk in chunks]
+        exporter = await exporter_task
+        events = []
+        collaborate_events = []
+        for chunk_task in asyncio.as_completed(chunk_tasks):
+            chunk_events = await chunk_task
+            events += chunk_events
+            # コラボ予定は推しの配信と重複していれば落とされるので、全件揃ってから処理する
+            primary_events = [e for e in chunk_events if not e.collaborate]
+            collaborate_events += [e for e in chunk_events if e.collaborate]
+            await run_in_thread('export.create_event', exporter.create_event, primary_events)
+
+        importer.save_state()
+        events = metrics.measure('import.deduplicate', importer._deduplicate_live_events, events)
+        collaborate_events = set(collaborate_events)
+        collaborate_events = [e for e in events if e in collaborate_events]
+        await run_in_thread('export.create_event', exporter.create_event, collaborate_events)
+        await run_in_thread('export.delete_duplicate_event', exporter.delete_duplicate_event, events)
+        await run_in_thread('export.flush', exporter.flush)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import arrow
+import heapq
+import logging
+import threading
+import time
+
+from typing import Optional
+
+from holoscope.clients import get_client_factory
+from holoscope.core import Holoscope
+from holoscope.datamodel import DaemonConfiguration
+from holoscope.errors import ConfigrationError
+from holoscope.metrics import get_metrics
+from holoscope.metrics import start_metrics
+
+log = logging.getLogger(__name__)
+
+HOLODULE = 'holodule'
+VIDEO = 'video'
+# この秒数以内に確認予定の配信は、videos.listの1回の呼び出しにまとめて前倒しで確認する
+BATCH_WINDOW = 30
+
+
+def get_poll_interval(live_event, now, config: DaemonConfiguration) -> Optional[float]:
+    # 終了した配信は内容が変わらないので確認しない
+    if live_event.actual_end_time:
+        return None
+    if live_event.actual_start_time:
+        return config.live_interval
+    # 開始予定を過ぎても始まっていない配信は、開始直前と同じ間隔で確認する
+    until_start = (live_event.scheduled_start_time - now).total_seconds()
+    if until_start <= config.imminent_window:
+        return config.imminent_interval
+    if until_start <= config.soon_window:
+        interval = config.soon_interval
+    elif until_start <= config.upcoming_window:
+        interval = config.upcoming_interval
+    else:
+        interval = config.distant_interval
+    # 間隔が長くても、開始直前の確認に切り替わる時刻は過ぎないようにする
+    return max(min(interval, until_start - config.imminent_window), config.imminent_interval)
+
+
+class Daemon(Holoscope):
+    # holoduleの再取得と配信ごとの確認を優先度付きキューに積み、期限が来たものから処理する
+    def __init__(self, config):
+        super().__init__(config)
+        self.daemon_cnf = config.daemon or DaemonConfiguration()
+        self.importer_module, self.exporter_module = self._load_plugins()
+        if not hasattr(self.importer_module.Importer, 'create_live_events'):
+            raise ConfigrationError(f'{self.cnf.general.importer_plugin} importer does not support daemon')
+        self.queue = []
+        self.scheduled = {}
+        self.programs = {}
+        self.live_events = {}
+        self.thumbnail_cache = None
+        self.importer = None
+        self.exporter = None
+        # Exporterを作り直しても同じ通知を送らないように、送信済みの通知はdaemonで持つ
+        self.notified = set()
+        self._stop_event = threading.Event()
+        self._start_response_cache()
+        self.schedule(HOLODULE, '', time.time())
+
+    def schedule(self, kind: str, video_id: str, due: float):
+        # 予定し直した場合、古いエントリはキューに残るが取り出した時に読み飛ばす
+        self.scheduled[(kind, video_id)] = due
+        heapq.heappush(self.queue, (due, kind, video_id))
+
+    def run_forever(self):
+        log.info('Start holoscope daemon.')
+        while not self._stop_event.is_set():
+            self._stop_event.wait(self.tick())
+        self._save_response_cache()
+        log.info('Stop holoscope daemon.')
+
+    def stop(self):
+        self._stop_event.set()
+
+    def tick(self) -> float:
+        # 期限が来たタスクを処理して、次のタスクまでの秒数を返す
+        now = time.time()
+        if self.queue and self.queue[0][0] <= now:
+            rescan, video_ids = self._pop_due_tasks(now)
+            metrics = start_metrics()
+            try:
+                if rescan:
+                    video_ids += self._rescan()
+                if video_ids:
+                    self._poll(video_ids)
+            finally:
+                # 配信中の動画は確認のたびにETagが変わるので、毎回ではなくholoduleの再取得と停止時に保存する
+                if rescan:
+                    self._save_response_cache()
+                if self.cnf.general.enable_metrics:
+                    metrics.emit()
+        if not self.queue:
+            return self.daemon_cnf.holodule_interval
+        return max(self.queue[0][0] - time.time(), 0)
+
+    def _pop_due_tasks(self, now: float) -> tuple:
+        rescan = False
+        video_ids = []
+        deferred = []
+        while self.queue and self.queue[0][0] <= now + BATCH_WINDOW:
+            entry = heapq.heappop(self.queue)
+            due, kind, video_id = entry
+            if self.scheduled.get((kind, video_id)) != due:
+                continue
+            if kind == HOLODULE and due > now:
+                # holoduleの再取得は前倒ししない
+                deferred.append(entry)
+                continue
+            del self.scheduled[(kind, video_id)]
+            if kind == HOLODULE:
+                rescan = True
+            else:
+                video_ids.append(video_id)
+        for entry in deferred:
+            heapq.heappush(self.queue, entry)
+        return rescan, video_ids
+
+    def _rescan(self) -> list:
+        # Importer/Exporterも作り直して、保存済みの状態やカレンダー側の変更を取り込む
+        metrics = get_metrics()
+        try:
+            youtube = get_client_factory().youtube(self.cnf.youtube.api_key)
+            importer = self.importer_module.Importer(self.cnf, youtube, load=False)
+            all_programs = metrics.measure('import.holodule', importer._get_programs)
+            thumbnail_cache = metrics.measure('import.thumbnail_cache', importer.get_thumbnail_cache,
+                                              all_programs)
+            programs = metrics.measure('import.filter_programs', importer.filter_programs, all_programs,
+                                       thumbnail_cache)
+            exporter = metrics.measure('export.load', self.exporter_module.Exporter, self.cnf)
+        except Exception as error:
+            log.exception(f'Failed to rescan holodule: {error}.')
+            self.schedule(HOLODULE, '', time.time() + self.daemon_cnf.imminent_interval)
+            return []
+        self.importer, self.exporter, self.thumbnail_cache = importer, exporter, thumbnail_cache
+        self.programs = {program['video_id']: program for program in programs}
+        self.schedule(HOLODULE, '', time.time() + self.daemon_cnf.holodule_interval)
+
+        # holoduleから消えた配信は確認をやめ、送信済みの通知も忘れる、削除済みの予定はExporterごとに持つ
+        for video_id in [v for v in self.live_events if v not in self.programs]:
+            del self.live_events[video_id]
+        self.notified = {n for n in self.notified if n[0] in self.programs}
+        exporter.notified = self.notified
+        for key in [k for k in self.scheduled if k[0] == VIDEO and k[1] not in self.programs]:
+            del self.scheduled[key]
+        # 確認予定のない配信はすぐに確認する、終了済みの配信は確認しない
+        video_ids = [v for v in self.programs
+                     if (VIDEO, v) not in self.scheduled and
+                     not (v in self.live_events and self.live_events[v].actual_end_time)]
+        log.info(f'Holodule has {len(self.programs)} favorite programs, {len(video_ids)} programs are new.')
+        return video_ids
+
+    def _poll(self, video_ids: list):
+        metrics = get_metrics()
+        if self.importer is None:
+            return
+        programs = [self.programs[v] for v in video_ids if v in self.programs]
+        try:
+            events = metrics.measure('import.videos', self.importer.create_live_events, programs,
+                                     self.thumbnail_cache)
+            self.importer.save_state()
+            polled_events = {event.id: event for event in events}
+            self.live_events.update(polled_events)
+            # コラボ予定の重複は、今回確認していない配信も含めて判定する
+            events = [e for e in self.importer._deduplicate_live_events(list(self.live_events.values()))
+                      if e.id in polled_events]
+            self._export(self.exporter, events)
+        except Exception as error:
+            log.exception(f'Failed to poll {len(video_ids)} videos: {error}.')
+            for video_id in video_ids:
+                self.schedule(VIDEO, video_id, time.time() + self.daemon_cnf.imminent_interval)
+            return
+
+        now = arrow.utcnow()
+        for video_id in video_ids:
+            event = polled_events.get(video_id)
+            # YouTubeで見つからない配信と終了した配信は、次のholoduleの再取得まで確認しない
+            if event is None:
+                self.live_events.pop(video_id, None)
+                continue
+            interval = get_poll_interval(event, now, self.daemon_cnf)
+            if interval is not None:
+                self.schedule(VIDEO, video_id, time.time() + interval)
+        scheduled = len([k for k in self.scheduled if k[0] == VIDEO])
+        log.info(f'Polled {len(video_ids)} videos, {scheduled} videos are scheduled.')
@@ -5,64 +5,72 @@ import arrow
 
 from arrow.arrow import Arrow
 from dataclasses import dataclass
+from typing import Any
+from typing import Callable
 from typing import List
 from typing import Optional
 
 
+def _get_time(value) -> Optional[Arrow]:
+    return arrow.get(value) if value else None
+
+
 class LiveEvent():
-    def __init__(self, data, actor, collaborate) -> None:
-        self._data = data
-        self._actor = actor
-        self._collaborate = collaborate
-
-    @property
-    def id(self) -> str:
-        return self._data['id']
-
-    @property
-    def title(self) -> str:
-        return self._data['snippet']['title']
-
-    @property
-    def actual_start_time(self) -> Optional[Arrow]:
-        try:
-            actual_start_time = arrow.get(self._data['liveStreamingDetails']['actualStartTime'])
-        except KeyError:
-            actual_start_time = None
-        return actual_start_time
-
-    @property
-    def scheduled_start_time(self) -> Optional[Arrow]:
-        return arrow.get(self._data['liveStreamingDetails']['scheduledStartTime'])
-
-    @property
-    def actual_end_time(self) -> Optional[Arrow]:
-        try:
-            actual_end_time = arrow.get(self._data['liveStreamingDetails']['actualEndTime'])
-        except KeyError:
-            actual_end_time = None
-        return actual_end_time
-
-    @property
-    def channel_id(self) -> str:
-        return self._data['snippet']['channelId']
-
-    @property
-    def channel_title(self) -> str:
-        return self._data['snippet']['channelTitle']
-
-    @property
-    def actor(self) -> str:
-        return self._actor
-
-    @property
-    def collaborate(self) -> list:
-        return self._collaborate
+    # 大量に生成されるので、使う項目だけを持ち時刻は生成時に一度だけパースする
+    __slots__ = ('id', 'title', 'channel_id', 'channel_title', 'scheduled_start_time',
+                 'actual_start_time', 'actual_end_time', 'actor', 'collaborate', 'raw')
+
+    def __init__(self, data, actor, collaborate, keep_raw=False) -> None:
+        snippet = data['snippet']
+        details = data['liveStreamingDetails']
+        self.id: str = data['id']
+        self.title: str = snippet['title']
+        self.channel_id: str = snippet.get('channelId')
+        self.channel_title: str = snippet.get('channelTitle')
+        self.scheduled_start_time: Arrow = arrow.get(details['scheduledStartTime'])
+        self.actual_start_time: Optional[Arrow] = _get_time(details.get('actualStartTime'))
+        self.actual_end_time: Optional[Arrow] = _get_time(details.get('actualEndTime'))
+        self.actor: str = actor
+        self.collaborate: list = collaborate
+        self.raw: Optional[dict] = data if keep_raw else None
+
+    def __repr__(self):
+        return self.id
+
+    def copy(self, **changes) -> 'LiveEvent':
+        event = LiveEvent.__new__(LiveEvent)
+        for name in self.__slots__:
+            setattr(event, name, changes.get(name, getattr(self, name)))
+        return event
 
 
 class GCalEvent():
-    def __init__(self, data) -> None:
-        self._data = data
+    # holoscope以外で作られた予定は拡張プロパティが無いので、該当する項目はNoneになる
+    __slots__ = ('id', 'title', 'start_dateTime', 'end_dateTime', 'link', 'calid', 'description',
+                 'scheduled_start_time', 'actual_start_time', 'actual_end_time', 'video_id',
+                 'original_title', 'channel_id', 'actor', 'collaborate', 'fingerprint',
+                 'extendedProperties', 'raw')
+
+    def __init__(self, data, keep_raw=False) -> None:
+        private = data.get('extendedProperties', {}).get('private', {})
+        self.id: str = data['id']
+        self.title: str = data.get('summary')
+        self.start_dateTime: Optional[Arrow] = _get_time(data.get('start', {}).get('dateTime'))
+        self.end_dateTime: Optional[Arrow] = _get_time(data.get('end', {}).get('dateTime'))
+        self.link: str = data.get('htmlLink')
+        self.calid: str = data.get('organizer', {}).get('email')
+        self.description: str = data.get('description')
+        self.scheduled_start_time: Optional[Arrow] = _get_time(private.get('scheduled_start_time'))
+        self.actual_start_time: Optional[Arrow] = _get_time(private.get('actual_start_time'))
+        self.actual_end_time: Optional[Arrow] = _get_time(private.get('actual_end_time'))
+        self.video_id: str = private.get('video_id')
+        self.original_title: str = private.get('title')
+        self.channel_id: str = private.get('channel_id')
+        self.actor: str = private.get('actor')
+        self.collaborate: str = private.get('collaborate')
+        self.fingerprint: str = private.get('fingerprint')
+        self.extendedProperties: dict = private
+        self.raw: Optional[dict] = data if keep_raw else None
 
     def __repr__(self):
         return self.id
@@ -70,87 +78,16 @@ class GCalEvent():
     def __str__(self):
         return self.id
 
-    @property
-    def id(self) -> str:
-        return self._data['id']
-
-    @property
-    def title(self) -> str:
-        return self._data['summary']
-
-    @property
-    def start_dateTime(self) -> str:
-        start_dateTime = self._data['start']['dateTime']
-        return arrow.get(start_dateTime)
-
-    @property
-    def actual_start_time(self) -> str:
-        try:
-            actual_start_time = arrow.get(self._data['extendedProperties']['private']['actual_start_time'])
-        except KeyError:
-            actual_start_time = None
-        return actual_start_time
-
-    @property
-    def actual_end_time(self) -> str:
-        try:
-            actual_end_time = arrow.get(self._data['extendedProperties']['private']['actual_end_time'])
-        except KeyError:
-            actual_end_time = None
-        return actual_end_time
-
-        actual_end_time = self._data['extendedProperties']['private']['actual_end_time']
-        return arrow.get(actual_end_time)
-
-    @property
-    def scheduled_start_time(self) -> str:
-        scheduled_start_time = self._data['extendedProperties']['private']['scheduled_start_time']
-        return arrow.get(scheduled_start_time)
-
-    @property
-    def end_dateTime(self) -> str:
-        end_dateTime = self._data['end']['dateTime']
-        return arrow.get(end_dateTime)
-
-    @property
-    def link(self) -> str:
-        return self._data['htmlLink']
-
-    @property
-    def calid(self) -> str:
-        return self._data['organizer']['email']
-
-    @property
-    def description(self) -> str:
-        return self._data['description']
-
-    @property
-    def video_id(self) -> str:
-        return self._data['extendedProperties']['private']['video_id']
-
-    @property
-    def original_title(self) -> str:
-        return self._data['extendedProperties']['private']['title']
-
-    @property
-    def channel_id(self) -> str:
-        return self._data['extendedProperties']['private']['channel_id']
-
-    @property
-    def actor(self) -> str:
-        return self._data['extendedProperties']['private']['actor']
-
-    @property
-    def collaborate(self) -> str:
-        try:
-            collaborate = self._data['extendedProperties']['private']['collaborate']
-        except KeyError:
-            collaborate = None
-        return collaborate
-
-    @property
-    def extendedProperties(self) -> dict:
-        return self._data["extendedProperties"]["private"]
+
+@dataclass
+class CalendarMutation:
+    action: str
+    live_event: LiveEvent
+    request: Any
+    event_id: Optional[str] = None
+    callback: Optional[Callable] = None
+    response: Optional[dict] = None
+    error: Optional[Exception] = None
 
 
 @dataclass
@@ -170,29 +107,77 @@ class GeneralConfiguration:
     logfile: Optional[str] = None
     importer_plugin: Optional[str] = 'holodule'
     exporter_plugin: Optional[str] = 'google_calendar'
+    enable_async_pipeline: Optional[bool] = False
+    enable_metrics: Optional[bool] = False
+    enable_response_cache: Optional[bool] = False
+    profile_output: Optional[str] = None
+    snapshot_dir: Optional[str] = None
 
 
 @dataclass
 class GoogleCalendarConfiguration:
     calendar_id: str
     enable_actual_end_time: Optional[bool] = False
+    enable_batch: Optional[bool] = False
+    enable_incremental_sync: Optional[bool] = False
+    max_workers: Optional[int] = 1
+    max_requests_per_second: Optional[float] = 5.0
+    token_type: Optional[str] = 'google_calendar'
 
 
 @dataclass
 class HoloduleConfiguration:
     holomenbers: List[str]
     holodule_url: Optional[str] = 'https://schedule.hololive.tv/simple'
+    enable_cache: Optional[bool] = False
+    parser: Optional[str] = 'stream'
 
 
 @dataclass
 class YoutubeConfiguration:
     api_key: str
     channel_ids: Optional[List[str]] = None
+    thumbnail_refresh_hours: Optional[int] = 24
+    enable_quota_meter: Optional[bool] = False
+    daily_quota_budget: Optional[int] = 10000
+    enable_video_state: Optional[bool] = False
+    video_state_retention_days: Optional[int] = 7
 
 
 @dataclass
 class LineConfiguration:
     line_channel_access_token: str
+    enable_message_buffer: Optional[bool] = False
+
+
+@dataclass
+class DaemonConfiguration:
+    # 単位は秒、配信開始までの時間が短いほど短い間隔で確認する
+    holodule_interval: Optional[int] = 900
+    live_interval: Optional[int] = 60
+    imminent_interval: Optional[int] = 60
+    imminent_window: Optional[int] = 1800
+    soon_interval: Optional[int] = 300
+    soon_window: Optional[int] = 6 * 3600
+    upcoming_interval: Optional[int] = 1800
+    upcoming_window: Optional[int] = 48 * 3600
+    distant_interval: Optional[int] = 6 * 3600
+
+
+@dataclass
+class ReplayConfiguration:
+    # snapshotのファイルか、ファイルを置いたディレクトリ、indexは記録時刻の順で何番目を使うか
+    path: str
+    index: Optional[int] = -1
+
+
+@dataclass
+class TenantConfiguration:
+    name: str
+    holomenbers: List[str]
+    google_calendar: GoogleCalendarConfiguration
+    line: LineConfiguration
+    aws: Optional[AwsConfiguration] = None
 
 
 @dataclass
@@ -203,3 +188,6 @@ class Configuration:
     google_calendar: Optional[GoogleCalendarConfiguration] = None
     youtube: Optional[YoutubeConfiguration] = None
     line: Optional[LineConfiguration] = None
+    tenants: Optional[List[TenantConfiguration]] = None
+    daemon: Optional[DaemonConfiguration] = None
+    replay: Optional[ReplayConfiguration] = None
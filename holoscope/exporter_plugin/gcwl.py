@@ -2,13 +2,17 @@
 # -*- coding: utf-8 -*-
 
 import arrow
+import functools
 import logging
 import re
 import socket
+import threading
 
 from .. import utils
+from ..datamodel import GCalEvent
 from ..utils import GoogleCalendarUtils
 from ..utils import LineMessageSender
+from concurrent.futures import ThreadPoolExecutor
 
 log = logging.getLogger(__name__)
 timeout_in_sec = 5
@@ -30,10 +34,65 @@ class Exporter(object):
         self.google_calendar = GoogleCalendarUtils(config)
         self.events = self.google_calendar.get_events()
         self.line_message_sender = LineMessageSender(config)
+        self.max_workers = config.google_calendar.max_workers
+        # 送信済みの通知と削除済みの予定、daemonでは同じExporterを繰り返し使うので同じ処理を繰り返さない
+        self.notified = set()
+        self.deleted_event_ids = set()
+        self._local = threading.local()
+        self._build_event_index()
+
+    def _build_event_index(self):
+        # video_idと(コラボ相手, 予定開始時刻)で予定を引けるようにしておく
+        self.events_by_video_id = {}
+        self.collabo_events = {}
+        for event in self.events:
+            video_id = event.video_id
+            scheduled_start_time = event.scheduled_start_time
+            if not video_id or not scheduled_start_time:
+                log.debug(f'[{event.id}] was not created by holoscope, skip indexing.')
+                continue
+            self.events_by_video_id.setdefault(video_id, event)
+            for collaborater in self._get_collabo_title(event.title):
+                self.collabo_events.setdefault((collaborater, scheduled_start_time), []).append(event)
 
     def create_event(self, live_events: list) -> None:
-        for live_event in live_events:
-            self.process_live_event(live_event)
+        if self.max_workers <= 1 or len(live_events) <= 1:
+            for live_event in live_events:
+                self.process_live_event(live_event)
+            return
+
+        # 配信ごとの突き合わせは独立しているので並列に処理する
+        log_filter = utils.DeferredLogFilter()
+        loggers = [log, utils.log]
+        for logger in loggers:
+            logger.addFilter(log_filter)
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                tasks = list(executor.map(functools.partial(self._process_live_event_task, log_filter),
+                                          live_events))
+        finally:
+            for logger in loggers:
+                logger.removeFilter(log_filter)
+        # ログと通知は実行順に関わらず、入力の順番で出力する
+        for records, notifications, error in tasks:
+            log_filter.replay(records)
+            for notification in notifications:
+                self._send_notification(*notification)
+            if error:
+                raise error
+
+    def _process_live_event_task(self, log_filter, live_event) -> tuple:
+        records = []
+        notifications = []
+        self._local.notifications = notifications
+        try:
+            with log_filter.capture(records):
+                self.process_live_event(live_event)
+        except Exception as error:
+            return records, notifications, error
+        finally:
+            self._local.notifications = None
+        return records, notifications, None
 
     def process_live_event(self, live_event):
         event = self.find_event(live_event)
@@ -46,48 +105,57 @@ class Exporter(object):
             self.create_event_if_possible(live_event, title)
 
     def find_event(self, live_event):
-        return next((event for event in self.events if live_event.id == event.video_id), None)
+        return self.events_by_video_id.get(live_event.id)
 
     def update_event_if_needed(self, event, live_event, title):
         message_template = self.line_message_sender.create_message_data(live_event)
         should_notify = False
+        # Arrowの比較はタイムゾーンに依存しないので、TZへの変換はせずにそのまま比較する
+        now = arrow.utcnow()
+        body = self.google_calendar.create_event_data(live_event)
+        fingerprint = body['extendedProperties']['private']['fingerprint']
+        # 変更点はまとめて1回の更新で書き込む、前回書き込んだ内容と同じなら何もしない
+        updates = []
+
+        if fingerprint != event.fingerprint:
+            if title != event.title:
+                updates.append('title')
+                # self.notify_event_update_title(live_event, message_template)
+                should_notify = True
 
-        if title != event.title:
-            self.google_calendar.update_event(event.id, live_event)
-            log.info(f'[{live_event.id}] [UPDATE]: [{event.id}] ' +
-                     f'Update title {live_event.title}.')
-            # self.notify_event_update_title(live_event, message_template)
-            should_notify = True
-
-        if (live_event.actual_start_time and
-                live_event.actual_start_time.to(TZ) != event.start_dateTime):
-            self.google_calendar.update_event(event.id, live_event)
-            log.info(f'[{live_event.id}] [UPDATE]: [{event.id}] ' +
-                     f'Update to actual start_dateTime {live_event.title}.')
-            if not event.actual_start_time:
-                self.notify_event_start(live_event, message_template)
+            if (live_event.actual_start_time and
+                    live_event.actual_start_time != event.start_dateTime):
+                updates.append('actual start_dateTime')
+                if not event.actual_start_time:
+                    self.notify_event_start(live_event, message_template)
+                    should_notify = True
+
+            if (not live_event.actual_start_time and
+                    live_event.scheduled_start_time != event.start_dateTime):
+                updates.append('scheduled start_dateTime')
+                self.notify_event_update_start_time(live_event, message_template)
                 should_notify = True
 
-        if (not live_event.actual_start_time and
-                live_event.scheduled_start_time.to(TZ) != event.start_dateTime):
-            self.google_calendar.update_event(event.id, live_event)
-            log.info(f'[{live_event.id}] [UPDATE]: [{event.id}] ' +
-                     f'Update to scheduled start_dateTime {live_event.title}.')
-            self.notify_event_update_start_time(live_event, message_template)
-            should_notify = True
+            if (live_event.actual_end_time and
+                    live_event.actual_end_time != event.end_dateTime):
+                updates.append('actual end_dateTime')
+                if not event.actual_end_time:
+                    # self.notify_event_end(live_event, message_template)
+                    should_notify = True
 
-        if live_event.scheduled_start_time.to(TZ) > arrow.utcnow().to(TZ):
-            if (live_event.scheduled_start_time.to(TZ) - arrow.utcnow().to(TZ)).seconds <= 900:
-                self.notify_event_soon_start(live_event, message_template)
-                should_notify = True
+            # fingerprintが無い既存の予定は、上記の項目に変更があった場合だけ更新する
+            if event.fingerprint and not updates:
+                updates.append('content')
 
-        if (live_event.actual_end_time and
-                live_event.actual_end_time.to(TZ) != event.end_dateTime):
-            self.google_calendar.update_event(event.id, live_event)
+        if updates:
+            callback = functools.partial(self._on_event_updated, live_event)
+            self.google_calendar.update_event(event.id, live_event, callback=callback, body=body)
             log.info(f'[{live_event.id}] [UPDATE]: [{event.id}] ' +
-                     f'Update to actual end_dateTime {live_event.title}.')
-            if not event.actual_end_time:
-                # self.notify_event_end(live_event, message_template)
+                     f'Update {", ".join(updates)} {live_event.title}.')
+
+        if live_event.scheduled_start_time > now:
+            if (live_event.scheduled_start_time - now).seconds <= 900:
+                self.notify_event_soon_start(live_event, message_template)
                 should_notify = True
 
         if not should_notify:
@@ -100,44 +168,75 @@ class Exporter(object):
                      f'because it is {FUTURE} days away.')
             return
 
-        created_event = self.google_calendar.create_event(live_event)
+        callback = functools.partial(self._on_event_created, live_event, title)
+        self.google_calendar.create_event(live_event, callback=callback)
+
+    def _on_event_created(self, live_event, title, created_event):
+        if not created_event:
+            return
+        # 次に同じ配信を処理した時に作成済みの予定として見つけられるようにする
+        self.events_by_video_id.setdefault(live_event.id, GCalEvent(created_event))
         log.info(f'[{live_event.id}] [CREATE]: [{created_event.get("id")}] ' +
                  f'Create {title} has been scheduled.')
         self.notify_event_creation(live_event, self.line_message_sender.create_message_data(live_event))
 
+    def _on_event_updated(self, live_event, updated_event):
+        if updated_event:
+            self.events_by_video_id[live_event.id] = GCalEvent(updated_event)
+
+    def _notify(self, live_event, header, message_template):
+        notifications = getattr(self._local, 'notifications', None)
+        if notifications is not None:
+            notifications.append((live_event.id, header, message_template))
+        else:
+            self._send_notification(live_event.id, header, message_template)
+
+    def _send_notification(self, video_id, header, message_template):
+        # 開始時刻などが変わればmessage_templateも変わるので、同じ内容の通知だけを省く
+        if (video_id, header, message_template) in self.notified:
+            return
+        self.notified.add((video_id, header, message_template))
+        self.line_message_sender.notify(video_id, header, message_template)
+
     def notify_event_creation(self, live_event, message_template):
-        self.line_message_sender.broadcast_message("【通知】新しい配信が追加されました\n" + message_template)
+        self._notify(live_event, "【通知】新しい配信が追加されました\n", message_template)
 
     def notify_event_start(self, live_event, message_template):
-        self.line_message_sender.broadcast_message("【通知】配信が開始されました\n" + message_template)
+        self._notify(live_event, "【通知】配信が開始されました\n", message_template)
 
     def notify_event_end(self, live_event, message_template):
-        self.line_message_sender.broadcast_message("【通知】配信が終了されました\n" + message_template)
+        self._notify(live_event, "【通知】配信が終了されました\n", message_template)
 
     def notify_event_soon_start(self, live_event, message_template):
-        self.line_message_sender.broadcast_message("【通知】配信がもうすぐ開始されます！\n" + message_template)
+        self._notify(live_event, "【通知】配信がもうすぐ開始されます！\n", message_template)
 
     def notify_event_update_title(self, live_event, message_template):
-        self.line_message_sender.broadcast_message("【通知】タイトルが変更されました\n" + message_template)
+        self._notify(live_event, "【通知】タイトルが変更されました\n", message_template)
 
     def notify_event_update_start_time(self, live_event, message_template):
-        self.line_message_sender.broadcast_message("【通知】配信開始時刻が変更されました\n" + message_template)
+        self._notify(live_event, "【通知】配信開始時刻が変更されました\n", message_template)
 
     def delete_duplicate_event(self, live_events: list):
-        for member in self.holomenbers:
-            for live_event in live_events:
-                if live_event.collaborate or live_event.actor != member:
+        holomenbers = set(self.holomenbers)
+        deleted = self.deleted_event_ids
+        for live_event in live_events:
+            if live_event.collaborate or live_event.actor not in holomenbers:
+                continue
+            key = (live_event.actor, live_event.scheduled_start_time)
+            for event in self.collabo_events.get(key, []):
+                if event.id in deleted:
                     continue
-                for event in self.events:
-                    collaborater = self._get_collabo_title(event.title)
-                    if not collaborater or member not in collaborater:
-                        continue
-                    if event.scheduled_start_time == live_event.scheduled_start_time:
-                        self.google_calendar.delete_event(event.id, live_event)
-                        log.info(f'[{live_event.id}] [DELETE] [{event.id}] ' +
-                                 f'was deleted because of duplicate {event.title}.')
-
-    def _get_collabo_title(self, title: str) -> str:
+                deleted.add(event.id)
+                self.google_calendar.delete_event(event.id, live_event)
+                log.info(f'[{live_event.id}] [DELETE] [{event.id}] ' +
+                         f'was deleted because of duplicate {event.title}.')
+
+    def flush(self) -> list:
+        mutations = self.google_calendar.flush()
+        self.line_message_sender.flush()
+        return mutations
+
+    def _get_collabo_title(self, title: str) -> list:
         match = COLLAB_PATTERN.search(title)
         if match:
             collabo_title = match.group(1)
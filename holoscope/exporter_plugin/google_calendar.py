@@ -36,7 +36,7 @@ FUTURE = 120
 
 class Exporter(object):
     def __init__(self, config) -> None:
-        token_manager = TokenManager(config, token_type='google_calendar')
+        token_manager = TokenManager(config, token_type=config.google_calendar.token_type)
         self.calendar = build(
             CALENDAR_API_SERVICE_NAME,
             CALENDAR_API_VERSION,
@@ -225,6 +225,9 @@ class Exporter(object):
                                       eventId=event_id,
                                       body=body).execute()
 
+    def flush(self) -> list:
+        return []
+
     def delete_deplicate_event(self, live_events: list):
         pattern = re.compile(r'^\[\D*\sコラボ\]')
         for i in self.holomenbers:
@@ -0,0 +1,454 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import arrow
+import copy
+import email.parser
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import urllib.parse
+
+from collections import Counter
+from collections import deque
+from holoscope.clients import CALENDAR_API_SERVICE_NAME
+from holoscope.clients import CALENDAR_API_VERSION
+from holoscope.clients import ClientFactory
+from holoscope.errors import ConfigrationError
+from holoscope.metrics import get_operation
+
+# ベンチマークや負荷試験で、実際のAPIを呼ばずにimporter/exporterを動かすための偽のバックエンド
+
+ERROR_MESSAGES = {
+    429: 'Rate Limit Exceeded',
+    500: 'Backend Error',
+    502: 'Bad Gateway',
+    503: 'Service Unavailable',
+    504: 'Gateway Timeout',
+}
+
+
+class FakeBackend(object):
+    # holodule、YouTube Data API、Calendar API、LINE、DynamoDB、KMSの状態を保持し、呼び出し回数を数える
+    # latencyとerror_ratesは'calendar.events.insert'のような呼び出し名、'calendar'のようなサービス名、
+    # 'default'のいずれかをキーにして、遅延(秒)とエラーにする割合を指定する
+    def __init__(self, holodule_html='', videos=None, channels=None, events=None, calendar_id='primary',
+                 latency=None, error_rates=None, seed=0):
+        self.holodule_html = holodule_html
+        self.videos = {item['id']: item for item in videos or []}
+        self.channels = {item['id']: item for item in channels or []}
+        # 予定はカレンダーIDごとに持つ、calendar_idはeventsを入れるカレンダー
+        self.calendar_id = calendar_id
+        self.events = {}
+        self.tables = {}
+        self.objects = {}
+        self.calls = Counter()
+        self.errors = Counter()
+        self.line_messages = []
+        self.latency = latency or {}
+        self.error_rates = error_rates or {}
+        self._failures = {}
+        self._random = random.Random(seed)
+        self._version = 0
+        self._next_id = 0
+        self._lock = threading.RLock()
+        for event in events or []:
+            self._put_event(calendar_id, copy.deepcopy(event))
+
+    def record(self, name: str):
+        with self._lock:
+            self.calls[name] += 1
+
+    def fail(self, name: str, status: int = 503, times: int = 1):
+        # 次のtimes回のnameの呼び出しをstatusで失敗させる
+        with self._lock:
+            self._failures.setdefault(name, deque()).extend([status] * times)
+
+    def simulate(self, name: str, wait: bool = True) -> int:
+        # 呼び出しを記録して遅延を入れ、エラーにする場合はそのステータスを返す
+        latency = self._lookup(self.latency, name) if wait else None
+        if latency:
+            time.sleep(latency)
+        with self._lock:
+            self.calls[name] += 1
+            failures = self._failures.get(name)
+            if failures:
+                status = failures.popleft()
+            elif self._random.random() < (self._lookup(self.error_rates, name) or 0):
+                status = self._random.choice([429, 500, 503])
+            else:
+                return None
+            self.errors[name] += 1
+        return status
+
+    @staticmethod
+    def _lookup(values: dict, name: str):
+        for key in (name, name.split('.')[0], 'default'):
+            if key in values:
+                return values[key]
+        return None
+
+    def calendar_events(self, include_cancelled: bool = False, calendar_id: str = None) -> list:
+        # 負荷試験の後にカレンダーの状態を確かめるために使う
+        with self._lock:
+            events = self.events.get(calendar_id or self.calendar_id, {})
+            return [self._get_event(e) for e in events.values()
+                    if include_cancelled or e.get('status') != 'cancelled']
+
+    def handle(self, method: str, uri: str, body=None, headers=None, wait: bool = True) -> tuple:
+        service, operation = get_operation(uri, method)
+        status = self.simulate(f'{service}.{operation}', wait)
+        if status:
+            return status, {'error': {'code': status, 'message': ERROR_MESSAGES.get(status, 'Error'),
+                                      'errors': [{'reason': 'backendError', 'message': 'Injected error'}]}}
+        url = urllib.parse.urlparse(uri)
+        params = dict(urllib.parse.parse_qsl(url.query))
+        path = url.path.rstrip('/')
+        if path.endswith('/batch/calendar/v3'):
+            return self._handle_batch(body, headers or {})
+        if path.endswith('/youtube/v3/videos'):
+            return 200, self._list_items(self.videos, params)
+        if path.endswith('/youtube/v3/channels'):
+            return 200, self._list_items(self.channels, params)
+        if path.endswith('/youtube/v3/search'):
+            return 200, self._search_upcoming(params)
+        if path.endswith('/youtube/v3/playlistItems'):
+            return 200, self._list_uploads(params)
+        if '/calendar/v3/calendars/' in path:
+            return self._handle_calendar(method, path, params, body)
+        return 404, {'error': {'code': 404, 'message': f'{method} {path} is not supported'}}
+
+    def _list_items(self, items, params) -> dict:
+        ids = params.get('id', '').split(',')
+        return {'items': [copy.deepcopy(items[i]) for i in ids if i in items]}
+
+    def _channel_videos(self, channel_id: str) -> list:
+        return [v for v in self.videos.values() if v['snippet'].get('channelId') == channel_id]
+
+    def _search_upcoming(self, params) -> dict:
+        # search.list(eventType=upcoming)と同じく、まだ始まっていない配信だけを返す
+        videos = [v for v in self._channel_videos(params.get('channelId'))
+                  if 'liveStreamingDetails' in v and 'actualStartTime' not in v['liveStreamingDetails']]
+        return {'items': [{'id': {'kind': 'youtube#video', 'videoId': v['id']}}
+                          for v in videos[:int(params.get('maxResults') or 5)]]}
+
+    def _list_uploads(self, params) -> dict:
+        # アップロード動画の再生リストはチャンネルIDのUCをUUに置き換えたもの
+        videos = self._channel_videos('UC' + params.get('playlistId', '')[2:])
+        return {'items': [{'contentDetails': {'videoId': v['id']}}
+                          for v in videos[:int(params.get('maxResults') or 5)]]}
+
+    def _handle_calendar(self, method, path, params, body) -> tuple:
+        # パスは/calendar/v3/calendars/{calendarId}/events/{eventId}
+        parts = path.split('/calendars/', 1)[1].split('/events')
+        calendar_id = urllib.parse.unquote(parts[0])
+        event_id = urllib.parse.unquote(parts[1].strip('/')) if len(parts) > 1 else None
+        with self._lock:
+            events = self.events.get(calendar_id, {})
+            if method == 'GET' and not event_id:
+                return self._list_events(events, params)
+            if method == 'POST' and not event_id:
+                self._next_id += 1
+                event = dict(json.loads(body), id=f'fake{self._next_id:06d}')
+                return 200, self._get_event(self._put_event(calendar_id, event))
+            if event_id not in events or events[event_id].get('status') == 'cancelled':
+                return 404, {'error': {'code': 404, 'message': 'Not Found'}}
+            if method == 'GET':
+                return 200, self._get_event(events[event_id])
+            if method == 'PUT':
+                event = dict(json.loads(body), id=event_id)
+                return 200, self._get_event(self._put_event(calendar_id, event))
+            if method == 'DELETE':
+                self._put_event(calendar_id, dict(events[event_id], status='cancelled'))
+                return 204, None
+        return 405, {'error': {'code': 405, 'message': f'{method} is not allowed'}}
+
+    def _put_event(self, calendar_id: str, event) -> dict:
+        self._version += 1
+        event.setdefault('status', 'confirmed')
+        event.setdefault('htmlLink', f'https://www.google.com/calendar/event?eid={event["id"]}')
+        event.setdefault('organizer', {'email': calendar_id})
+        event['_version'] = self._version
+        # 一覧取得の度にパースしないよう、開始時刻は保存時に変換しておく
+        event['_start'] = arrow.get(event['start']['dateTime']).timestamp() if 'start' in event else 0
+        self.events.setdefault(calendar_id, {})[event['id']] = event
+        return event
+
+    def _get_event(self, event) -> dict:
+        return copy.deepcopy({k: v for k, v in event.items() if not k.startswith('_')})
+
+    def _list_events(self, events: dict, params) -> tuple:
+        if params.get('syncToken'):
+            since = int(params['syncToken'].split('-')[1])
+            items = [e for e in events.values() if e['_version'] > since]
+        else:
+            items = [e for e in events.values() if e.get('status') != 'cancelled']
+            time_min = arrow.get(params['timeMin']).timestamp() if params.get('timeMin') else None
+            time_max = arrow.get(params['timeMax']).timestamp() if params.get('timeMax') else None
+            items = [e for e in items
+                     if (time_min is None or e['_start'] >= time_min) and
+                     (time_max is None or e['_start'] <= time_max)]
+            if params.get('orderBy') == 'startTime':
+                items.sort(key=lambda e: e['_start'])
+        offset = int(params.get('pageToken') or 0)
+        max_results = int(params.get('maxResults', 250))
+        page = items[offset:offset + max_results]
+        response = {'items': [self._get_event(e) for e in page]}
+        if offset + max_results < len(items):
+            response['nextPageToken'] = str(offset + max_results)
+        else:
+            response['nextSyncToken'] = f'sync-{self._version}'
+        return 200, response
+
+    def _handle_batch(self, body, headers) -> tuple:
+        # Calendar APIのbatch requestを分解して1件ずつ処理し、multipart/mixedで返す
+        content_type = headers.get('content-type')
+        message = email.parser.Parser().parsestr(f'content-type: {content_type}\r\n\r\n{body}')
+        boundary = 'fake_batch_boundary'
+        lines = []
+        for part in message.get_payload():
+            request_line, _, rest = part.get_payload().partition('\n')
+            request_method, request_uri, _ = request_line.split(' ')
+            request_body = rest.split('\n\n', 1)[1] if '\n\n' in rest else None
+            # まとめて1回の通信で送られるので、batch内のリクエストには遅延を入れない
+            status, content = self.handle(request_method, request_uri, request_body or None, wait=False)
+            content = json.dumps(content) if content is not None else ''
+            lines += [f'--{boundary}', 'Content-Type: application/http',
+                      f'Content-ID: <response-{part["Content-ID"].strip("<>")}>', '',
+                      f'HTTP/1.1 {status} Fake', 'Content-Type: application/json', '', content]
+        lines.append(f'--{boundary}--')
+        return 200, '\r\n'.join(lines), f'multipart/mixed; boundary={boundary}'
+
+
+class FakeHttp(object):
+    # httplib2.Httpの代わりにgoogleapiclientへ渡す
+    def __init__(self, backend: FakeBackend):
+        self.backend = backend
+
+    def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+        import httplib2
+        result = self.backend.handle(method, uri, body, headers)
+        status, content = result[0], result[1]
+        content_type = result[2] if len(result) > 2 else 'application/json'
+        if not isinstance(content, str):
+            content = json.dumps(content) if content is not None else ''
+        response_headers = {'status': str(status), 'content-type': content_type}
+        if method == 'GET' and status == 200:
+            # YouTube/Calendar APIと同じく、内容が変わっていなければIf-None-Matchに304を返す
+            etag = f'"{hashlib.sha1(content.encode()).hexdigest()}"'
+            response_headers['etag'] = etag
+            if (headers or {}).get('If-None-Match') == etag:
+                response_headers['status'] = '304'
+                content = ''
+        return httplib2.Response(response_headers), content.encode()
+
+
+class FakeCredentials(object):
+    valid = True
+    expired = False
+    refresh_token = None
+    token = 'fake-token'
+
+
+class FakeResponse(object):
+    def __init__(self, status_code, content, headers=None):
+        self.status_code = status_code
+        self.content = content.encode()
+        self.text = content
+        self.headers = headers or {}
+
+
+class FakeSession(object):
+    # requests.Sessionの代わりにholoduleのHTMLを返す
+    def __init__(self, backend: FakeBackend):
+        self.backend = backend
+
+    def get(self, url, headers=None, timeout=None):
+        status = self.backend.simulate('holodule.get')
+        if status:
+            return FakeResponse(status, ERROR_MESSAGES.get(status, 'Error'))
+        return FakeResponse(200, self.backend.holodule_html)
+
+
+class FakeLineBotApi(object):
+    def __init__(self, backend: FakeBackend):
+        self.backend = backend
+
+    def broadcast(self, messages, **kwargs):
+        status = self.backend.simulate('line.broadcast')
+        if status:
+            from linebot.exceptions import LineBotApiError
+            from linebot.models.error import Error
+            raise LineBotApiError(status, {}, error=Error(message=ERROR_MESSAGES.get(status, 'Error')))
+        with self.backend._lock:
+            self.backend.line_messages.append(messages)
+
+
+class FakeBinary(object):
+    # boto3のBinary型と同じく、valueでbytesを取り出せるようにする
+    def __init__(self, value: bytes):
+        self.value = value
+
+
+def raise_client_error(status: int, code: str, operation: str):
+    from botocore.exceptions import ClientError
+    raise ClientError({'Error': {'Code': code, 'Message': ERROR_MESSAGES.get(status, 'Error')},
+                       'ResponseMetadata': {'HTTPStatusCode': status}}, operation)
+
+
+class FakeDynamoDBTable(object):
+    # TokenManagerやThumbnailCacheManagerが使うget_item/put_item/update_item/queryだけを実装する
+    def __init__(self, backend: FakeBackend, table_name: str):
+        self.backend = backend
+        with backend._lock:
+            self.items = backend.tables.setdefault(table_name, {})
+
+    def _simulate(self, operation: str) -> dict:
+        status = self.backend.simulate(f'dynamodb.{operation}')
+        if status:
+            raise_client_error(status, 'ProvisionedThroughputExceededException', operation)
+        return {'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+    @staticmethod
+    def _store(value):
+        if isinstance(value, (bytes, bytearray)):
+            return FakeBinary(bytes(value))
+        return copy.deepcopy(value)
+
+    def get_item(self, Key: dict) -> dict:
+        response = self._simulate('GetItem')
+        with self.backend._lock:
+            item = self.items.get(next(iter(Key.values())))
+            if item is not None:
+                response['Item'] = copy.deepcopy(item)
+        return response
+
+    def put_item(self, Item: dict) -> dict:
+        response = self._simulate('PutItem')
+        with self.backend._lock:
+            self.items[next(iter(Item.values()))] = {k: self._store(v) for k, v in Item.items()}
+        return response
+
+    def update_item(self, Key: dict, UpdateExpression: str, ExpressionAttributeValues: dict,
+                    ReturnValues: str = None) -> dict:
+        # "set a=:x, b=:y" と "ADD a :x" の形式だけを扱う
+        response = self._simulate('UpdateItem')
+        action, _, assignments = UpdateExpression.strip().partition(' ')
+        key_name, key = next(iter(Key.items()))
+        updated = {}
+        with self.backend._lock:
+            item = self.items.setdefault(key, {key_name: key})
+            for assignment in assignments.split(','):
+                name, placeholder = re.split(r'\s*=\s*|\s+', assignment.strip())
+                value = ExpressionAttributeValues[placeholder]
+                if action.lower() == 'add':
+                    value = item.get(name, 0) + value
+                item[name] = updated[name] = self._store(value)
+        if ReturnValues == 'UPDATED_NEW':
+            response['Attributes'] = copy.deepcopy(updated)
+        return response
+
+    def query(self, KeyConditionExpression, Select: str = None, Limit: int = None) -> dict:
+        response = self._simulate('Query')
+        # Key(name).eq(value)の条件だけを扱う
+        key = KeyConditionExpression.get_expression()['values'][1]
+        with self.backend._lock:
+            items = [copy.deepcopy(self.items[key])] if key in self.items else []
+        response['Count'] = len(items)
+        if Select != 'COUNT':
+            response['Items'] = items
+        return response
+
+
+class FakeKMS(object):
+    # 暗号化の代わりに目印を付けるだけのKMS
+    PREFIX = b'fake-kms:'
+
+    def __init__(self, backend: FakeBackend):
+        self.backend = backend
+
+    def _simulate(self, operation: str):
+        status = self.backend.simulate(f'kms.{operation}')
+        if status:
+            raise_client_error(status, 'ThrottlingException', operation)
+
+    def encrypt(self, KeyId: str, Plaintext: bytes) -> dict:
+        self._simulate('Encrypt')
+        return {'CiphertextBlob': self.PREFIX + Plaintext, 'KeyId': KeyId}
+
+    def decrypt(self, CiphertextBlob: bytes) -> dict:
+        self._simulate('Decrypt')
+        return {'Plaintext': CiphertextBlob[len(self.PREFIX):]}
+
+
+class FakeS3(object):
+    # S3Utilsが使うicsのアップロードと署名付きURLの発行だけを扱う
+    def __init__(self, backend: FakeBackend):
+        self.backend = backend
+
+    def _simulate(self, operation: str):
+        status = self.backend.simulate(f's3.{operation}')
+        if status:
+            raise_client_error(status, 'SlowDown', operation)
+
+    def upload_file(self, Filename: str, Bucket: str, Key: str, **kwargs):
+        self._simulate('PutObject')
+        with open(Filename, 'rb') as f:
+            body = f.read()
+        with self.backend._lock:
+            self.backend.objects[(Bucket, Key)] = body
+
+    def put_object(self, Bucket: str, Key: str, Body=b'', **kwargs) -> dict:
+        self._simulate('PutObject')
+        with self.backend._lock:
+            self.backend.objects[(Bucket, Key)] = Body.encode() if isinstance(Body, str) else Body
+        return {'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+    def generate_presigned_url(self, ClientMethod: str, Params: dict, ExpiresIn: int = 3600,
+                               HttpMethod: str = None) -> str:
+        # 署名はローカルで作られるので、呼び出し回数だけを数える
+        self.backend.record('s3.generate_presigned_url')
+        key = urllib.parse.quote(Params['Key'])
+        return f'https://{Params["Bucket"]}.s3.fake/{key}?X-Amz-Expires={ExpiresIn}'
+
+
+class FakeClientFactory(ClientFactory):
+    # set_client_factoryで差し替えると、importer/exporterはFakeBackendに対してAPIを呼ぶ
+    def __init__(self, backend: FakeBackend):
+        super().__init__()
+        self.backend = backend
+
+    def build_http(self, credentials=None):
+        return FakeHttp(self.backend)
+
+    def calendar(self, token_manager):
+        # DynamoDBを使う設定では、TokenManager経由で偽のDynamoDB/KMSからトークンを読む
+        def factory():
+            if token_manager is not None and token_manager.enable_dynamodb:
+                credentials = token_manager._get_token()
+            else:
+                credentials = FakeCredentials()
+            service = self.build_service(CALENDAR_API_SERVICE_NAME, CALENDAR_API_VERSION,
+                                         http=self.new_http(credentials))
+            return credentials, service
+
+        return self.cache.get(('calendar',), factory)
+
+    def boto3_client(self, service_name, aws_config):
+        fakes = {'kms': FakeKMS, 's3': FakeS3}
+        if service_name not in fakes:
+            raise ConfigrationError(f'Fake backend has no {service_name} client, ' +
+                                    f'only {", ".join(sorted(fakes))} are available')
+        return fakes[service_name](self.backend)
+
+    def dynamodb_table(self, aws_config):
+        return FakeDynamoDBTable(self.backend, aws_config.dynamodb_table)
+
+    def requests_session(self):
+        return FakeSession(self.backend)
+
+    def line_bot_api(self, channel_access_token):
+        return FakeLineBotApi(self.backend)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import json
+import logging
+import os
+import zlib
+
+from holoscope.clients import get_client_factory
+from holoscope.errors import RestError
+
+
+log = logging.getLogger(__name__)
+
+
+class HoloduleCacheManager(object):
+    def __init__(self, config):
+        if config.aws.access_key_id and config.aws.secret_access_key:
+            self.table = get_client_factory().dynamodb_table(config.aws)
+            self.hash_key_name = config.aws.dynamodb_hash_key_name
+            self.enable_dynamodb = True
+        else:
+            self.enable_dynamodb = False
+        self.holodule_url = config.holodule.holodule_url
+        self.hash_key = 'holodule_cache'
+
+    def get_holodule_cache(self) -> dict:
+        if self.enable_dynamodb:
+            cache = self._get_holodule_cache_from_dynamodb()
+        else:
+            cache = self._get_holodule_cache_from_file()
+        if cache and cache.get('holodule_url') != self.holodule_url:
+            log.info('Holodule cache belongs to another url, ignore it')
+            return None
+        return cache
+
+    def set_holodule_cache(self, etag: str, last_modified: str, content_hash: str, programs: list) -> dict:
+        cache = {
+            'holodule_url': self.holodule_url,
+            'etag': etag,
+            'last_modified': last_modified,
+            'content_hash': content_hash,
+            'programs': programs,
+        }
+        if self.enable_dynamodb:
+            self._set_holodule_cache_to_dynamodb(cache)
+        else:
+            self._set_holodule_cache_to_file(cache)
+        return cache
+
+    def _get_holodule_cache_from_dynamodb(self) -> dict:
+        response = self.table.get_item(Key={self.hash_key_name: self.hash_key})
+        if 'Item' not in response:
+            log.info('Holodule cache was not found in dynamodb')
+            return None
+        # The value method is used to cast from boto3 Binary type to byte type.
+        cache = json.loads(zlib.decompress(response['Item'][self.hash_key].value))
+        log.info('Get holodule cache from dynamodb')
+        return cache
+
+    def _get_holodule_cache_from_file(self) -> dict:
+        if not os.path.exists(f'{self.hash_key}.json'):
+            log.info('Holodule cache was not found')
+            return None
+        with open(f'{self.hash_key}.json', 'rt') as f:
+            cache = json.load(f)
+        log.info('Get holodule cache from file')
+        return cache
+
+    def _set_holodule_cache_to_dynamodb(self, cache):
+        compressed = zlib.compress(json.dumps(cache).encode())
+        response = self.table.put_item(Item={self.hash_key_name: self.hash_key,
+                                       self.hash_key: compressed})
+        if response['ResponseMetadata']['HTTPStatusCode'] != 200:
+            raise RestError(response)
+        log.info('Update holodule cache to dynamodb')
+
+    def _set_holodule_cache_to_file(self, cache):
+        with open(f'{self.hash_key}.json', 'wt') as f:
+            json.dump(cache, f)
+        log.info('Update holodule cache to file')
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+
+from html.parser import HTMLParser
+from urllib.parse import urlparse
+
+log = logging.getLogger(__name__)
+
+CARD_CLASS = 'col-6 col-sm-4 col-md-3'
+NAME_CLASS = 'col text-right name'
+IMAGE_CLASS = 'col col-sm col-md col-lg col-xl'
+# holoduleの表記とホロメンの正式名称が違うもの
+ACTOR_ALIASES = {
+    'ラプラス': 'ラプラス・ダークネス',
+    'アキロゼ': 'アキ・ローゼンタール',
+}
+
+
+def create_program(href: str, name: str, images: list) -> dict:
+    # カードから取り出したリンク、名前、サムネイルからprogramを作る、YouTubeの配信でなければNoneを返す
+    url = urlparse(href)
+    if ('youtube.com' not in url.netloc and 'youtu.be' not in url.netloc) or '/watch' != url.path:
+        return None
+    actor = '\n'.join(filter(lambda x: x.strip(), name.replace(" ", "").split('\n')))
+    actor = ACTOR_ALIASES.get(actor, actor)
+    s_img = images[0]
+    return {'actor': actor,
+            'collaborators': [img for img in images if img != s_img],
+            'video_id': url.query.split('=')[1],
+            'img': s_img,
+            'collaborate': []}
+
+
+class HoloduleParser(HTMLParser):
+    # BeautifulSoupで木を作らずに、カードを読み進めながら必要な値だけを取り出す
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.programs = []
+        self._card = None
+
+    def handle_starttag(self, tag, attrs):
+        card = self._card
+        if card is None:
+            if tag == 'div' and dict(attrs).get('class') == CARD_CLASS:
+                self._card = {'depth': 1, 'href': None, 'in_a': False, 'name': None,
+                              'name_depth': None, 'images': [], 'image_depth': None}
+            return
+        if tag == 'div':
+            card['depth'] += 1
+            if not card['in_a']:
+                return
+            # BeautifulSoupのfindと同じく、名前は最初に見つかったものだけを使う
+            css_class = dict(attrs).get('class')
+            if css_class == NAME_CLASS and card['name'] is None:
+                card['name'] = []
+                card['name_depth'] = card['depth']
+            elif css_class == IMAGE_CLASS:
+                card['images'].append(None)
+                card['image_depth'] = card['depth']
+        elif tag == 'a' and card['href'] is None:
+            card['href'] = dict(attrs).get('href') or ''
+            card['in_a'] = True
+        elif tag == 'img' and card['image_depth'] is not None and card['images'][-1] is None:
+            card['images'][-1] = dict(attrs).get('src')
+
+    def handle_endtag(self, tag):
+        card = self._card
+        if card is None:
+            return
+        if tag == 'a':
+            card['in_a'] = False
+        elif tag == 'div':
+            if card['name_depth'] == card['depth']:
+                card['name_depth'] = None
+            if card['image_depth'] == card['depth']:
+                card['image_depth'] = None
+            card['depth'] -= 1
+            if card['depth'] == 0:
+                self._card = None
+                self._add_program(card)
+
+    def handle_data(self, data):
+        if self._card is not None and self._card['name_depth'] is not None:
+            self._card['name'].append(data)
+
+    def _add_program(self, card):
+        images = [img for img in card['images'] if img is not None]
+        if not card['href'] or card['name'] is None or not images:
+            log.debug(f'Skip holodule card without link, name or thumbnail: {card["href"]}')
+            return
+        program = create_program(card['href'], ''.join(card['name']), images)
+        if program:
+            self.programs.append(program)
+            log.debug(f'Get contents from holodule: {program}')
+
+
+def parse_programs(html: str) -> list:
+    parser = HoloduleParser()
+    parser.feed(html)
+    parser.close()
+    return parser.programs
@@ -1,15 +1,44 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import logging
+
+from ..datamodel import LiveEvent
+from ..quota_manager import QuotaManager
+from ..utils import YoutubeUtils
+
+log = logging.getLogger(__name__)
+
 
 class Importer(object):
-    def __init__(self, config, youtube_utils):
+    def __init__(self, config, youtube_instance, load=True, quota_manager=None):
         self.cnf = config
-        self.youtube_utils = youtube_utils
-        self.video_ids = self._get_video_ids()
+        self.quota_manager = quota_manager or QuotaManager(self.cnf)
+        self.youtube_utils = YoutubeUtils(youtube_instance, self.quota_manager)
+        self.video_ids = []
+        if load:
+            self.video_ids = self._get_video_ids()
+            self.live_events = self._get_live_events()
 
     def _get_video_ids(self) -> list:
         upcoming_videos = []
-        for channel_id in self.cnf.youtube.channel_ids:
+        for channel_id in self.cnf.youtube.channel_ids or []:
             upcoming_videos += self.youtube_utils.get_upcoming_videos_from_ch(channel_id)
         return upcoming_videos
+
+    def _get_live_events(self) -> list:
+        events = []
+        responses = self.youtube_utils.get_live_events(self.video_ids)
+        self.save_state()
+        for resp in responses:
+            # playlistItemsから取得した場合は配信ではない動画も含まれるので読み飛ばす
+            if 'scheduledStartTime' not in resp.get('liveStreamingDetails', {}):
+                continue
+            # holoduleが無いのでホロメンの名前はチャンネル名を使う
+            events.append(LiveEvent(resp, resp['snippet'].get('channelTitle'), []))
+            log.info(f'Live event found [{events[-1].id}] {events[-1].channel_title}:' +
+                     f'{events[-1].title}.')
+        return events
+
+    def save_state(self):
+        self.quota_manager.save()
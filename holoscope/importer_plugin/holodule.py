@@ -3,20 +3,26 @@
 
 # import imagehash
 # import io
-import itertools
+import hashlib
 import json
 import logging
-import requests
 import socket
 # import urllib.request
 
-from bs4 import BeautifulSoup
 # from PIL import Image
-from urllib.parse import urlparse
 
+from .. import holodule_parser
+from ..clients import get_client_factory
 from ..datamodel import LiveEvent
+from ..errors import RestError
+from ..holodule_cache_manager import HoloduleCacheManager
+from ..metrics import get_metrics
+from ..quota_manager import QuotaManager
+from ..snapshot import get_recorder
+from ..thumbnail_cache_manager import create_thumbnail_index
 from ..thumbnail_cache_manager import ThumbnailCacheManager
 from ..utils import YoutubeUtils
+from ..video_state_manager import VideoStateManager
 
 log = logging.getLogger(__name__)
 timeout_in_sec = 5
@@ -24,127 +30,214 @@ socket.setdefaulttimeout(timeout_in_sec)
 
 
 class Importer(object):
-    def __init__(self, config, youtube_instance):
+    def __init__(self, config, youtube_instance, load=True, quota_manager=None):
         self.cnf = config
         self.youtube = youtube_instance
-        self.live_events = self._get_live_events()
-
-    def _deduplicate_live_events(self, events) -> list:
-        primary_events = [{e.actor: e} for e in events if not e.collaborate]
-        collaborate_events = [{collabo: e} for e in events if e.collaborate for collabo in e.collaborate]
-        delete_items = []
-        ''' ホロメンのリストと、コラボ予定のeventsでループを回し、
-            推しの配信予定とコラボ予定の時間が重複していた場合はdelete_itemsに追加
-        '''
-        for i in self.cnf.holodule.holomenbers:
-            for y, ce in enumerate(collaborate_events):
-                if ce.get(i):
-                    for pe in [x[i] for x in primary_events if x.get(i)]:
-                        if ce[i].scheduled_start_time == pe.scheduled_start_time:
-                            delete_items.append(ce.get(i))
-                            log.info(f'{ce[i].title} was deleted because duplicate event.')
-                            break
-        # primary_eventsとcollaborate_eventsを二次元配列にした後、flattenする
-        events = list(itertools.chain.from_iterable(([list(i.values()) for i in primary_events]
-                                                    + [list(j.values()) for j in collaborate_events])))
-        # delete_itemsにあるオブジェクトがeventsの中にあれば削除する
-        for d in delete_items:
-            events = [event for event in events if event != d]
-
-        # コラボレーターが複数人いる場合にeventが重複するので、重複しているイベントがあれば削除
-        return list(set(events))
+        self.quota_manager = quota_manager or QuotaManager(self.cnf)
+        self.thumbnail_cache_manager = ThumbnailCacheManager(self.cnf, self.youtube,
+                                                             quota_manager=self.quota_manager)
+        self.video_state_manager = VideoStateManager(self.cnf)
+        self.new_http = None
+        if load:
+            self.live_events = self._get_live_events()
+
+    def _deduplicate_live_events(self, events, holomenbers=None) -> list:
+        holomenbers = set(holomenbers or self.cnf.holodule.holomenbers)
+        # 推しの配信予定を(ホロメン, 予定開始時刻)で引けるようにしておく
+        primary_keys = {(e.actor, e.scheduled_start_time) for e in events if not e.collaborate}
+        deduplicated_events = []
+        seen = set()
+        for event in events:
+            # 同じeventが複数回渡されることがあるので一度だけ残す
+            if event in seen:
+                continue
+            seen.add(event)
+            # コラボ相手の推しに同じ時刻の配信予定があれば、コラボ予定は重複として削除する
+            if event.collaborate and any((collabo, event.scheduled_start_time) in primary_keys
+                                         for collabo in event.collaborate if collabo in holomenbers):
+                log.info(f'{event.title} was deleted because duplicate event.')
+                continue
+            deduplicated_events.append(event)
+        return deduplicated_events
 
     def _get_live_events(self) -> list:
-        events = []
-        programs = []
+        metrics = get_metrics()
+        all_programs = metrics.measure('import.holodule', self._get_programs)
+        thumbnail_cache = metrics.measure('import.thumbnail_cache', self.get_thumbnail_cache, all_programs)
+        programs = metrics.measure('import.filter_programs', self.filter_programs, all_programs,
+                                   thumbnail_cache)
+        events = metrics.measure('import.videos', self.create_live_events, programs, thumbnail_cache)
+        self.save_state()
+        return metrics.measure('import.deduplicate', self._deduplicate_live_events, events)
+
+    def save_state(self):
+        # quotaの消費量と動画の状態は、videos.listを全て取得し終えてから1回だけ保存する
+        self.quota_manager.save()
+        self.video_state_manager.save()
+
+    def project_live_events(self, events, holomenbers) -> list:
+        # filter_programs(keep_collaborate=True)で作ったeventsから、1テナント分のeventsを取り出す
+        holomenbers = set(holomenbers)
+        projected_events = []
+        for event in events:
+            if event.actor in holomenbers:
+                projected_events.append(event.copy(collaborate=[]) if event.collaborate else event)
+            elif holomenbers.intersection(event.collaborate or []):
+                projected_events.append(event)
+        return self._deduplicate_live_events(projected_events, holomenbers)
+
+    def prefetch_thumbnail_cache(self) -> dict:
+        # holoduleの取得と並行してキャッシュを読み込んでおくための入り口
+        return self.thumbnail_cache_manager.load_thumbnail_cache()
+
+    def get_thumbnail_cache(self, all_programs) -> dict:
         thumbnail_hash = {}
-        youtube_utils = YoutubeUtils(self.youtube)
-        all_programs = self._get_programs()
         for program in all_programs:
             thumbnail_hash[program.get('actor')] = {'holodule_url': program.get('img')}
-        thumbnail_cache_manager = ThumbnailCacheManager(self.cnf, self.youtube, thumbnail_hash)
-        thumbnail_cache = thumbnail_cache_manager.get_thumbnail_cache()
-        # 配信予定でループして、actorが一致したらbreak、コラボ予定であればcollaboratorsを追加
+        self.thumbnail_cache_manager.data = thumbnail_hash
+        thumbnail_cache = self.thumbnail_cache_manager.get_thumbnail_cache()
+        if get_recorder() is not None:
+            get_recorder().record('thumbnail_cache', thumbnail_cache)
+        return thumbnail_cache
+
+    def filter_programs(self, all_programs, thumbnail_cache, keep_collaborate=False) -> list:
+        programs = []
+        member_by_thumbnail, _ = create_thumbnail_index(thumbnail_cache)
+        holomenbers = set(self.cnf.holodule.holomenbers)
+        # 配信予定でループして、actorが推しであれば追加、コラボ予定であればcollaborateを追加
         for program in all_programs:
-            # for i in self.cnf.holodule.holomenbers:
-            for holomen in thumbnail_cache:
-                if program.get('actor') in self.cnf.holodule.holomenbers:
-                    program['collaborate'] = []
-                    programs.append(program)
-                    break
-                # キャッシュに入ってる推しのサムネイルのURLとコラボレーターの中に入っていたサムネイルのURLが一致したらコラボ配信と判定
-                if thumbnail_cache[holomen].get('holodule_url') in program['collaborators']:
-                    program['collaborate'].append(holomen)
-                if holomen in self.cnf.holodule.holomenbers:
-                    if holomen in program['collaborate']:
-                        programs.append(program)
+            # 複数テナントで実行する場合、推しかどうかはテナントごとに違うのでcollaborateを残しておく
+            if program.get('actor') in holomenbers and not keep_collaborate:
+                program['collaborate'] = []
+                programs.append(program)
+                continue
+            # キャッシュに入ってるホロメンのサムネイルのURLとコラボレーターの中に入っていたサムネイルのURLが一致したらコラボ配信と判定
+            # collaborateの並びはタイトルに使われるので、キャッシュでの順番に揃える
+            collaborate = sorted(member for url in set(program['collaborators'])
+                                 for member in member_by_thumbnail.get(url, []))
+            program['collaborate'] += [holomen for _, holomen in collaborate]
+            if program.get('actor') in holomenbers or holomenbers.intersection(program['collaborate']):
+                programs.append(program)
         # 同一のprogramがlist内にあった場合削除
         programs = list(map(json.loads, set(map(json.dumps, programs))))
         log.debug(f'Contents filtered by favorite: {programs}')
+        return programs
+
+    def create_live_events(self, programs, thumbnail_cache) -> list:
+        events = []
+        youtube_utils = YoutubeUtils(self.youtube, self.quota_manager, self.new_http)
+        _, member_by_channel = create_thumbnail_index(thumbnail_cache)
         video_ids = [program.get('video_id') for program in programs]
         log.debug(f'Contents filtered by favorite video_ids: {video_ids}')
-        if len(video_ids) > 50:
-            i = 0
-            video_ids_list = [video_ids[:50], video_ids[50:]]
-            for video_ids in video_ids_list:
-                responses = youtube_utils.get_live_events(video_ids)
-                log.debug('LIVE EVENT JSON DUMP')
-                log.debug(json.dumps(responses))
-                for resp in responses:
-                    try:
-                        resp['liveStreamingDetails']['scheduledStartTime']
-                    except KeyError:
-                        continue
-                    events.append(LiveEvent(resp, programs[i].get('actor'),
-                                            programs[i].get('collaborate')))
-                    log.info(f'Live event found [{events[-1].id}] {events[-1].channel_title}:' +
-                             f'{events[-1].title}.')
-                    i = i + 1
-        else:
-            responses = youtube_utils.get_live_events(video_ids)
-            log.debug('LIVE EVENT JSON DUMP')
-            log.debug(json.dumps(responses))
-            for j, resp in enumerate(responses):
-                try:
-                    resp['liveStreamingDetails']['scheduledStartTime']
-                except KeyError:
-                    continue
-                events.append(LiveEvent(resp, programs[j].get('actor'),
-                                        programs[j].get('collaborate')))
-                log.info(f'Live event found [{events[-1].id}] {events[-1].channel_title}:' +
-                         f'{events[-1].title}.')
-        return self._deduplicate_live_events(events)
+        # 終了した配信は内容が変わらないので、取得せずに保存しておいた内容からLiveEventを作る
+        snapshots = self.video_state_manager.get_ended_snapshots(video_ids)
+        responses = youtube_utils.get_live_events([v for v in video_ids if v not in snapshots])
+        self.video_state_manager.update(responses)
+        if snapshots:
+            log.info(f'Skip fetching {len(snapshots)} ended videos, use stored video state.')
+            if get_recorder() is not None:
+                get_recorder().record_video_state(snapshots)
+            responses_by_id = {**snapshots, **{resp['id']: resp for resp in responses}}
+            responses = [responses_by_id[v] for v in dict.fromkeys(video_ids) if v in responses_by_id]
+        log.debug('LIVE EVENT JSON DUMP')
+        log.debug(json.dumps(responses))
+        # YouTubeはitemsの欠落や順序の入れ替えがあるので、位置ではなくvideo_idでprogramと対応付ける
+        programs_by_video_id = {program.get('video_id'): program for program in programs}
+        for resp in responses:
+            program = programs_by_video_id.get(resp['id'])
+            if not program:
+                continue
+            try:
+                resp['liveStreamingDetails']['scheduledStartTime']
+            except KeyError:
+                continue
+            actor = program.get('actor')
+            if actor not in thumbnail_cache:
+                # holoduleの表記揺れはチャンネルIDからホロメンを引き当てる
+                actor = member_by_channel.get(resp['snippet']['channelId'], actor)
+            events.append(LiveEvent(resp, actor, program.get('collaborate')))
+            log.info(f'Live event found [{events[-1].id}] {events[-1].channel_title}:' +
+                     f'{events[-1].title}.')
+        return events
 
     def _get_programs(self) -> list:
+        programs = self._request_programs()
+        if get_recorder() is not None:
+            get_recorder().record('programs', programs)
+        return programs
+
+    def _request_programs(self) -> list:
+        if not self.cnf.holodule.enable_cache:
+            r = get_client_factory().requests_session().get(self.cnf.holodule.holodule_url,
+                                                            timeout=(3.0, 7.5))
+            if r.status_code != 200:
+                raise RestError(f'Failed to get holodule: {r.status_code}')
+            return self._parse_programs(r.text)
+
+        holodule_cache_manager = HoloduleCacheManager(self.cnf)
+        cache = holodule_cache_manager.get_holodule_cache()
+        headers = {}
+        if cache and cache.get('etag'):
+            headers['If-None-Match'] = cache['etag']
+        if cache and cache.get('last_modified'):
+            headers['If-Modified-Since'] = cache['last_modified']
+        r = get_client_factory().requests_session().get(self.cnf.holodule.holodule_url,
+                                                        headers=headers, timeout=(3.0, 7.5))
+        if r.status_code == 304 and cache:
+            log.info('Holodule was not modified, use cached programs.')
+            return cache['programs']
+        if r.status_code != 200:
+            # エラーページを解析して保存しないように、前回の結果を使い続ける
+            if not cache:
+                raise RestError(f'Failed to get holodule: {r.status_code}')
+            log.warning(f'Failed to get holodule: {r.status_code}, use cached programs.')
+            return cache['programs']
+
+        # ETagが付かない場合もあるので、本文のハッシュが同じであればパースを省略する
+        content_hash = hashlib.sha256(r.content).hexdigest()
+        etag = r.headers.get('ETag')
+        last_modified = r.headers.get('Last-Modified')
+        if cache and cache.get('content_hash') == content_hash:
+            log.info('Holodule content was not changed, use cached programs.')
+            if (cache.get('etag'), cache.get('last_modified')) != (etag, last_modified):
+                holodule_cache_manager.set_holodule_cache(etag, last_modified, content_hash,
+                                                          cache['programs'])
+            return cache['programs']
+        programs = self._parse_programs(r.text)
+        holodule_cache_manager.set_holodule_cache(etag, last_modified, content_hash, programs)
+        return programs
+
+    def _parse_programs(self, html: str) -> list:
+        if get_recorder() is not None:
+            get_recorder().record('holodule_html', html)
+        if self.cnf.holodule.parser == 'soup':
+            return self._parse_programs_with_soup(html)
+        try:
+            programs = holodule_parser.parse_programs(html)
+        except Exception as error:
+            log.warning(f'Failed to parse holodule with streaming parser, fall back to soup: {error}.')
+            return self._parse_programs_with_soup(html)
+        # ページの構造が変わってカードが見つからない場合もBeautifulSoupで解析し直す
+        if not programs and html.strip():
+            log.warning('No programs were found by streaming parser, fall back to soup.')
+            return self._parse_programs_with_soup(html)
+        return programs
+
+    def _parse_programs_with_soup(self, html: str) -> list:
+        from bs4 import BeautifulSoup
         programs = []
-        r = requests.get(self.cnf.holodule.holodule_url, timeout=(3.0, 7.5))
-        soup = BeautifulSoup(r.text, 'html.parser')
-        divs = soup.find_all('div', class_="col-6 col-sm-4 col-md-3")
+        soup = BeautifulSoup(html, 'html.parser')
+        divs = soup.find_all('div', class_=holodule_parser.CARD_CLASS)
         for div in divs:
             a = div.find('a')
-            url = urlparse(a.get("href"))
-            if ('youtube.com' not in url.netloc and 'youtu.be' not in url.netloc) or '/watch' != url.path:
+            name = a.find('div', class_=holodule_parser.NAME_CLASS)
+            imgs = a.find_all('div', class_=holodule_parser.IMAGE_CLASS)
+            if name is None or not imgs:
+                continue
+            result = holodule_parser.create_program(a.get("href"), name.get_text(),
+                                                    [i.find('img').attrs['src'] for i in imgs])
+            if not result:
                 continue
-            s = a.find('div', class_="col text-right name").get_text()
-            actor = '\n'.join(filter(lambda x: x.strip(),
-                                     s.replace(" ", "").split('\n')))
-            if actor == 'ラプラス':
-                actor = 'ラプラス・ダークネス'
-            if actor == 'アキロゼ':
-                actor = 'アキ・ローゼンタール'
-            s_img = a.find('div', class_="col col-sm col-md col-lg col-xl").find('img').attrs['src']
-            imgs = a.find_all('div', class_="col col-sm col-md col-lg col-xl")
-            collaborators = [
-                        i.find('img').attrs['src']
-                        for i in imgs
-                        if i.find('img').attrs['src'] != s_img
-                        ]
-            video_id = url.query.split('=')[1]
-            result = {'actor': actor,
-                      'collaborators': collaborators,
-                      'video_id': video_id,
-                      'img': s_img,
-                      'collaborate': []}
             programs.append(result)
             log.debug(f'Get contents from holodule: {result}')
         return programs
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import copy
+import hashlib
+import json
+import logging
+import pathlib
+import threading
+import urllib.parse
+
+from dataclasses import replace
+
+from ..clients import get_client_factory
+from ..clients import YOUTUBE_API_SERVICE_NAME
+from ..clients import YOUTUBE_API_VERSION
+from ..errors import ConfigrationError
+from ..snapshot import load_snapshots
+from ..snapshot import strip_api_key
+from .holodule import Importer as HoloduleImporter
+
+log = logging.getLogger(__name__)
+
+# videos.list、channels.listはidの組み合わせが記録した時と変わるので、itemごとに引けるようにする
+LIST_RESOURCES = ('videos', 'channels')
+
+_snapshot_cache = {}
+_snapshot_cache_lock = threading.Lock()
+# 1日のうちholoduleのページが変わるのは数回なので、同じHTMLは一度だけ解析する
+_programs_cache = {}
+
+
+def get_snapshots(path: str) -> list:
+    # 1日分を続けて再生する時に、同じファイルを何度も展開しないようにする
+    path = pathlib.Path(path)
+    if not path.exists():
+        raise ConfigrationError(str(path) + ' was not found')
+    key = (str(path.resolve()), path.stat().st_mtime_ns)
+    with _snapshot_cache_lock:
+        snapshots = _snapshot_cache.get(key)
+        if snapshots is None:
+            snapshots = load_snapshots(path)
+            _snapshot_cache.clear()
+            _snapshot_cache[key] = snapshots
+    return snapshots
+
+
+class ReplayHttp(object):
+    # googleapiclientに渡すhttpの代わりに、記録したYouTube Data APIのレスポンスを返す
+    def __init__(self, snapshot: dict = None):
+        self.load(snapshot or {'responses': []})
+
+    def load(self, snapshot: dict):
+        self.items = {resource: {} for resource in LIST_RESOURCES}
+        self.responses = {}
+        # video stateを使って取得しなかった終了済みの配信も、videos.listで返せるようにする
+        self.items['videos'].update(snapshot.get('video_state') or {})
+        for response in snapshot['responses']:
+            resource = self._get_resource(response['uri'])
+            if response['method'] == 'GET' and resource in self.items and response['status'] == 200:
+                for item in (response['content'] or {}).get('items', []):
+                    self.items[resource][item['id']] = item
+            else:
+                self.responses[(response['method'], response['uri'])] = (response['status'],
+                                                                         response['content'])
+
+    @staticmethod
+    def _get_resource(uri: str) -> str:
+        return urllib.parse.urlparse(uri).path.rstrip('/').rsplit('/', 1)[-1]
+
+    def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+        import httplib2
+        uri = strip_api_key(uri)
+        resource = self._get_resource(uri)
+        if method == 'GET' and resource in self.items:
+            params = dict(urllib.parse.parse_qsl(urllib.parse.urlparse(uri).query))
+            ids = params.get('id', '').split(',')
+            items = self.items[resource]
+            status, content = 200, {'items': [items[i] for i in ids if i in items]}
+        elif (method, uri) in self.responses:
+            status, content = self.responses[(method, uri)]
+        else:
+            log.warning(f'{method} {uri} was not recorded in snapshot.')
+            status, content = 404, {'error': {'code': 404, 'message': f'{method} {uri} was not recorded'}}
+        response = httplib2.Response({'status': str(status), 'content-type': 'application/json'})
+        return response, json.dumps(content).encode()
+
+
+class Importer(HoloduleImporter):
+    def __init__(self, config, youtube_instance, load=True, quota_manager=None):
+        if not config.replay:
+            raise ConfigrationError('[replay] section is required for replay importer')
+        snapshots = get_snapshots(config.replay.path)
+        if not snapshots:
+            raise ConfigrationError(f'No snapshot was found in {config.replay.path}')
+        self.snapshot = snapshots[config.replay.index]
+        log.info(f'Replay snapshot recorded at {self.snapshot["recorded_at"]}.')
+        youtube = self._build_youtube()
+        # 終了済みの配信も記録に含まれているので、video stateは読み書きしない
+        config = replace(config, youtube=replace(config.youtube, enable_video_state=False))
+        super().__init__(config, youtube, load=False, quota_manager=quota_manager)
+        # ReplayHttpは記録を引くだけなので、並列に取得する時もスレッド間で共有できる
+        self.new_http = lambda: self.replay_http
+        if load:
+            self.live_events = self._get_live_events()
+
+    def _build_youtube(self):
+        # serviceのメソッドは初回の呼び出しで作られるので、作ったserviceを使い回してhttpだけ差し替える
+        factory = get_client_factory()
+        self.replay_http = factory.cache.get(('replay_http',), ReplayHttp)
+        self.replay_http.load(self.snapshot)
+        return factory.cache.get(
+            ('replay',),
+            lambda: factory.build_service(YOUTUBE_API_SERVICE_NAME, YOUTUBE_API_VERSION,
+                                          developerKey='replay', http=self.replay_http))
+
+    def _request_programs(self) -> list:
+        # holoduleのキャッシュが使われた実行ではHTMLが無いので、記録したprogramsを使う
+        html = self.snapshot.get('holodule_html')
+        if html is None:
+            return copy.deepcopy(self.snapshot.get('programs') or [])
+        key = (hashlib.sha256(html.encode()).hexdigest(), self.cnf.holodule.parser)
+        if key not in _programs_cache:
+            _programs_cache.clear()
+            _programs_cache[key] = self._parse_programs(html)
+        # filter_programsがprogramを書き換えるので、解析済みのものは複製して渡す
+        return copy.deepcopy(_programs_cache[key])
+
+    def prefetch_thumbnail_cache(self) -> dict:
+        return self.snapshot.get('thumbnail_cache')
+
+    def get_thumbnail_cache(self, all_programs) -> dict:
+        if self.snapshot.get('thumbnail_cache') is None:
+            return super().get_thumbnail_cache(all_programs)
+        return copy.deepcopy(self.snapshot['thumbnail_cache'])
+
+    def save_state(self):
+        # 再生ではquotaを消費しないので、保存するものはない
+        log.debug('Skip saving quota and video state in replay.')
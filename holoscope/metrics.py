@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import sys
+import threading
+import time
+import urllib.parse
+
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+
+NAMESPACE = 'Holoscope'
+# CloudWatch EMFの1つのディレクティブに含められるメトリクスは100個まで
+MAX_EMF_METRICS = 100
+
+
+class Metrics(object):
+    # 1回の実行分の段階ごとの時間と、外部呼び出しの回数/時間/再試行/バイト数を集計する
+    def __init__(self):
+        self.started_at = time.time()
+        self.stages = {}
+        self.calls = {}
+        self.values = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            with self._lock:
+                self.stages[name] = self.stages.get(name, 0) + elapsed
+
+    def record_call(self, service: str, operation: str, latency: float, size: int = 0,
+                    status: int = 200, retries: int = 0):
+        with self._lock:
+            call = self.calls.setdefault(f'{service}.{operation}', {
+                'Count': 0, 'Latency': 0.0, 'MaxLatency': 0.0, 'Retries': 0, 'Errors': 0, 'Bytes': 0})
+            call['Count'] += 1
+            call['Latency'] += latency * 1000
+            call['MaxLatency'] = max(call['MaxLatency'], latency * 1000)
+            call['Bytes'] += size
+            call['Retries'] += retries
+            if status >= 400:
+                call['Errors'] += 1
+
+    def measure(self, name: str, func, *args, **kwargs):
+        with self.stage(name):
+            return func(*args, **kwargs)
+
+    def put(self, name: str, value, unit: str = 'Count'):
+        with self._lock:
+            self.values[name] = (value, unit)
+
+    def to_emf(self) -> dict:
+        metrics = {'Duration': ((time.time() - self.started_at) * 1000, 'Milliseconds')}
+        for name, elapsed in self.stages.items():
+            metrics[f'Stage.{name}'] = (elapsed, 'Milliseconds')
+        for name, call in self.calls.items():
+            for key, value in call.items():
+                unit = 'Milliseconds' if 'Latency' in key else 'Bytes' if key == 'Bytes' else 'Count'
+                metrics[f'Call.{name}.{key}'] = (value, unit)
+        metrics.update(self.values)
+        document = {
+            '_aws': {
+                'Timestamp': int(self.started_at * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': NAMESPACE,
+                    'Dimensions': [['Application']],
+                    'Metrics': [{'Name': name, 'Unit': unit}
+                                for name, (_, unit) in list(metrics.items())[:MAX_EMF_METRICS]],
+                }],
+            },
+            'Application': 'holoscope',
+        }
+        document.update({name: round(value, 3) if isinstance(value, float) else value
+                         for name, (value, _) in metrics.items()})
+        return document
+
+    def emit(self, stream=None) -> dict:
+        # Lambdaでは標準出力に1行のJSONとして書けば、CloudWatchがEMFとしてメトリクスに変換する
+        document = self.to_emf()
+        stream = stream or sys.stdout
+        stream.write(json.dumps(document, ensure_ascii=False) + '\n')
+        stream.flush()
+        return document
+
+
+class MeteredHttp(object):
+    # googleapiclientに渡すhttpをラップして、リクエストごとの時間とバイト数を記録する
+    def __init__(self, http):
+        self.http = http
+        # 直前に失敗したリクエスト、googleapiclientは同じhttpで同じリクエストを送り直すので再試行として数える
+        self._failed_request = None
+
+    def __getattr__(self, name):
+        return getattr(self.http, name)
+
+    def request(self, uri, method='GET', *args, **kwargs):
+        start = time.perf_counter()
+        service, operation = get_operation(uri, method)
+        request = (method, uri)
+        retries = int(self._failed_request == request)
+        try:
+            response, content = self.http.request(uri, method, *args, **kwargs)
+        except Exception:
+            # タイムアウトなどの通信エラーもエラーとして数える
+            self._failed_request = request
+            get_metrics().record_call(service, operation, time.perf_counter() - start, status=599,
+                                      retries=retries)
+            raise
+        self._failed_request = request if response.status >= 400 else None
+        get_metrics().record_call(service, operation, time.perf_counter() - start, len(content or b''),
+                                  response.status, retries)
+        return response, content
+
+
+def get_operation(uri: str, method: str) -> tuple:
+    path = urllib.parse.urlparse(uri).path.rstrip('/')
+    if '/batch/' in path:
+        return path.split('/batch/')[1].split('/')[0], 'batch'
+    if '/calendar/' in path and '/events' in path:
+        event_id = path.split('/events', 1)[1]
+        operation = {'GET': 'get' if event_id else 'list', 'POST': 'insert',
+                     'PUT': 'update', 'PATCH': 'patch', 'DELETE': 'delete'}.get(method, method)
+        return 'calendar', f'events.{operation}'
+    if '/youtube/' in path:
+        return 'youtube', f'{path.rsplit("/", 1)[-1]}.list'
+    return urllib.parse.urlparse(uri).netloc, method.lower()
+
+
+def record_requests_response(response, *args, **kwargs):
+    # requests.Sessionのresponse hookとして登録する
+    url = urllib.parse.urlparse(response.url)
+    get_metrics().record_call(url.netloc, response.request.method.lower(),
+                              response.elapsed.total_seconds(), len(response.content or b''),
+                              response.status_code)
+    return response
+
+
+def instrument_boto3(client):
+    # botocoreのイベントでDynamoDB/KMS等の呼び出しを記録する
+    def before_call(context, **kwargs):
+        context['holoscope_start'] = time.perf_counter()
+
+    def after_call(http_response, parsed, model, context, **kwargs):
+        start = context.get('holoscope_start')
+        if start is None:
+            return
+        get_metrics().record_call(client.meta.service_model.service_name, model.name,
+                                  time.perf_counter() - start,
+                                  int(http_response.headers.get('content-length', 0)),
+                                  http_response.status_code,
+                                  parsed.get('ResponseMetadata', {}).get('RetryAttempts', 0))
+
+    client.meta.events.register('before-call.*.*', before_call)
+    client.meta.events.register('after-call.*.*', after_call)
+    return client
+
+
+@contextmanager
+def profile(output: str = None):
+    # 有効にした場合だけcProfileで計測し、結果をファイルとログに出す
+    if not output:
+        yield
+        return
+    import cProfile
+    import io
+    import pstats
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(output)
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(20)
+        log.info(f'Profile was written to {output}\n{stream.getvalue()}')
+
+
+_metrics = Metrics()
+
+
+def get_metrics() -> Metrics:
+    return _metrics
+
+
+def start_metrics() -> Metrics:
+    # warm起動でも実行ごとに集計し直す
+    global _metrics
+    _metrics = Metrics()
+    return _metrics
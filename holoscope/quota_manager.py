@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import arrow
+import json
+import logging
+import os
+import threading
+
+from holoscope.clients import get_client_factory
+from holoscope.errors import RestError
+from holoscope.metrics import get_metrics
+
+
+log = logging.getLogger(__name__)
+
+# YouTube Data APIの1回あたりのquota消費量
+QUOTA_COSTS = {
+    'search.list': 100,
+    'videos.list': 1,
+    'channels.list': 1,
+    'playlistItems.list': 1,
+}
+# YouTube Data APIのquotaは太平洋時間の0時にリセットされる
+QUOTA_TZ = 'America/Los_Angeles'
+
+
+class QuotaManager(object):
+    def __init__(self, config):
+        if config.aws.access_key_id and config.aws.secret_access_key:
+            self.table = get_client_factory().dynamodb_table(config.aws)
+            self.hash_key_name = config.aws.dynamodb_hash_key_name
+            self.enable_dynamodb = True
+        else:
+            self.enable_dynamodb = False
+        self.enable_quota_meter = config.youtube.enable_quota_meter
+        self.budget = config.youtube.daily_quota_budget
+        self.hash_key = 'youtube_quota'
+        self.date = arrow.utcnow().to(QUOTA_TZ).format('YYYY-MM-DD')
+        self.calls = {}
+        self.run_units = 0
+        self.saved_units = 0
+        self._daily_units = None
+        self._lock = threading.Lock()
+
+    @property
+    def daily_units(self) -> int:
+        # 保存済みの今日の消費量は、必要になった時に一度だけ読み込む
+        with self._lock:
+            if self._daily_units is None:
+                self._daily_units = self._get_daily_units() if self.enable_quota_meter else 0
+            return self._daily_units + self.run_units
+
+    def record(self, method: str, count: int = 1) -> int:
+        units = QUOTA_COSTS[method] * count
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + count
+            self.run_units += units
+        log.debug(f'YouTube quota: {method} used {units} units')
+        return units
+
+    def can_spend(self, method: str, count: int = 1) -> bool:
+        if not self.enable_quota_meter or not self.budget:
+            return True
+        return self.daily_units + QUOTA_COSTS[method] * count <= self.budget
+
+    def summary(self) -> dict:
+        return {
+            'date': self.date,
+            'calls': dict(self.calls),
+            'run_units': self.run_units,
+            'daily_units': self.daily_units,
+            'budget': self.budget,
+        }
+
+    def save(self) -> dict:
+        summary = self.summary()
+        get_metrics().put('YoutubeQuotaUnits', self.run_units)
+        log.info(f'YouTube quota: {summary["run_units"]} units in this run {summary["calls"]}, ' +
+                 f'{summary["daily_units"]}/{self.budget} units today.')
+        # daemonでは何度も保存するので、前回保存してから増えた分だけを加算する
+        units = summary['run_units'] - self.saved_units
+        if self.enable_quota_meter and units:
+            if self.enable_dynamodb:
+                self._add_daily_units_to_dynamodb(units)
+            else:
+                self._set_daily_units_to_file(summary['daily_units'])
+        self.saved_units = summary['run_units']
+        return summary
+
+    def _get_daily_units(self) -> int:
+        if self.enable_dynamodb:
+            response = self.table.get_item(Key={self.hash_key_name: f'{self.hash_key}_{self.date}'})
+            return int(response.get('Item', {}).get('units', 0))
+        if not os.path.exists(f'{self.hash_key}.json'):
+            return 0
+        with open(f'{self.hash_key}.json', 'rt') as f:
+            quota = json.load(f)
+        return quota.get('units', 0) if quota.get('date') == self.date else 0
+
+    def _add_daily_units_to_dynamodb(self, units):
+        # 同時に動いている他の実行の分も失わないように、日付ごとのitemに加算する
+        response = self.table.update_item(
+            Key={self.hash_key_name: f'{self.hash_key}_{self.date}'},
+            UpdateExpression='ADD units :u',
+            ExpressionAttributeValues={':u': units},
+        )
+        if response['ResponseMetadata']['HTTPStatusCode'] != 200:
+            raise RestError(response)
+        log.info('Update youtube quota to dynamodb')
+
+    def _set_daily_units_to_file(self, units):
+        with open(f'{self.hash_key}.json', 'wt') as f:
+            json.dump({'date': self.date, 'units': units}, f)
+        log.info('Update youtube quota to file')
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import hashlib
+import logging
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+# この秒数の間使われなかったレスポンスは保存時に削除する
+RETENTION_SECONDS = 24 * 3600
+
+
+class ResponseCache(object):
+    # リクエストごとのETagと本文を保持し、If-None-Matchで304が返れば保存した本文を使う
+    def __init__(self, entries=None):
+        self.entries = entries or {}
+        self.hits = 0
+        self.misses = 0
+        self.dirty = False
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def create_key(method: str, uri: str) -> str:
+        # YouTubeのURIにはAPIキーが含まれるので、そのままは保存しない
+        return hashlib.sha1(f'{method} {uri}'.encode()).hexdigest()
+
+    def get_etag(self, key: str) -> str:
+        with self._lock:
+            entry = self.entries.get(key)
+            return entry['etag'] if entry else None
+
+    def hit(self, key: str) -> str:
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            self.hits += 1
+            # 使われたことの記録は、削除されない程度の頻度で書き込めば良い
+            now = time.time()
+            if now - entry['used_at'] > RETENTION_SECONDS / 2:
+                entry['used_at'] = now
+                self.dirty = True
+            return entry['content']
+
+    def miss(self, key: str, etag: str, content: str):
+        with self._lock:
+            self.misses += 1
+            if etag:
+                self.entries[key] = {'etag': etag, 'content': content, 'used_at': time.time()}
+                self.dirty = True
+            elif self.entries.pop(key, None):
+                self.dirty = True
+
+    def reset_counters(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def prune(self) -> dict:
+        expired_at = time.time() - RETENTION_SECONDS
+        with self._lock:
+            self.entries = {k: v for k, v in self.entries.items() if v['used_at'] >= expired_at}
+            return dict(self.entries)
+
+
+class CachedHttp(object):
+    # googleapiclientに渡すhttpをラップして、GETのレスポンスをETagで再利用する
+    def __init__(self, http):
+        self.http = http
+
+    def __getattr__(self, name):
+        return getattr(self.http, name)
+
+    def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+        cache = get_response_cache()
+        if cache is None or method != 'GET':
+            return self.http.request(uri, method, body=body, headers=headers, **kwargs)
+        key = cache.create_key(method, uri)
+        etag = cache.get_etag(key)
+        headers = dict(headers or {})
+        if etag:
+            headers['If-None-Match'] = etag
+        response, content = self.http.request(uri, method, body=body, headers=headers, **kwargs)
+        if response.status == 304 and etag:
+            cached = cache.hit(key)
+            if cached is not None:
+                # googleapiclientには通常の200として保存した本文を返す
+                response.status = 200
+                response['status'] = '200'
+                return response, cached.encode()
+            # ETagを取り出した後に保存した本文が削除された場合は、If-None-Match無しで取得し直す
+            log.info('Cached response was pruned after conditional request, fetch it again.')
+            headers.pop('If-None-Match')
+            response, content = self.http.request(uri, method, body=body, headers=headers, **kwargs)
+        if response.status == 200:
+            cache.miss(key, response.get('etag'), content.decode())
+        return response, content
+
+
+_response_cache = None
+
+
+def get_response_cache() -> ResponseCache:
+    return _response_cache
+
+
+def set_response_cache(response_cache: ResponseCache) -> ResponseCache:
+    global _response_cache
+    previous = _response_cache
+    _response_cache = response_cache
+    return previous
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import json
+import logging
+import os
+import zlib
+
+from holoscope.clients import get_client_factory
+from holoscope.errors import RestError
+from holoscope.metrics import get_metrics
+from holoscope.response_cache import ResponseCache
+
+
+log = logging.getLogger(__name__)
+
+# DynamoDBの1itemの上限は400KBなので、余裕を持たせてこのサイズに収まるまで古いものから削る
+MAX_ITEM_SIZE = 350 * 1024
+
+
+class ResponseCacheManager(object):
+    def __init__(self, config):
+        if config.aws.access_key_id and config.aws.secret_access_key:
+            self.table = get_client_factory().dynamodb_table(config.aws)
+            self.hash_key_name = config.aws.dynamodb_hash_key_name
+            self.enable_dynamodb = True
+        else:
+            self.enable_dynamodb = False
+        self.hash_key = 'response_cache'
+
+    def load(self) -> ResponseCache:
+        if self.enable_dynamodb:
+            entries = self._get_entries_from_dynamodb()
+        else:
+            entries = self._get_entries_from_file()
+        return ResponseCache(entries)
+
+    def save(self, cache: ResponseCache):
+        get_metrics().put('ResponseCacheHits', cache.hits)
+        get_metrics().put('ResponseCacheMisses', cache.misses)
+        log.info(f'Response cache: {cache.hits} hits, {cache.misses} misses.')
+        if not cache.dirty:
+            return
+        cache.dirty = False
+        entries = cache.prune()
+        if self.enable_dynamodb:
+            self._set_entries_to_dynamodb(entries)
+        else:
+            self._set_entries_to_file(entries)
+
+    def _get_entries_from_dynamodb(self) -> dict:
+        response = self.table.get_item(Key={self.hash_key_name: self.hash_key})
+        if 'Item' not in response:
+            log.info('Response cache was not found in dynamodb')
+            return {}
+        # The value method is used to cast from boto3 Binary type to byte type.
+        entries = json.loads(zlib.decompress(response['Item'][self.hash_key].value))
+        log.info('Get response cache from dynamodb')
+        return entries
+
+    def _get_entries_from_file(self) -> dict:
+        if not os.path.exists(f'{self.hash_key}.json'):
+            log.info('Response cache was not found')
+            return {}
+        with open(f'{self.hash_key}.json', 'rt') as f:
+            entries = json.load(f)
+        log.info('Get response cache from file')
+        return entries
+
+    def _set_entries_to_dynamodb(self, entries):
+        compressed = zlib.compress(json.dumps(entries).encode())
+        keys = sorted(entries, key=lambda k: entries[k]['used_at'])
+        while len(compressed) > MAX_ITEM_SIZE and keys:
+            count = max(len(keys) // 4, 1)
+            for key in keys[:count]:
+                del entries[key]
+            keys = keys[count:]
+            compressed = zlib.compress(json.dumps(entries).encode())
+        response = self.table.put_item(Item={self.hash_key_name: self.hash_key,
+                                       self.hash_key: compressed})
+        if response['ResponseMetadata']['HTTPStatusCode'] != 200:
+            raise RestError(response)
+        log.info('Update response cache to dynamodb')
+
+    def _set_entries_to_file(self, entries):
+        with open(f'{self.hash_key}.json', 'wt') as f:
+            json.dump(entries, f)
+        log.info('Update response cache to file')
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import arrow
+import gzip
+import json
+import logging
+import os
+import pathlib
+import threading
+import urllib.parse
+
+from holoscope.metrics import get_operation
+
+log = logging.getLogger(__name__)
+
+
+def strip_api_key(uri: str) -> str:
+    # APIキーは記録しない
+    url = urllib.parse.urlparse(uri)
+    query = [(k, v) for k, v in urllib.parse.parse_qsl(url.query) if k != 'key']
+    return url._replace(query=urllib.parse.urlencode(query)).geturl()
+
+
+class SnapshotRecorder(object):
+    # 1回の実行で取得したholoduleのHTMLとYouTube Data APIのレスポンスを記録する
+    def __init__(self):
+        self.snapshot = {
+            'recorded_at': arrow.utcnow().isoformat(),
+            'holodule_html': None,
+            'programs': None,
+            'thumbnail_cache': None,
+            'video_state': {},
+            'responses': [],
+        }
+        self._lock = threading.Lock()
+
+    def record(self, name: str, value):
+        with self._lock:
+            self.snapshot[name] = value
+
+    def record_video_state(self, snapshots: dict):
+        # video stateから作った終了済みの配信はYouTubeから取得しないので、別に記録する
+        with self._lock:
+            self.snapshot['video_state'].update(snapshots)
+
+    def record_response(self, method: str, uri: str, status: int, content):
+        with self._lock:
+            self.snapshot['responses'].append({'method': method, 'uri': strip_api_key(uri),
+                                               'status': status, 'content': content})
+
+
+class RecordingHttp(object):
+    # googleapiclientに渡すhttpをラップして、記録中であればYouTube Data APIのレスポンスを記録する
+    def __init__(self, http):
+        self.http = http
+
+    def __getattr__(self, name):
+        return getattr(self.http, name)
+
+    def request(self, uri, method='GET', *args, **kwargs):
+        response, content = self.http.request(uri, method, *args, **kwargs)
+        recorder = get_recorder()
+        if recorder is not None and get_operation(uri, method)[0] == 'youtube':
+            try:
+                recorder.record_response(method, uri, response.status, json.loads(content or b'null'))
+            except ValueError:
+                log.debug(f'Skip recording non-JSON response of {strip_api_key(uri)}')
+        return response, content
+
+
+def save_snapshot(recorder: SnapshotRecorder, snapshot_dir: str) -> str:
+    # 1日分を1つのファイルにまとめる、gzipのメンバーを追記していくので過去の記録を読み直す必要はない
+    os.makedirs(snapshot_dir, exist_ok=True)
+    date = arrow.get(recorder.snapshot['recorded_at']).format('YYYY-MM-DD')
+    path = os.path.join(snapshot_dir, f'holoscope-{date}.jsonl.gz')
+    with gzip.open(path, 'at', encoding='utf-8') as f:
+        f.write(json.dumps(recorder.snapshot, ensure_ascii=False) + '\n')
+    log.info(f'Snapshot was written to {path}')
+    return path
+
+
+def load_snapshots(path: str) -> list:
+    # ファイルか、ファイルを置いたディレクトリから記録時刻の順に読み込む
+    path = pathlib.Path(path)
+    paths = sorted(path.glob('*.jsonl.gz')) if path.is_dir() else [path]
+    snapshots = []
+    for snapshot_path in paths:
+        with gzip.open(snapshot_path, 'rt', encoding='utf-8') as f:
+            snapshots += [json.loads(line) for line in f if line.strip()]
+    return sorted(snapshots, key=lambda snapshot: snapshot['recorded_at'])
+
+
+_recorder = None
+
+
+def get_recorder() -> SnapshotRecorder:
+    return _recorder
+
+
+def start_recorder() -> SnapshotRecorder:
+    global _recorder
+    _recorder = SnapshotRecorder()
+    return _recorder
+
+
+def stop_recorder() -> SnapshotRecorder:
+    global _recorder
+    recorder = _recorder
+    _recorder = None
+    return recorder
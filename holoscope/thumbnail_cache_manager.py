@@ -1,6 +1,6 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-import boto3
+import arrow
 # import imagehash
 # import io
 import logging
@@ -8,8 +8,7 @@ import os
 import toml
 # import urllib.request
 
-from boto3.dynamodb.conditions import Key
-from boto3.session import Session
+from holoscope.clients import get_client_factory
 from holoscope.errors import RestError
 from holoscope.utils import YoutubeUtils
 # from PIL import Image
@@ -18,27 +17,39 @@ from holoscope.utils import YoutubeUtils
 log = logging.getLogger(__name__)
 
 
+def create_thumbnail_index(thumbnail_cache) -> tuple:
+    # サムネイルURL -> [(キャッシュでの順番, ホロメン)] と チャンネルID -> ホロメン の逆引きを作る
+    member_by_thumbnail = {}
+    member_by_channel = {}
+    for position, holomen in enumerate(thumbnail_cache):
+        holodule_url = thumbnail_cache[holomen].get('holodule_url')
+        if holodule_url:
+            member_by_thumbnail.setdefault(holodule_url, []).append((position, holomen))
+        channel = thumbnail_cache[holomen].get('channel')
+        if channel:
+            member_by_channel.setdefault(channel, holomen)
+    return member_by_thumbnail, member_by_channel
+
+
 class ThumbnailCacheManager(object):
-    def __init__(self, config, youtube_instance, data=None):
+    def __init__(self, config, youtube_instance, data=None, quota_manager=None):
         if config.aws.access_key_id and config.aws.secret_access_key:
-            try:
-                dynamodb = boto3.resource('dynamodb',
-                                          aws_access_key_id=config.aws.access_key_id,
-                                          aws_secret_access_key=config.aws.secret_access_key)
-            except: # noqa E722
-                dynamodb = Session.resource('dynamodb',
-                                            aws_access_key_id=config.aws.access_key_id,
-                                            aws_secret_access_key=config.aws.secret_access_key)
-            self.table = dynamodb.Table(config.aws.dynamodb_table)
+            self.table = get_client_factory().dynamodb_table(config.aws)
             self.hash_key_name = config.aws.dynamodb_hash_key_name
             self.enable_dynamodb = True
         else:
             self.enable_dynamodb = False
         self.youtube = youtube_instance
+        self.quota_manager = quota_manager
         self.hash_key = 'thumbnail_cache'
         self.data = data
+        self.refresh_hours = config.youtube.thumbnail_refresh_hours
+        self.dirty = False
+        self._thumbnail_cache = None
+        self._loaded = False
 
     def is_exist_hash_key(self) -> bool:
+        from boto3.dynamodb.conditions import Key
         options = {
             'Select': 'COUNT',
             'KeyConditionExpression': Key(self.hash_key_name).eq(self.hash_key),
@@ -50,15 +61,19 @@ class ThumbnailCacheManager(object):
         return False
 
     def get_thumbnail_cache(self) -> str:
-        if self.enable_dynamodb:
-            thumbnail_cache = self._get_thumbnail_cache_from_dynamodb()
+        if self._loaded:
+            thumbnail_cache = self._thumbnail_cache
         else:
-            thumbnail_cache = self._get_thumbnail_cache_from_file()
-        if thumbnail_cache:
-            thumbnail_cache = self._update_thumbnail_cache(thumbnail_cache)
+            thumbnail_cache = self.load_thumbnail_cache()
+        return self._update_thumbnail_cache(thumbnail_cache)
+
+    def load_thumbnail_cache(self) -> dict:
+        if self.enable_dynamodb:
+            self._thumbnail_cache = self._get_thumbnail_cache_from_dynamodb()
         else:
-            thumbnail_cache = self._set_thumbnail_cache()
-        return thumbnail_cache
+            self._thumbnail_cache = self._get_thumbnail_cache_from_file()
+        self._loaded = True
+        return self._thumbnail_cache
 
     def _get_thumbnail_cache_from_dynamodb(self) -> dict:
         if self.is_exist_hash_key():
@@ -90,21 +105,10 @@ class ThumbnailCacheManager(object):
 
     def _update_thumbnail_cache_to_dynamodb(self, thumbnail_cache) -> dict:
         thumbnail_cache = self._update_youtube_thumbnail(thumbnail_cache)
-        for i in thumbnail_cache:
-            # if not thumbnail_cache[i].get('holodule_img_hash'):
-            #     if thumbnail_cache[i].get('holodule_url'):
-            #         img_read = urllib.request.urlopen(thumbnail_cache[i]['holodule_url']).read()
-            #         img_bin = io.BytesIO(img_read)
-            #         img_hash = imagehash.average_hash(Image.open(img_bin))
-            #         thumbnail_cache[i]['holodule_img_hash'] = str(img_hash)
-            if self.data.get(i):
-                if self.data[i].get('holodule_url') != thumbnail_cache[i].get('holodule_url'):
-                    thumbnail_cache[i].update(self.data[i])
-                    # img_read = urllib.request.urlopen(thumbnail_cache[i]['holodule_url']).read()
-                    # img_bin = io.BytesIO(img_read)
-                    # img_hash = imagehash.average_hash(Image.open(img_bin))
-                    # thumbnail_cache[i]['holodule_img_hash'] = str(img_hash)
-                    log.info(f'Update holodule thumbnail url: {i}')
+        thumbnail_cache = self._update_holodule_thumbnail(thumbnail_cache)
+        if not self.dirty:
+            log.info('Thumbnail cache was not changed, skip updating dynamodb')
+            return thumbnail_cache
 
         response = self.table.update_item(
             Key={self.hash_key_name: self.hash_key},
@@ -122,22 +126,10 @@ class ThumbnailCacheManager(object):
     def _update_thumbnail_cache_to_file(self, thumbnail_cache) -> dict:
         if thumbnail_cache:
             thumbnail_cache = self._update_youtube_thumbnail(thumbnail_cache)
-            for i in thumbnail_cache:
-                # if not thumbnail_cache[i].get('holodule_img_hash'):
-                #     if thumbnail_cache[i].get('holodule_url'):
-                #         img_read = urllib.request.urlopen(thumbnail_cache[i]['holodule_url']).read()
-                #         img_bin = io.BytesIO(img_read)
-                #         img_hash = imagehash.average_hash(Image.open(img_bin))
-                #         thumbnail_cache[i]['holodule_img_hash'] = str(img_hash)
-                if self.data.get(i):
-                    if self.data[i].get('holodule_url') != thumbnail_cache[i].get('holodule_url'):
-                        thumbnail_cache[i].update(self.data[i])
-                        # img_read = urllib.request.urlopen(thumbnail_cache[i]['holodule_url']).read()
-                        # img_bin = io.BytesIO(img_read)
-                        # img_hash = imagehash.average_hash(Image.open(img_bin))
-                        # thumbnail_cache[i]['holodule_img_hash'] = str(img_hash)
-                        log.info(f'Update holodule thumbnail url: {i}')
-
+            thumbnail_cache = self._update_holodule_thumbnail(thumbnail_cache)
+            if not self.dirty:
+                log.info('Thumbnail cache was not changed, skip updating file')
+                return thumbnail_cache
             with open(f'{self.hash_key}.toml', 'wt') as f:
                 toml.dump(thumbnail_cache, f)
             return thumbnail_cache
@@ -146,28 +138,54 @@ class ThumbnailCacheManager(object):
                 toml.dump(self.data, f)
             return self.data
 
+    def _update_holodule_thumbnail(self, thumbnail_cache):
+        for i in thumbnail_cache:
+            # if not thumbnail_cache[i].get('holodule_img_hash'):
+            #     if thumbnail_cache[i].get('holodule_url'):
+            #         img_read = urllib.request.urlopen(thumbnail_cache[i]['holodule_url']).read()
+            #         img_bin = io.BytesIO(img_read)
+            #         img_hash = imagehash.average_hash(Image.open(img_bin))
+            #         thumbnail_cache[i]['holodule_img_hash'] = str(img_hash)
+            if self.data.get(i):
+                if self.data[i].get('holodule_url') != thumbnail_cache[i].get('holodule_url'):
+                    thumbnail_cache[i].update(self.data[i])
+                    self.dirty = True
+                    log.info(f'Update holodule thumbnail url: {i}')
+        return thumbnail_cache
+
     def _update_youtube_thumbnail(self, thumbnail_cache):
-        youtube_utils = YoutubeUtils(self.youtube)
-        responses = youtube_utils.get_channels([thumbnail_cache[i]['channel'] for i in thumbnail_cache])
-        for resp in responses:
-            for i in thumbnail_cache:
-                # if not thumbnail_cache[i].get('youtube_img_hash'):
-                #     if thumbnail_cache[i].get('youtube_url'):
-                #         img_read = urllib.request.urlopen(thumbnail_cache[i]['youtube_url']).read()
-                #         img_bin = io.BytesIO(img_read)
-                #         img_hash = imagehash.average_hash(Image.open(img_bin))
-                #         thumbnail_cache[i]['youtube_img_hash'] = str(img_hash)
-                if thumbnail_cache[i]['channel'] == resp['id']:
-                    if (thumbnail_cache[i].get('youtube_url') !=
-                            resp['snippet']['thumbnails']['default']['url']):
-                        thumbnail_cache[i]['youtube_url'] = resp['snippet']['thumbnails']['default']['url']
-                        # img_read = urllib.request.urlopen(thumbnail_cache[i]['youtube_url']).read()
-                        # img_bin = io.BytesIO(img_read)
-                        # img_hash = imagehash.average_hash(Image.open(img_bin))
-                        # thumbnail_cache[i]['holodule_img_hash'] = str(img_hash)
-                        log.info(f'Update youtube thumbnail url: {i}')
+        # チャンネルのアイコンはほとんど変わらないので、refresh_hoursごとにしか確認しない
+        now = arrow.utcnow()
+        expired = [i for i in thumbnail_cache
+                   if self._is_youtube_thumbnail_expired(thumbnail_cache[i], now)]
+        if not expired:
+            log.info('Youtube thumbnails are fresh, skip refreshing')
+            return thumbnail_cache
+        youtube_utils = YoutubeUtils(self.youtube, self.quota_manager)
+        responses = youtube_utils.get_channels([thumbnail_cache[i]['channel'] for i in expired])
+        responses = {resp['id']: resp for resp in responses}
+        for i in expired:
+            resp = responses.get(thumbnail_cache[i]['channel'])
+            if not resp:
+                continue
+            thumbnail_cache[i]['youtube_checked_at'] = now.isoformat()
+            self.dirty = True
+            if (thumbnail_cache[i].get('youtube_url') !=
+                    resp['snippet']['thumbnails']['default']['url']):
+                thumbnail_cache[i]['youtube_url'] = resp['snippet']['thumbnails']['default']['url']
+                # img_read = urllib.request.urlopen(thumbnail_cache[i]['youtube_url']).read()
+                # img_bin = io.BytesIO(img_read)
+                # img_hash = imagehash.average_hash(Image.open(img_bin))
+                # thumbnail_cache[i]['holodule_img_hash'] = str(img_hash)
+                log.info(f'Update youtube thumbnail url: {i}')
         return thumbnail_cache
 
+    def _is_youtube_thumbnail_expired(self, thumbnail, now) -> bool:
+        checked_at = thumbnail.get('youtube_checked_at')
+        if not checked_at:
+            return True
+        return arrow.get(checked_at).shift(hours=self.refresh_hours) <= now
+
     def set_thumbnail_cache_to_dynamodb(self):
         response = self.table.put_item(Item={self.hash_key_name: self.hash_key,
                                        self.hash_key: self.data})
@@ -5,54 +5,37 @@ import base64
 import os
 import pickle
 
-import boto3
-from boto3.dynamodb.conditions import Key
-from boto3.session import Session
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-
+from holoscope.clients import get_client_factory
 from holoscope.errors import RestError
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from google.oauth2.credentials import Credentials
 
 SCOPES = ['https://www.googleapis.com/auth/calendar']
 
 
 class TokenManager(object):
     def __init__(self, config, token_type):
+        client_factory = get_client_factory()
+        self.token_type = token_type
         if config.aws.access_key_id and config.aws.secret_access_key:
-            try:
-                kms = boto3.client('kms',
-                                   aws_access_key_id=config.aws.access_key_id,
-                                   aws_secret_access_key=config.aws.secret_access_key)
-                dynamodb = boto3.resource('dynamodb',
-                                          aws_access_key_id=config.aws.access_key_id,
-                                          aws_secret_access_key=config.aws.secret_access_key)
-            except: # noqa E722
-                dynamodb = Session.resource('dynamodb',
-                                            aws_access_key_id=config.aws.access_key_id,
-                                            aws_secret_access_key=config.aws.secret_access_key)
-            self.table = dynamodb.Table(config.aws.dynamodb_table)
+            self.table = client_factory.dynamodb_table(config.aws)
             self.hash_key_name = config.aws.dynamodb_hash_key_name
-            self.token_type = token_type
             self.enable_dynamodb = True
         else:
             self.enable_dynamodb = False
         if config.aws.kms_key_id:
-            try:
-                kms = boto3.client('kms',
-                                   aws_access_key_id=config.aws.access_key_id,
-                                   aws_secret_access_key=config.aws.secret_access_key)
-            except: # noqa E722
-                kms = Session.client('kms',
-                                     aws_access_key_id=config.aws.access_key_id,
-                                     aws_secret_access_key=config.aws.secret_access_key)
-            self.kms = kms
+            self.kms = client_factory.boto3_client('kms', config.aws)
             self.key_id = config.aws.kms_key_id
             self.enable_kms = True
         else:
             self.enable_kms = False
+        # プロセス内でクライアントを使い回す際のキー
+        self.cache_key = (token_type, config.aws.access_key_id, config.aws.dynamodb_table)
 
     def is_exist_hash_key(self) -> bool:
+        from boto3.dynamodb.conditions import Key
         options = {
             'Select': 'COUNT',
             'KeyConditionExpression': Key(self.hash_key_name).eq(self.token_type),
@@ -63,13 +46,13 @@ class TokenManager(object):
             return True
         return False
 
-    def _get_token(self) -> Credentials:
+    def _get_token(self) -> 'Credentials':
         if self.enable_dynamodb:
             return self._get_token_from_dynamodb()
         else:
             return self._get_token_from_file()
 
-    def _get_token_from_dynamodb(self) -> Credentials:
+    def _get_token_from_dynamodb(self) -> 'Credentials':
         response = self.table.get_item(Key={self.hash_key_name: self.token_type})
         # The value method is used to cast from boto3 Binary type to byte type.
         encoded_creds = response['Item']['credential'].value
@@ -79,19 +62,22 @@ class TokenManager(object):
         creds = pickle.loads(byte_creds)
         if not creds or not creds.valid:
             if creds and creds.expired and creds.refresh_token:
+                from google.auth.transport.requests import Request
                 creds.refresh(Request())
                 self._update_token(pickle.dumps(creds))
         return creds
 
-    def _get_token_from_file(self) -> Credentials:
+    def _get_token_from_file(self) -> 'Credentials':
         creds = None
         if os.path.exists('token.pickle'):
             with open('token.pickle', 'rb') as token:
                 creds = pickle.load(token)
         if not creds or not creds.valid:
             if creds and creds.expired and creds.refresh_token:
+                from google.auth.transport.requests import Request
                 creds.refresh(Request())
             else:
+                from google_auth_oauthlib.flow import InstalledAppFlow
                 flow = InstalledAppFlow.from_client_secrets_file(
                     'credentials.json', SCOPES)
                 creds = flow.run_local_server(port=0)
@@ -2,29 +2,31 @@
 # -*- coding: utf-8 -*-
 
 import arrow
-import boto3
+import functools
+import hashlib
 import json
 import logging
 import os.path
+import random
 import socket
 import textwrap
+import threading
+import time
 
+from .calendar_sync_manager import CalendarSyncManager
+from .clients import get_client_factory
+from .datamodel import CalendarMutation
 from .datamodel import GCalEvent
+from .metrics import get_metrics
 from .token_manager import TokenManager
 
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
 from datetime import timedelta
 
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
-from icalendar import Calendar
-from icalendar import Event
-
-from linebot.exceptions import LineBotApiError
-from linebot import LineBotApi
-from linebot.models import TextSendMessage
-
 
 log = logging.getLogger(__name__)
 timeout_in_sec = 5
@@ -38,6 +40,29 @@ ISO861FORMAT = 'YYYY-MM-DDTHH:mm:ss.SSSSSS'
 LINEFORMAT = 'YYYY/MM/DD HH:mm:ss'
 PAST = 7
 FUTURE = 120
+# Calendar APIのbatch requestは1回あたり50件まで
+BATCH_SIZE = 50
+MAX_RESULTS = 250
+# videos.list/channels.listに一度に渡せるidの上限
+MAX_VIDEO_IDS = 50
+MAX_WORKERS = 4
+MAX_MESSAGES_PER_BROADCAST = 5
+# 429/5xxの場合にgoogleapiclientが指数バックオフで再試行する回数
+NUM_RETRIES = 3
+# 処理される前に拒否されたことが分かる、予定の作成を再試行しても重複しない403の理由
+RATE_LIMIT_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded', 'quotaExceeded')
+
+
+def is_rate_limited(error: HttpError) -> bool:
+    if error.resp.status == 429:
+        return True
+    if error.resp.status != 403:
+        return False
+    try:
+        errors = json.loads(error.content).get('error', {}).get('errors', [])
+    except (ValueError, AttributeError):
+        return False
+    return any(e.get('reason') in RATE_LIMIT_REASONS for e in errors)
 
 
 def create_title(live_event):
@@ -49,6 +74,14 @@ def create_title(live_event):
     return title
 
 
+def create_fingerprint(body):
+    # 描画した予定の内容からハッシュを作り、前回書き込んだ内容と同じかを判定する
+    private = body['extendedProperties']['private']
+    content = dict(body, extendedProperties={
+        'private': {k: v for k, v in private.items() if k != 'fingerprint'}})
+    return hashlib.sha1(json.dumps(content, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+
 def create_event_dateTime(live_event, time_format):
     start_time = live_event.actual_start_time or live_event.scheduled_start_time
     end_time = live_event.actual_end_time or start_time + timedelta(hours=1)
@@ -63,11 +96,74 @@ def create_event_dateTime(live_event, time_format):
     return start_dateTime, end_dateTime
 
 
+class TokenBucket(object):
+    # 複数スレッドで共有するレートリミッター、不足分のトークンを前借りしてその分だけ待つ
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= tokens
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class DeferredLogFilter(logging.Filter):
+    # ワーカースレッドのログを溜めておき、後から決まった順番で出力するためのフィルタ
+    def __init__(self):
+        super().__init__()
+        self._local = threading.local()
+
+    def filter(self, record) -> bool:
+        records = getattr(self._local, 'records', None)
+        if records is None:
+            return True
+        records.append(record)
+        return False
+
+    @contextmanager
+    def capture(self, records: list):
+        self._local.records = records
+        try:
+            yield records
+        finally:
+            self._local.records = None
+
+    @staticmethod
+    def replay(records: list):
+        for record in records:
+            logging.getLogger(record.name).handle(record)
+
+
 class YoutubeUtils():
-    def __init__(self, youtube_instance):
+    def __init__(self, youtube_instance, quota_manager=None, new_http=None):
         self.youtube = youtube_instance
+        self.quota_manager = quota_manager
+        # 並列に取得する時にスレッドごとのhttpを作る関数、replayでは記録したレスポンスを返すhttpに差し替える
+        self.new_http = new_http or get_client_factory().new_http
+
+    def _record_quota(self, method: str, count: int = 1):
+        if self.quota_manager:
+            self.quota_manager.record(method, count)
+
+    def _can_spend_quota(self, method: str, count: int = 1) -> bool:
+        return not self.quota_manager or self.quota_manager.can_spend(method, count)
 
     def get_upcoming_videos_from_ch(self, channel_id: str, max_results: int = 5) -> list:
+        if not self._can_spend_quota('search.list'):
+            # search.listは100unitsかかるので、予算が足りなければアップロード再生リストから取得する
+            log.info(f'YouTube quota budget is running out, use uploads playlist of {channel_id}.')
+            return self.get_recent_videos_from_ch(channel_id, max_results)
+        self._record_quota('search.list')
         response = self.youtube.search().list(channelId=channel_id, part='id',
                                               order='date', type='video',
                                               eventType='upcoming',
@@ -75,8 +171,18 @@ class YoutubeUtils():
         video_ids = [item['id']['videoId'] for item in response.get('items', [])]
         return video_ids
 
+    def get_recent_videos_from_ch(self, channel_id: str, max_results: int = 5) -> list:
+        # チャンネルIDのUCをUUに置き換えるとアップロード動画の再生リストになる
+        self._record_quota('playlistItems.list')
+        response = self.youtube.playlistItems().list(playlistId='UU' + channel_id[2:],
+                                                     part='contentDetails',
+                                                     maxResults=max_results).execute()
+        video_ids = [item['contentDetails']['videoId'] for item in response.get('items', [])]
+        return video_ids
+
     def get_live_event(self, video_id: list) -> list:
         part = 'snippet,liveStreamingDetails'
+        self._record_quota('videos.list')
         video_response = self.youtube.videos().list(id=video_id,
                                                     part=part).execute()
         try:
@@ -85,29 +191,65 @@ class YoutubeUtils():
             video_response = None
         return video_response
 
-    def get_live_events(self, video_ids: list) -> list:
+    def get_live_events(self, video_ids: list, max_workers: int = MAX_WORKERS) -> list:
+        # videos.listは1回あたり50件までなので分割し、複数チャンクは並列に取得する
+        # 同じ動画の組み合わせが同じURIになり、ETagで再利用できるように並びを揃える
+        video_ids = sorted(video_ids)
+        chunks = [video_ids[i:i + MAX_VIDEO_IDS] for i in range(0, len(video_ids), MAX_VIDEO_IDS)]
+        if len(chunks) <= 1:
+            # async pipelineではチャンクごとに別のスレッドから呼ばれるので、その場合もhttpを分ける
+            new_http = threading.current_thread() is not threading.main_thread()
+            return [item for chunk in chunks for item in self._get_live_events(chunk, new_http=new_http)]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            responses = executor.map(functools.partial(self._get_live_events, new_http=True), chunks)
+            return [item for items in responses for item in items]
+
+    def _get_live_events(self, video_ids: list, new_http: bool = False) -> list:
         part = 'snippet,liveStreamingDetails'
-        video_response = self.youtube.videos().list(id=','.join(video_ids),
-                                                    part=part).execute()
+        # 配信情報の取得は必須なので、予算を超えていても呼び出す
+        if not self._can_spend_quota('videos.list'):
+            log.warning('YouTube quota budget was exceeded, but videos.list is required.')
+        self._record_quota('videos.list')
+        request = self.youtube.videos().list(id=','.join(video_ids), part=part)
+        # httplib2.Httpはスレッドセーフではないのでスレッドごとに新しく作る
+        video_response = request.execute(http=self.new_http() if new_http else None)
         return video_response.get('items', [])
 
     def get_channels(self, channel_ids: list) -> list:
         part = 'snippet,contentDetails,statistics'
-        response = self.youtube.channels().list(id=','.join(channel_ids),
-                                                part=part).execute()
-        return response.get('items', [])
+        channels = []
+        channel_ids = sorted(channel_ids)
+        # サムネイルの更新は次回に回せるので、予算が足りなければ呼び出さない
+        if not self._can_spend_quota('channels.list', -(-len(channel_ids) // MAX_VIDEO_IDS)):
+            log.info('YouTube quota budget was reached, skip channels.list.')
+            return channels
+        for i in range(0, len(channel_ids), MAX_VIDEO_IDS):
+            self._record_quota('channels.list')
+            response = self.youtube.channels().list(id=','.join(channel_ids[i:i + MAX_VIDEO_IDS]),
+                                                    part=part).execute()
+            channels.extend(response.get('items', []))
+        return channels
 
 
 class GoogleCalendarUtils:
     def __init__(self, config):
         self.calendar_id = config.google_calendar.calendar_id
-        token_manager = TokenManager(config, token_type='google_calendar')
-        self.calendar_service = build(
-            CALENDAR_API_SERVICE_NAME,
-            CALENDAR_API_VERSION,
-            credentials=token_manager._get_token())
-
-    def _create_event_data(self, live_event):
+        token_manager = TokenManager(config, token_type=config.google_calendar.token_type)
+        self.credentials, self.calendar_service = get_client_factory().calendar(token_manager)
+        self.enable_batch = config.google_calendar.enable_batch
+        self.max_workers = config.google_calendar.max_workers
+        # 逐次実行ではリクエストが重ならないので、並列に送る時だけ秒間のリクエスト数を抑える
+        self.rate_limiter = None
+        if self.max_workers > 1:
+            self.rate_limiter = TokenBucket(config.google_calendar.max_requests_per_second)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.enable_incremental_sync = config.google_calendar.enable_incremental_sync
+        if self.enable_incremental_sync:
+            self.sync_manager = CalendarSyncManager(config)
+        self._mutations = []
+
+    def create_event_data(self, live_event):
         title = create_title(live_event)
         start_dateTime, end_dateTime = create_event_dateTime(live_event, ISO861FORMAT)
         # 予定のタイトル
@@ -151,56 +293,142 @@ class GoogleCalendarUtils:
                 'end': end_time,
                 'extendedProperties': extended_property
             }
+        extended_property["private"]["fingerprint"] = create_fingerprint(body)
         return body
 
-    def create_event(self, live_event):
-        body = self._create_event_data(live_event)
+    def create_event(self, live_event, callback=None):
+        body = self.create_event_data(live_event)
+        request = self.calendar_service.events().insert(
+                calendarId=self.calendar_id, body=body)
+        return self._submit(CalendarMutation('insert', live_event, request, callback=callback))
+
+    def update_event(self, event_id, live_event, callback=None, body=None):
+        body = body or self.create_event_data(live_event)
+        request = self.calendar_service.events().update(
+                calendarId=self.calendar_id, eventId=event_id, body=body)
+        return self._submit(CalendarMutation('update', live_event, request,
+                                             event_id=event_id, callback=callback))
+
+    def delete_event(self, event_id, live_event, callback=None):
+        request = self.calendar_service.events().delete(
+                calendarId=self.calendar_id, eventId=event_id)
+        return self._submit(CalendarMutation('delete', live_event, request,
+                                             event_id=event_id, callback=callback))
+
+    def _submit(self, mutation):
+        if self.enable_batch:
+            self._queue_mutation(mutation)
+            return None
         try:
-            created_event = self.calendar_service.events().insert(
-                    calendarId=self.calendar_id, body=body).execute()
-            log.info(f'[{live_event.id}]: Event created {created_event.get("htmlLink")}')
-        except HttpError as error:
+            if mutation.action == 'insert':
+                response = self._execute_insert(mutation.request)
+            else:
+                response = self._execute(mutation.request)
+            error = None
+        except HttpError as e:
+            response = None
+            error = e
+        self._complete_mutation(mutation, response, error)
+        return mutation.response
+
+    def _execute(self, request, num_retries=NUM_RETRIES):
+        self._throttle()
+        return request.execute(http=self._get_http(), num_retries=num_retries)
+
+    def _execute_insert(self, request):
+        # insertは冪等ではなく、5xxやタイムアウトはサーバー側で作成済みの場合があり再試行すると予定が重複する
+        # 作成されなかったことが分かるレート制限だけを再試行し、それ以外は次回の実行で作り直す
+        for retry in range(NUM_RETRIES + 1):
+            try:
+                return self._execute(request, num_retries=0)
+            except HttpError as error:
+                if retry == NUM_RETRIES or not is_rate_limited(error):
+                    raise
+                time.sleep(random.random() * 2 ** (retry + 1))
+
+    def _throttle(self):
+        if self.rate_limiter:
+            self.rate_limiter.acquire()
+
+    def _get_http(self):
+        # httplib2.Httpはスレッドセーフではないので、並列実行時はスレッドごとに用意する
+        if self.max_workers <= 1:
+            return None
+        if not hasattr(self._local, 'http'):
+            self._local.http = get_client_factory().new_http(credentials=self.credentials)
+        return self._local.http
+
+    def _queue_mutation(self, mutation):
+        with self._lock:
+            # 同じ予定への更新は最後の内容だけ送れば良いので置き換える
+            if mutation.action == 'update':
+                for i, queued in enumerate(self._mutations):
+                    if queued.action == 'update' and queued.event_id == mutation.event_id:
+                        self._mutations[i] = mutation
+                        return
+            self._mutations.append(mutation)
+
+    def _complete_mutation(self, mutation, response, error):
+        live_event = mutation.live_event
+        mutation.response = response
+        mutation.error = error
+        if error:
             log.info(f'An error occurred: {error}')
-            created_event = None
-        return created_event
-
-    def update_event(self, event_id, live_event):
-        body = self._create_event_data(live_event)
-        try:
-            updated_event = self.calendar_service.events().update(
-                    calendarId=self.calendar_id, eventId=event_id, body=body).execute()
+        elif mutation.action == 'insert':
+            log.info(f'[{live_event.id}]: Event created {response.get("htmlLink")}')
+        elif mutation.action == 'update':
             log.info(f'[{live_event.id}]: Event updated {live_event.title}')
-            log.info(f'[{live_event.id}]: Event updated url is {updated_event.get("htmlLink")}')
-        except HttpError as error:
-            log.info(f'An error occurred: {error}')
-            updated_event = None
-        return updated_event
-
-    def delete_event(self, event_id, live_event):
-        try:
-            deleted_event = self.calendar_service.events().delete(
-                    calendarId=self.calendar_id, eventId=event_id).execute()
+            log.info(f'[{live_event.id}]: Event updated url is {response.get("htmlLink")}')
+        elif mutation.action == 'delete':
             log.info(f'[{live_event.id}]: Event deleted {live_event.title}')
-            log.info(f'[{live_event.id}]: Event deleted url is {deleted_event.get("htmlLink")}')
+        if mutation.callback:
+            mutation.callback(response)
+
+    def flush(self) -> list:
+        # キューに溜めた作成/更新/削除をbatch requestでまとめて送信する
+        mutations = self._mutations
+        self._mutations = []
+        for i in range(0, len(mutations), BATCH_SIZE):
+            chunk = mutations[i:i + BATCH_SIZE]
+            self._execute_batch(chunk)
+        if mutations:
+            failed = len([m for m in mutations if m.error])
+            log.info(f'Flushed {len(mutations)} calendar mutations, {failed} failed.')
+        return mutations
+
+    def _execute_batch(self, mutations):
+        def callback(request_id, response, exception):
+            mutation = mutations[int(request_id)]
+            self._complete_mutation(mutation, response, exception)
+
+        batch = self.calendar_service.new_batch_http_request(callback=callback)
+        for i, mutation in enumerate(mutations):
+            batch.add(mutation.request, request_id=str(i))
+        # batchは1回のHTTPリクエストで送られるので、まとめて1件として数える
+        self._throttle()
+        try:
+            batch.execute()
         except HttpError as error:
-            log.info(f'An error occurred: {error}')
-            deleted_event = None
-        return deleted_event
+            log.error(f'An error occurred: {error}.')
+            for mutation in mutations:
+                if mutation.response is None and mutation.error is None:
+                    self._complete_mutation(mutation, None, error)
 
     def get_events(self, past: int = PAST, future: int = FUTURE) -> list:
         # 指定されたカレンダーからeventを取得
         events = []
         now = arrow.utcnow()
-        past = now.shift(days=-past).format(ISO861FORMAT) + 'Z'
-        future = now.shift(days=future).format(ISO861FORMAT) + 'Z'
+        # 実行ごとにURIが変わるとETagで再利用できないので、取得範囲は1時間単位に広げる
+        time_min = now.shift(days=-past).floor('hour')
+        time_max = now.shift(days=future).ceil('hour')
         try:
             # Call the Calendar API
-            responses = self.calendar_service.events().list(calendarId=self.calendar_id,
-                                                            timeMin=(past),
-                                                            timeMax=(future),
-                                                            maxResults=250, singleEvents=True,
-                                                            orderBy='startTime').execute()
-            responses = responses.get('items', [])
+            if self.enable_incremental_sync:
+                responses = self._sync_events(time_min, time_max)
+            else:
+                responses, _ = self._list_events(timeMin=time_min.format(ISO861FORMAT) + 'Z',
+                                                 timeMax=time_max.format(ISO861FORMAT) + 'Z',
+                                                 orderBy='startTime')
             if not responses:
                 log.error('Upcomming events was not found.')
                 return events
@@ -208,16 +436,74 @@ class GoogleCalendarUtils:
             log.debug(json.dumps(responses))
             for resp in responses:
                 events.append(GCalEvent(resp))
-                if(events[-1].scheduled_start_time.to(TZ) > arrow.utcnow().to(TZ)):
+                if events[-1].scheduled_start_time and events[-1].scheduled_start_time > now:
                     log.info(f'Schedule found {events[-1].title}.')
             return events
         except HttpError as error:
+            # 予定を取得できないまま登録すると全ての配信を登録し直して通知してしまうので、処理を止める
             log.error(f'An error occurred: {error}.')
+            raise
+
+    def _list_events(self, **kwargs) -> tuple:
+        # nextPageTokenがなくなるまでページを辿り、最後のページのnextSyncTokenを返す
+        items = []
+        page_token = None
+        while True:
+            request = self.calendar_service.events().list(calendarId=self.calendar_id,
+                                                          maxResults=MAX_RESULTS,
+                                                          singleEvents=True,
+                                                          pageToken=page_token,
+                                                          **kwargs)
+            response = self._execute(request)
+            items.extend(response.get('items', []))
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                return items, response.get('nextSyncToken')
+
+    def _sync_events(self, time_min, time_max) -> list:
+        state = self.sync_manager.get_sync_state()
+        if state and state.get('sync_token'):
+            try:
+                items, sync_token = self._list_events(syncToken=state['sync_token'])
+                log.info(f'Incremental sync found {len(items)} changed events.')
+            except HttpError as error:
+                if error.resp.status != 410:
+                    raise
+                log.info('Sync token was expired, fall back to full sync.')
+                state = None
+        else:
+            state = None
+        if not state:
+            # syncTokenはtimeMin/timeMax/orderByと併用できないためフィルタなしで全件取得する
+            state = {'events': {}}
+            items, sync_token = self._list_events()
+            log.info(f'Full sync found {len(items)} events.')
+
+        cached_events = state['events']
+        for item in items:
+            if item.get('status') == 'cancelled':
+                cached_events.pop(item['id'], None)
+            else:
+                cached_events[item['id']] = item
+        # 取得範囲より過去の予定はキャッシュから落とす
+        cached_events = {k: v for k, v in cached_events.items()
+                         if self._get_event_time(v, 'end') >= time_min}
+        self.sync_manager.set_sync_state(sync_token, cached_events)
+
+        responses = [v for v in cached_events.values()
+                     if self._get_event_time(v, 'start') <= time_max]
+        return sorted(responses, key=lambda v: self._get_event_time(v, 'start'))
+
+    @staticmethod
+    def _get_event_time(event, key):
+        return arrow.get(event[key].get('dateTime') or event[key].get('date'))
 
 
 class LineMessageSender:
     def __init__(self, config):
-        self.linebot = LineBotApi(config.line.line_channel_access_token)
+        self.linebot = get_client_factory().line_bot_api(config.line.line_channel_access_token)
+        self.enable_buffer = config.line.enable_message_buffer
+        self._messages = {}
 
     def create_message_data(self, live_event):
         title = create_title(live_event)
@@ -228,21 +514,53 @@ class LineMessageSender:
                        f'配信URL: https://www.youtube.com/watch?v={live_event.id}'
         return line_message
 
+    def notify(self, video_id, header, message_template):
+        if not self.enable_buffer:
+            self.broadcast_message(header + message_template)
+            return
+        # 同じ配信への通知は1つのメッセージにまとめる
+        message = self._messages.setdefault(video_id, {'headers': [], 'template': message_template})
+        if header not in message['headers']:
+            message['headers'].append(header)
+        message['template'] = message_template
+
+    def flush(self) -> int:
+        # 1回のbroadcastで送れるメッセージオブジェクトは5件まで
+        line_messages = [''.join(m['headers']) + m['template'] for m in self._messages.values()]
+        self._messages = {}
+        for i in range(0, len(line_messages), MAX_MESSAGES_PER_BROADCAST):
+            self.broadcast_messages(line_messages[i:i + MAX_MESSAGES_PER_BROADCAST])
+        if line_messages:
+            log.info(f'Broadcast {len(line_messages)} messages in ' +
+                     f'{-(-len(line_messages) // MAX_MESSAGES_PER_BROADCAST)} requests.')
+        return len(line_messages)
+
     def broadcast_message(self, line_message):
+        self.broadcast_messages([line_message])
+
+    def broadcast_messages(self, line_messages):
+        from linebot.exceptions import LineBotApiError
+        from linebot.models import TextSendMessage
+        start = time.perf_counter()
+        status = 200
         try:
-            self.linebot.broadcast(TextSendMessage(text=line_message))
+            self.linebot.broadcast([TextSendMessage(text=line_message) for line_message in line_messages])
         except LineBotApiError as e:
+            status = e.status_code
             log.error(f'LineBotApiError: {e}.')
+        finally:
+            get_metrics().record_call('line', 'broadcast', time.perf_counter() - start,
+                                      sum(len(m.encode()) for m in line_messages), status)
 
 
 class S3Utils:
     def __init__(self, config):
-        self.s3 = boto3.client('s3',
-                               aws_access_key_id=config.aws.access_key_id,
-                               aws_secret_access_key=config.aws.secret_access_key)
+        self.s3 = get_client_factory().boto3_client('s3', config.aws)
         self.s3_bucket = config.aws.s3_bucket
 
     def _create_ics(self, live_event) -> str:
+        from icalendar import Calendar
+        from icalendar import Event
         title = create_title(live_event)
         start_dateTime, end_dateTime = create_event_dateTime(live_event, LINEFORMAT)
         cal = Calendar()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import arrow
+import json
+import logging
+import sqlite3
+import threading
+import zlib
+
+from contextlib import closing
+from holoscope.clients import get_client_factory
+from holoscope.errors import RestError
+
+
+log = logging.getLogger(__name__)
+
+# LiveEventの生成に必要な項目だけを保存する
+SNIPPET_FIELDS = ['title', 'channelId', 'channelTitle']
+
+
+def get_phase(response: dict) -> str:
+    details = response.get('liveStreamingDetails', {})
+    if details.get('actualEndTime'):
+        return 'ended'
+    if details.get('actualStartTime'):
+        return 'live'
+    return 'upcoming'
+
+
+def create_snapshot(response: dict) -> dict:
+    snippet = response['snippet']
+    # 同時視聴者数は配信中に毎回変わるので保存しない
+    details = {k: v for k, v in response['liveStreamingDetails'].items() if k != 'concurrentViewers'}
+    return {
+        'id': response['id'],
+        'snippet': {f: snippet[f] for f in SNIPPET_FIELDS if f in snippet},
+        'liveStreamingDetails': details,
+    }
+
+
+class VideoStateManager(object):
+    # 動画ごとの最後に取得した内容と状態(upcoming/live/ended)を保存し、終了した配信の再取得を省く
+    def __init__(self, config):
+        if config.aws.access_key_id and config.aws.secret_access_key:
+            self.table = get_client_factory().dynamodb_table(config.aws)
+            self.hash_key_name = config.aws.dynamodb_hash_key_name
+            self.enable_dynamodb = True
+        else:
+            self.enable_dynamodb = False
+        self.enable_video_state = config.youtube.enable_video_state
+        self.retention_days = config.youtube.video_state_retention_days
+        self.hash_key = 'video_state'
+        self._states = None
+        self._changed = {}
+        self._lock = threading.Lock()
+
+    def get_ended_snapshots(self, video_ids: list) -> dict:
+        if not self.enable_video_state:
+            return {}
+        states = self._get_states()
+        return {video_id: states[video_id]['snapshot'] for video_id in video_ids
+                if video_id in states and states[video_id]['phase'] == 'ended'}
+
+    def update(self, responses: list):
+        if not self.enable_video_state:
+            return
+        states = self._get_states()
+        now = arrow.utcnow().isoformat()
+        with self._lock:
+            for response in responses:
+                # 配信ではない動画はLiveEventにならないので保存しない
+                if 'liveStreamingDetails' not in response:
+                    continue
+                state = {'phase': get_phase(response), 'snapshot': create_snapshot(response)}
+                current = states.get(response['id'])
+                # 内容が変わっていなければ書き込まない
+                if current and all(current[k] == state[k] for k in ('phase', 'snapshot')):
+                    continue
+                state['updated_at'] = now
+                states[response['id']] = self._changed[response['id']] = state
+
+    def save(self):
+        with self._lock:
+            changed, self._changed = self._changed, {}
+        if not changed:
+            return
+        # 保存期間を過ぎたものは削除する、まだholoduleに載っていれば次の実行で取得し直される
+        expired_at = arrow.utcnow().shift(days=-self.retention_days).isoformat()
+        if self.enable_dynamodb:
+            self._set_states_to_dynamodb(expired_at)
+        else:
+            self._set_states_to_sqlite(changed, expired_at)
+        log.info(f'Update {len(changed)} video states.')
+
+    def _get_states(self) -> dict:
+        # 保存済みの状態は、必要になった時に一度だけ読み込む
+        with self._lock:
+            if self._states is None:
+                if self.enable_dynamodb:
+                    self._states = self._get_states_from_dynamodb()
+                else:
+                    self._states = self._get_states_from_sqlite()
+            return self._states
+
+    def _get_states_from_dynamodb(self) -> dict:
+        response = self.table.get_item(Key={self.hash_key_name: self.hash_key})
+        if 'Item' not in response:
+            log.info('Video state was not found in dynamodb')
+            return {}
+        # The value method is used to cast from boto3 Binary type to byte type.
+        states = json.loads(zlib.decompress(response['Item'][self.hash_key].value))
+        log.info('Get video state from dynamodb')
+        return states
+
+    def _get_states_from_sqlite(self) -> dict:
+        with closing(self._connect()) as connection:
+            rows = connection.execute('SELECT video_id, phase, snapshot, updated_at FROM video_state')
+            states = {video_id: {'phase': phase, 'snapshot': json.loads(snapshot), 'updated_at': updated_at}
+                      for video_id, phase, snapshot, updated_at in rows}
+        log.info('Get video state from sqlite')
+        return states
+
+    def _set_states_to_dynamodb(self, expired_at):
+        with self._lock:
+            self._states = {k: v for k, v in self._states.items() if v['updated_at'] >= expired_at}
+            # 1itemあたり400KBの制限があるので圧縮して保存する
+            compressed = zlib.compress(json.dumps(self._states).encode())
+        response = self.table.put_item(Item={self.hash_key_name: self.hash_key,
+                                       self.hash_key: compressed})
+        if response['ResponseMetadata']['HTTPStatusCode'] != 200:
+            raise RestError(response)
+        log.info('Update video state to dynamodb')
+
+    def _set_states_to_sqlite(self, changed, expired_at):
+        # 変わった動画の行だけを書き込む
+        with closing(self._connect()) as connection, connection:
+            connection.executemany(
+                'INSERT OR REPLACE INTO video_state (video_id, phase, snapshot, updated_at) '
+                'VALUES (?, ?, ?, ?)',
+                [(video_id, state['phase'], json.dumps(state['snapshot']), state['updated_at'])
+                 for video_id, state in changed.items()])
+            connection.execute('DELETE FROM video_state WHERE updated_at < ?', (expired_at,))
+        log.info('Update video state to sqlite')
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(f'{self.hash_key}.sqlite3')
+        connection.execute('CREATE TABLE IF NOT EXISTS video_state ('
+                           'video_id TEXT PRIMARY KEY, phase TEXT NOT NULL, '
+                           'snapshot TEXT NOT NULL, updated_at TEXT NOT NULL)')
+        connection.execute('CREATE INDEX IF NOT EXISTS video_state_updated_at ON video_state (updated_at)')
+        return connection
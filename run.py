@@ -11,6 +11,7 @@ import os
 import sys
 
 from holoscope.config import ConfigLoader
+from holoscope.config import load_config
 from holoscope.core import Holoscope
 
 FORMAT = "[%(asctime)s] [%(levelname)s][%(module)s][%(funcName)s]: %(message)s"
@@ -19,8 +20,7 @@ log = logging.getLogger(__name__)
 
 
 def lambda_handler(event, context):
-    cl = ConfigLoader()
-    config = cl.config
+    config = load_config()
     logging.basicConfig(
         level=(config.general.loglevel).upper(),
         format="[{asctime}] [{levelname}][{module}][{funcName}]: {message}",
@@ -61,7 +61,7 @@ if __name__ == '__main__':
         format="[{levelname}][{module}][{funcName}] {message}",
         style='{'
     )
-    token_manager = TokenManager(config, token_type='google_calendar')
+    token_manager = TokenManager(config, token_type=config.google_calendar.token_type)
     if config.aws.access_key_id and config.aws.secret_access_key:
         if not token_manager.is_exist_hash_key():
             log.info('Token was not found in dynamodb')
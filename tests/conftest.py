@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import arrow
+import pytest
+import toml
+
+from holoscope.clients import set_client_factory
+from holoscope.fake_backends import FakeBackend
+from holoscope.fake_backends import FakeClientFactory
+
+CHANNEL_ID = 'UC0000000000000000000001'
+THUMBNAIL = 'https://yt3.ggpht.com/okayu'
+HTML = f'''
+<div class="col-6 col-sm-4 col-md-3">
+  <a href="https://www.youtube.com/watch?v=v1">
+    <div class="col text-right name">猫又おかゆ</div>
+    <div class="col col-sm col-md col-lg col-xl"><img src="{THUMBNAIL}"></div>
+  </a>
+</div>'''
+
+
+@pytest.fixture
+def backend_args():
+    # FakeBackendに渡すholoduleのHTMLや動画、テストモジュールごとに上書きする
+    return {}
+
+
+@pytest.fixture
+def backend(backend_args, tmp_path, monkeypatch):
+    # quotaやキャッシュはAWSの設定が無ければカレントディレクトリに保存されるので、一時ディレクトリで実行する
+    monkeypatch.chdir(tmp_path)
+    # 再試行の待ち時間は入れない
+    monkeypatch.setattr('time.sleep', lambda seconds: None)
+    backend = FakeBackend(**backend_args)
+    previous = set_client_factory(FakeClientFactory(backend))
+    yield backend
+    set_client_factory(previous)
+
+
+@pytest.fixture
+def upcoming_stream(tmp_path):
+    # 猫又おかゆの1時間後に始まる配信が1件だけholoduleに載っている状態
+    with open(tmp_path / 'thumbnail_cache.toml', 'wt') as f:
+        toml.dump({'猫又おかゆ': {'channel': CHANNEL_ID, 'holodule_url': THUMBNAIL, 'youtube_url': THUMBNAIL,
+                             'youtube_checked_at': arrow.utcnow().isoformat()}}, f)
+    video = {'id': 'v1', 'snippet': {'title': 'stream', 'channelId': CHANNEL_ID, 'channelTitle': 'okayu'},
+             'liveStreamingDetails': {'scheduledStartTime': arrow.utcnow().shift(hours=1).isoformat()}}
+    return {'holodule_html': HTML, 'videos': [video]}
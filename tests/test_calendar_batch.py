@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from googleapiclient.errors import HttpError
+
+from holoscope.datamodel import AwsConfiguration
+from holoscope.datamodel import Configuration
+from holoscope.datamodel import GoogleCalendarConfiguration
+from holoscope.datamodel import LiveEvent
+from holoscope.utils import GoogleCalendarUtils
+
+
+@pytest.fixture
+def calendar(backend):
+    config = Configuration(aws=AwsConfiguration(),
+                           google_calendar=GoogleCalendarConfiguration(calendar_id='primary',
+                                                                       enable_batch=True))
+    return GoogleCalendarUtils(config)
+
+
+def create_event(video_id):
+    return LiveEvent({'id': video_id,
+                      'snippet': {'title': video_id, 'channelId': 'UC1', 'channelTitle': 'ch'},
+                      'liveStreamingDetails': {'scheduledStartTime': '2024-01-01T12:00:00Z'}},
+                     '猫又おかゆ', [])
+
+
+def record_to(responses: dict, video_id: str):
+    # callbackに渡されたレスポンスをvideo_idごとに記録する
+    return lambda response: responses.update({video_id: response})
+
+
+def test_flush_passes_each_response_to_its_callback(backend, calendar):
+    responses = {}
+    for video_id in ('v1', 'v2', 'v3'):
+        calendar.create_event(create_event(video_id), callback=record_to(responses, video_id))
+    assert not backend.calls['calendar.events.insert']
+    mutations = calendar.flush()
+    assert backend.calls['calendar.batch'] == 1
+    assert [m.error for m in mutations] == [None, None, None]
+    for video_id, response in responses.items():
+        assert response['extendedProperties']['private']['video_id'] == video_id
+    assert len({response['id'] for response in responses.values()}) == 3
+
+
+def test_partial_batch_failure_only_fails_its_mutations(backend, calendar):
+    responses = {}
+    # 最初のinsertと、存在しない予定へのupdateだけが失敗する
+    backend.fail('calendar.events.insert', 503)
+    for video_id in ('v1', 'v2'):
+        calendar.create_event(create_event(video_id), callback=record_to(responses, video_id))
+    calendar.update_event('missing', create_event('v3'), callback=record_to(responses, 'v3'))
+    mutations = calendar.flush()
+
+    assert [m.error.resp.status if m.error else None for m in mutations] == [503, None, 404]
+    assert all(isinstance(m.error, HttpError) for m in (mutations[0], mutations[2]))
+    assert responses['v1'] is None and responses['v3'] is None
+    assert responses['v2']['extendedProperties']['private']['video_id'] == 'v2'
+    assert [e['extendedProperties']['private']['video_id'] for e in backend.calendar_events()] == ['v2']
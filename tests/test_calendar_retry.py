@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from holoscope.datamodel import AwsConfiguration
+from holoscope.datamodel import Configuration
+from holoscope.datamodel import GoogleCalendarConfiguration
+from holoscope.datamodel import LiveEvent
+from holoscope.utils import GoogleCalendarUtils
+
+
+@pytest.fixture
+def calendar(backend):
+    config = Configuration(aws=AwsConfiguration(),
+                           google_calendar=GoogleCalendarConfiguration(calendar_id='primary',
+                                                                       max_requests_per_second=1e9))
+    return GoogleCalendarUtils(config)
+
+
+def create_event(video_id='v1'):
+    return LiveEvent({'id': video_id,
+                      'snippet': {'title': 'stream', 'channelId': 'UC1', 'channelTitle': 'ch'},
+                      'liveStreamingDetails': {'scheduledStartTime': '2024-01-01T12:00:00Z'}},
+                     '猫又おかゆ', [])
+
+
+def test_insert_is_retried_on_rate_limit(backend, calendar):
+    backend.fail('calendar.events.insert', 429, times=2)
+    assert calendar.create_event(create_event())['id']
+    assert backend.calls['calendar.events.insert'] == 3
+    assert len(backend.calendar_events()) == 1
+
+
+def test_insert_is_not_retried_on_server_error(backend, calendar):
+    # 5xxはサーバー側で作成済みの場合があるので、再試行せずに次回の実行に任せる
+    backend.fail('calendar.events.insert', 503)
+    assert calendar.create_event(create_event()) is None
+    assert backend.calls['calendar.events.insert'] == 1
+    assert not backend.calendar_events()
+
+
+def test_update_is_retried_on_server_error(backend, calendar):
+    event_id = calendar.create_event(create_event())['id']
+    backend.fail('calendar.events.update', 503)
+    assert calendar.update_event(event_id, create_event())['id'] == event_id
+    assert backend.calls['calendar.events.update'] == 2
+
+
+@pytest.mark.parametrize('max_workers', [1, 4])
+def test_batch_is_throttled_as_one_request(backend, monkeypatch, max_workers):
+    sleeps = []
+    monkeypatch.setattr('time.sleep', sleeps.append)
+    config = Configuration(aws=AwsConfiguration(),
+                           google_calendar=GoogleCalendarConfiguration(calendar_id='primary',
+                                                                       enable_batch=True,
+                                                                       max_workers=max_workers))
+    calendar = GoogleCalendarUtils(config)
+    assert (calendar.rate_limiter is None) == (max_workers == 1)
+    for i in range(60):
+        calendar.create_event(create_event(f'v{i}'))
+    calendar.flush()
+    # 50件ずつの2回のbatchは秒間5リクエストの制限に収まるので待たない
+    assert backend.calls['calendar.batch'] == 2
+    assert len(backend.calendar_events()) == 60
+    assert not sleeps
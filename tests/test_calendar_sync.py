@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import arrow
+import pytest
+
+from googleapiclient.errors import HttpError
+
+from holoscope.calendar_sync_manager import CalendarSyncManager
+from holoscope.datamodel import AwsConfiguration
+from holoscope.datamodel import Configuration
+from holoscope.datamodel import GoogleCalendarConfiguration
+from holoscope.datamodel import LiveEvent
+from holoscope.utils import GoogleCalendarUtils
+
+CONFIG = Configuration(aws=AwsConfiguration(),
+                       google_calendar=GoogleCalendarConfiguration(calendar_id='primary',
+                                                                   enable_incremental_sync=True))
+
+
+def create_event(video_id):
+    start = arrow.utcnow().shift(hours=1).isoformat()
+    return LiveEvent({'id': video_id,
+                      'snippet': {'title': video_id, 'channelId': 'UC1', 'channelTitle': 'ch'},
+                      'liveStreamingDetails': {'scheduledStartTime': start}},
+                     '猫又おかゆ', [])
+
+
+@pytest.fixture
+def list_params(backend, monkeypatch):
+    # events.listに渡されたパラメータを記録する
+    params = []
+    list_events = backend._list_events
+    monkeypatch.setattr(backend, '_list_events',
+                        lambda events, p: params.append(p) or list_events(events, p))
+    return params
+
+
+@pytest.fixture
+def calendar(backend):
+    calendar = GoogleCalendarUtils(CONFIG)
+    for video_id in ('v1', 'v2'):
+        calendar.create_event(create_event(video_id))
+    return calendar
+
+
+def get_video_ids(calendar) -> list:
+    return sorted(event.video_id for event in calendar.get_events())
+
+
+def test_incremental_sync_uses_sync_token(backend, calendar, list_params):
+    assert get_video_ids(calendar) == ['v1', 'v2']
+    assert 'syncToken' not in list_params[-1]
+    sync_token = CalendarSyncManager(CONFIG).get_sync_state()['sync_token']
+
+    event_id = next(e['id'] for e in backend.calendar_events() if e['summary'].endswith('v1'))
+    calendar.delete_event(event_id, create_event('v1'))
+    calendar.create_event(create_event('v3'))
+    # 2回目は変わった予定だけを取得し、削除された予定は保存済みの状態からも消す
+    assert get_video_ids(calendar) == ['v2', 'v3']
+    assert list_params[-1]['syncToken'] == sync_token
+    assert CalendarSyncManager(CONFIG).get_sync_state()['sync_token'] != sync_token
+
+
+def test_expired_sync_token_falls_back_to_full_sync(backend, calendar, list_params):
+    get_video_ids(calendar)
+    backend.fail('calendar.events.list', 410)
+    assert get_video_ids(calendar) == ['v1', 'v2']
+    # 410で失敗したsyncToken付きの取得の後に、フィルタなしで全件取得し直す
+    assert backend.calls['calendar.events.list'] == 3
+    assert len(list_params) == 2
+    assert 'syncToken' not in list_params[-1]
+    assert CalendarSyncManager(CONFIG).get_sync_state()['sync_token']
+
+
+def test_sync_error_keeps_stored_state(backend, calendar):
+    get_video_ids(calendar)
+    state = CalendarSyncManager(CONFIG).get_sync_state()
+    calendar.create_event(create_event('v3'))
+    backend.fail('calendar.events.list', 400)
+    with pytest.raises(HttpError):
+        calendar.get_events()
+    # 410以外のエラーでは全件取得し直さず、保存済みの状態も消さない
+    assert backend.calls['calendar.events.list'] == 2
+    assert CalendarSyncManager(CONFIG).get_sync_state() == state
+    assert get_video_ids(calendar) == ['v1', 'v2', 'v3']
+
+
+def test_calendars_sharing_token_keep_separate_states(backend):
+    calendar_id = 'other@group.calendar.google.com'
+    other = Configuration(aws=AwsConfiguration(),
+                          google_calendar=GoogleCalendarConfiguration(calendar_id=calendar_id))
+    CalendarSyncManager(CONFIG).set_sync_state('sync-1', {})
+    CalendarSyncManager(other).set_sync_state('sync-2', {})
+    # 同じトークンを使うテナントでも、カレンダーごとに別の保存先を使う
+    assert CalendarSyncManager(CONFIG).get_sync_state()['sync_token'] == 'sync-1'
+    assert CalendarSyncManager(other).get_sync_state()['sync_token'] == 'sync-2'
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+
+import pytest
+
+from holoscope.clients import ClientFactory
+from holoscope.datamodel import AwsConfiguration
+
+
+@pytest.fixture
+def aws_config(monkeypatch):
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'ap-northeast-1')
+    return AwsConfiguration(access_key_id='key', secret_access_key='secret')
+
+
+def run_in_thread(target):
+    result = {}
+    thread = threading.Thread(target=lambda: result.update(value=target()))
+    thread.start()
+    thread.join()
+    return result['value']
+
+
+def test_boto3_resource_is_built_per_thread_and_reused_after_thread_exits(aws_config):
+    factory = ClientFactory()
+    resource = factory.boto3_resource('dynamodb', aws_config)
+    assert factory.boto3_resource('dynamodb', aws_config) is resource
+
+    # 同時に動いているスレッドには別のresourceを渡す
+    started, release = threading.Event(), threading.Event()
+
+    def hold():
+        value = factory.boto3_resource('dynamodb', aws_config)
+        started.set()
+        release.wait()
+        return value
+
+    result = {}
+    holder = threading.Thread(target=lambda: result.update(value=hold()))
+    holder.start()
+    started.wait()
+    other = run_in_thread(lambda: factory.boto3_resource('dynamodb', aws_config))
+    release.set()
+    holder.join()
+    assert result['value'] is not resource
+    # resourceは識別子で比較されるので、同じオブジェクトかどうかで確かめる
+    assert other is not resource and other is not result['value']
+
+    # warm起動で作り直されたスレッドは、終了したスレッドのresourceを使い回す
+    reused = run_in_thread(lambda: factory.boto3_resource('dynamodb', aws_config))
+    assert reused is result['value'] or reused is other
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from holoscope.datamodel import AwsConfiguration
+from holoscope.datamodel import Configuration
+from holoscope.datamodel import YoutubeConfiguration
+from holoscope.fake_backends import FakeClientFactory
+from holoscope.importer_plugin import config as config_importer
+
+CHANNEL_ID = 'UC0000000000000000000001'
+VIDEOS = [
+    {'id': 'upcoming', 'snippet': {'title': 'upcoming', 'channelId': CHANNEL_ID, 'channelTitle': 'ch'},
+     'liveStreamingDetails': {'scheduledStartTime': '2024-01-01T12:00:00Z'}},
+    {'id': 'uploaded', 'snippet': {'title': 'uploaded', 'channelId': CHANNEL_ID, 'channelTitle': 'ch'}},
+]
+
+
+@pytest.fixture
+def backend_args():
+    return {'videos': VIDEOS}
+
+
+def create_config(budget):
+    return Configuration(aws=AwsConfiguration(),
+                         youtube=YoutubeConfiguration(api_key='fake', channel_ids=[CHANNEL_ID],
+                                                      enable_quota_meter=True, daily_quota_budget=budget))
+
+
+def test_search_list_is_used_within_budget(backend):
+    importer = config_importer.Importer(create_config(10000), FakeClientFactory(backend).youtube('fake'))
+    assert [event.id for event in importer.live_events] == ['upcoming']
+    assert backend.calls['youtube.search.list'] == 1
+    assert backend.calls['youtube.playlistItems.list'] == 0
+    assert importer.quota_manager.summary()['run_units'] == 101
+
+
+def test_uploads_playlist_is_used_when_budget_runs_out(backend):
+    importer = config_importer.Importer(create_config(50), FakeClientFactory(backend).youtube('fake'))
+    # 配信ではない動画はLiveEventにしない
+    assert [event.id for event in importer.live_events] == ['upcoming']
+    assert backend.calls['youtube.search.list'] == 0
+    assert backend.calls['youtube.playlistItems.list'] == 1
+    assert importer.quota_manager.summary()['daily_units'] == 2
+
+
+def test_load_false_does_not_call_youtube(backend):
+    importer = config_importer.Importer(create_config(10000), None, load=False)
+    assert importer.video_ids == []
+    assert not backend.calls
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import arrow
+import pytest
+import time
+
+from holoscope.daemon import Daemon
+from holoscope.daemon import get_poll_interval
+from holoscope.daemon import VIDEO
+from holoscope.datamodel import AwsConfiguration
+from holoscope.datamodel import Configuration
+from holoscope.datamodel import DaemonConfiguration
+from holoscope.datamodel import GeneralConfiguration
+from holoscope.datamodel import GoogleCalendarConfiguration
+from holoscope.datamodel import HoloduleConfiguration
+from holoscope.datamodel import LineConfiguration
+from holoscope.datamodel import LiveEvent
+from holoscope.datamodel import YoutubeConfiguration
+
+
+def create_video(**details):
+    return {'id': 'v1', 'snippet': {'title': 'stream', 'channelId': 'UC1', 'channelTitle': 'okayu'},
+            'liveStreamingDetails': details}
+
+
+@pytest.fixture
+def backend_args(upcoming_stream):
+    return upcoming_stream
+
+
+@pytest.fixture
+def daemon(backend):
+    config = Configuration(aws=AwsConfiguration(),
+                           general=GeneralConfiguration(exporter_plugin='gcwl'),
+                           holodule=HoloduleConfiguration(holomenbers=['猫又おかゆ']),
+                           google_calendar=GoogleCalendarConfiguration(calendar_id='primary',
+                                                                       max_requests_per_second=1e9),
+                           youtube=YoutubeConfiguration(api_key='fake'),
+                           line=LineConfiguration(line_channel_access_token='fake'))
+    return Daemon(config)
+
+
+def test_poll_interval_is_none_for_ended_stream():
+    now = arrow.utcnow()
+    event = LiveEvent(create_video(scheduledStartTime=now.shift(hours=-3).isoformat(),
+                                   actualStartTime=now.shift(hours=-3).isoformat(),
+                                   actualEndTime=now.shift(hours=-1).isoformat()), '猫又おかゆ', [])
+    assert get_poll_interval(event, now, DaemonConfiguration()) is None
+
+
+def test_notified_is_pruned_when_video_leaves_holodule(backend, daemon):
+    daemon.tick()
+    assert [n[0] for n in daemon.notified] == ['v1']
+    assert daemon.exporter.notified is daemon.notified
+
+    backend.holodule_html = ''
+    daemon._rescan()
+    assert not daemon.notified
+    assert daemon.exporter.notified is daemon.notified
+
+
+def test_daemon_saves_response_cache_only_on_holodule_rescan(monkeypatch):
+    config = Configuration(aws=AwsConfiguration(),
+                           general=GeneralConfiguration(exporter_plugin='gcwl'))
+    daemon = Daemon(config)
+    saved = []
+    monkeypatch.setattr(daemon, '_save_response_cache', lambda: saved.append(True))
+    monkeypatch.setattr(daemon, '_rescan', lambda: [])
+    monkeypatch.setattr(daemon, '_poll', lambda video_ids: None)
+    # 最初のtickはholoduleの取得なので保存する
+    daemon.tick()
+    assert len(saved) == 1
+    daemon.schedule(VIDEO, 'v1', time.time())
+    daemon.tick()
+    assert len(saved) == 1
+    daemon.stop()
+    daemon.run_forever()
+    assert len(saved) == 2
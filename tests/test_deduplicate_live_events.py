@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import itertools
+import pytest
+
+from holoscope.datamodel import AwsConfiguration
+from holoscope.datamodel import Configuration
+from holoscope.datamodel import HoloduleConfiguration
+from holoscope.datamodel import LiveEvent
+from holoscope.datamodel import YoutubeConfiguration
+from holoscope.importer_plugin import holodule
+
+HOLOMENBERS = ['猫又おかゆ', 'さくらみこ', '桃鈴ねね']
+START = '2024-01-01T12:00:00Z'
+LATER = '2024-01-01T15:00:00Z'
+
+
+def create_event(video_id, actor, start=START, collaborate=None):
+    data = {'id': video_id,
+            'snippet': {'title': f'stream {video_id}', 'channelId': f'UC{actor}', 'channelTitle': actor},
+            'liveStreamingDetails': {'scheduledStartTime': start}}
+    return LiveEvent(data, actor, collaborate or [])
+
+
+def deduplicate_with_previous_rule(events, holomenbers):
+    # 書き換える前の_deduplicate_live_eventsと同じ規則、結果はsetの順番になる
+    primary_events = [{e.actor: e} for e in events if not e.collaborate]
+    collaborate_events = [{collabo: e} for e in events if e.collaborate for collabo in e.collaborate]
+    delete_items = []
+    for i in holomenbers:
+        for ce in collaborate_events:
+            if ce.get(i):
+                for pe in [x[i] for x in primary_events if x.get(i)]:
+                    if ce[i].scheduled_start_time == pe.scheduled_start_time:
+                        delete_items.append(ce.get(i))
+                        break
+    events = list(itertools.chain.from_iterable(([list(i.values()) for i in primary_events]
+                                                + [list(j.values()) for j in collaborate_events])))
+    for d in delete_items:
+        events = [event for event in events if event != d]
+    return list(set(events))
+
+
+@pytest.fixture
+def importer():
+    config = Configuration(aws=AwsConfiguration(), holodule=HoloduleConfiguration(holomenbers=HOLOMENBERS),
+                           youtube=YoutubeConfiguration(api_key=''))
+    return holodule.Importer(config, None, load=False)
+
+
+def test_multi_collaborator_stream_is_deleted_when_any_favorite_has_primary(importer):
+    okayu = create_event('v1', '猫又おかゆ')
+    collabo = create_event('v2', '白上フブキ', collaborate=['さくらみこ', '猫又おかゆ'])
+    events = [okayu, collabo]
+    assert importer._deduplicate_live_events(events) == [okayu]
+    assert set(deduplicate_with_previous_rule(events, HOLOMENBERS)) == {okayu}
+
+
+def test_multi_collaborator_stream_is_kept_without_primary_at_same_time(importer):
+    okayu = create_event('v1', '猫又おかゆ', start=LATER)
+    collabo = create_event('v2', '白上フブキ', collaborate=['さくらみこ', '猫又おかゆ'])
+    events = [okayu, collabo]
+    assert importer._deduplicate_live_events(events) == [okayu, collabo]
+    assert set(deduplicate_with_previous_rule(events, HOLOMENBERS)) == {okayu, collabo}
+
+
+def test_same_start_time_across_members(importer):
+    okayu = create_event('v1', '猫又おかゆ')
+    miko = create_event('v2', 'さくらみこ')
+    # 推しでないコラボ相手に同じ時刻の配信があっても削除しない
+    fubuki = create_event('v3', '白上フブキ')
+    with_nene = create_event('v4', '兎田ぺこら', collaborate=['桃鈴ねね', '白上フブキ'])
+    with_miko = create_event('v5', '兎田ぺこら', collaborate=['さくらみこ'])
+    events = [okayu, miko, fubuki, with_nene, with_miko]
+    assert importer._deduplicate_live_events(events) == [okayu, miko, fubuki, with_nene]
+    assert set(deduplicate_with_previous_rule(events, HOLOMENBERS)) == {okayu, miko, fubuki, with_nene}
+
+
+def test_repeated_events_are_kept_once(importer):
+    okayu = create_event('v1', '猫又おかゆ')
+    collabo = create_event('v2', '白上フブキ', collaborate=['桃鈴ねね', 'さくらみこ'])
+    events = [okayu, collabo, okayu, collabo]
+    assert importer._deduplicate_live_events(events) == [okayu, collabo]
+    assert set(deduplicate_with_previous_rule(events, HOLOMENBERS)) == {okayu, collabo}
+
+
+def test_input_order_is_kept(importer):
+    events = [create_event('v1', '桃鈴ねね', start=LATER),
+              create_event('v2', '白上フブキ', collaborate=['さくらみこ']),
+              create_event('v3', '猫又おかゆ'),
+              create_event('v4', 'さくらみこ', start=LATER)]
+    assert importer._deduplicate_live_events(events) == events
+    assert set(deduplicate_with_previous_rule(events, HOLOMENBERS)) == set(events)
+
+
+def test_projected_holomenbers_are_used_for_tenant(importer):
+    okayu = create_event('v1', '猫又おかゆ')
+    collabo = create_event('v2', '白上フブキ', collaborate=['猫又おかゆ'])
+    events = [okayu, collabo]
+    # テナントの推しに猫又おかゆがいなければ、コラボ予定は残す
+    assert importer._deduplicate_live_events(events, ['さくらみこ']) == [okayu, collabo]
+    assert set(deduplicate_with_previous_rule(events, ['さくらみこ'])) == {okayu, collabo}
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from holoscope.datamodel import AwsConfiguration
+from holoscope.datamodel import Configuration
+from holoscope.datamodel import GoogleCalendarConfiguration
+from holoscope.datamodel import LiveEvent
+from holoscope.errors import ConfigrationError
+from holoscope.fake_backends import FakeClientFactory
+from holoscope.utils import GoogleCalendarUtils
+from holoscope.utils import S3Utils
+
+
+def test_s3_utils_uploads_ics_to_fake_s3(backend):
+    config = Configuration(aws=AwsConfiguration(s3_bucket='bucket'))
+    event = LiveEvent({'id': 'v1', 'snippet': {'title': 'stream', 'channelTitle': 'ch'},
+                       'liveStreamingDetails': {'scheduledStartTime': '2024-01-01T12:00:00Z'}},
+                      '猫又おかゆ', [])
+    url = S3Utils(config).create_presigned_url(event)
+    assert url.startswith('https://bucket.s3.fake/v1.ics')
+    assert b'BEGIN:VCALENDAR' in backend.objects[('bucket', 'v1.ics')]
+    assert backend.calls['s3.PutObject'] == 1
+
+
+def test_unknown_boto3_client_raises_configuration_error(backend):
+    with pytest.raises(ConfigrationError, match='sqs'):
+        FakeClientFactory(backend).boto3_client('sqs', AwsConfiguration())
+
+
+def test_calendar_events_are_kept_per_calendar(backend):
+    calendars = {}
+    for calendar_id in ('primary', 'other@group.calendar.google.com'):
+        config = Configuration(aws=AwsConfiguration(),
+                               google_calendar=GoogleCalendarConfiguration(calendar_id=calendar_id))
+        calendars[calendar_id] = GoogleCalendarUtils(config)
+    event = LiveEvent({'id': 'v1', 'snippet': {'title': 'stream', 'channelId': 'UC1', 'channelTitle': 'ch'},
+                       'liveStreamingDetails': {'scheduledStartTime': '2024-01-01T12:00:00Z'}},
+                      '猫又おかゆ', [])
+    created = calendars['primary'].create_event(event)
+    # 他のカレンダーからは一覧にも出てこず、更新もできない
+    assert [e['id'] for e in backend.calendar_events()] == [created['id']]
+    assert not backend.calendar_events(calendar_id='other@group.calendar.google.com')
+    assert calendars['other@group.calendar.google.com'].get_events() == []
+    assert calendars['other@group.calendar.google.com'].update_event(created['id'], event) is None
+    assert backend.calendar_events()[0]['organizer']['email'] == 'primary'
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import arrow
+import pytest
+
+from googleapiclient.errors import HttpError
+
+from holoscope.core import Holoscope
+from holoscope.datamodel import AwsConfiguration
+from holoscope.datamodel import Configuration
+from holoscope.datamodel import GeneralConfiguration
+from holoscope.datamodel import GoogleCalendarConfiguration
+from holoscope.datamodel import HoloduleConfiguration
+from holoscope.datamodel import LineConfiguration
+from holoscope.datamodel import YoutubeConfiguration
+
+
+@pytest.fixture
+def backend_args(upcoming_stream):
+    return upcoming_stream
+
+
+def create_config(**google_calendar):
+    return Configuration(aws=AwsConfiguration(),
+                         general=GeneralConfiguration(exporter_plugin='gcwl'),
+                         holodule=HoloduleConfiguration(holomenbers=['猫又おかゆ']),
+                         google_calendar=GoogleCalendarConfiguration(calendar_id='primary',
+                                                                     max_requests_per_second=1e9,
+                                                                     **google_calendar),
+                         youtube=YoutubeConfiguration(api_key='fake'),
+                         line=LineConfiguration(line_channel_access_token='fake'))
+
+
+@pytest.mark.parametrize('incremental_sync', [False, True])
+def test_listing_failure_creates_no_events(backend, incremental_sync):
+    config = create_config(enable_incremental_sync=incremental_sync)
+    Holoscope(config).run()
+    assert len(backend.calendar_events()) == 1
+    # 予定を取得できなかった時は、登録済みの予定を作り直さずに処理を止める
+    backend.fail('calendar.events.list', 400)
+    with pytest.raises(HttpError):
+        Holoscope(config).run()
+    assert backend.calls['calendar.events.insert'] == 1
+    assert len(backend.calendar_events()) == 1
+
+
+@pytest.mark.parametrize('enable_batch', [False, True])
+def test_unchanged_event_is_not_updated(backend, enable_batch):
+    config = create_config(enable_batch=enable_batch)
+    Holoscope(config).run()
+    # 前回書き込んだ内容とfingerprintが同じなら、何度実行してもevents.updateは送らない
+    Holoscope(config).run()
+    Holoscope(config).run()
+    assert backend.calls['calendar.events.insert'] == 1
+    assert backend.calls['calendar.events.update'] == 0
+
+
+@pytest.mark.parametrize('enable_batch', [False, True])
+@pytest.mark.parametrize('changes', [{'title': 'renamed'}, {'title': 'renamed', 'start_hours': 2}])
+def test_changed_event_is_updated_once(backend, enable_batch, changes):
+    config = create_config(enable_batch=enable_batch)
+    Holoscope(config).run()
+    video = backend.videos['v1']
+    video['snippet']['title'] = changes['title']
+    if 'start_hours' in changes:
+        video['liveStreamingDetails']['scheduledStartTime'] = \
+            arrow.utcnow().shift(hours=changes['start_hours']).isoformat()
+    # タイトルと開始時刻が両方変わっても、まとめて1回の更新で書き込む
+    Holoscope(config).run()
+    assert backend.calls['calendar.events.update'] == 1
+    event, = backend.calendar_events()
+    assert event['extendedProperties']['private']['title'] == changes['title']
+    Holoscope(config).run()
+    assert backend.calls['calendar.events.update'] == 1
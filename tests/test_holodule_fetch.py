@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from holoscope.datamodel import AwsConfiguration
+from holoscope.datamodel import Configuration
+from holoscope.datamodel import HoloduleConfiguration
+from holoscope.datamodel import YoutubeConfiguration
+from holoscope.errors import RestError
+from holoscope.holodule_cache_manager import HoloduleCacheManager
+from holoscope.importer_plugin import holodule
+
+HTML = '''
+<div class="col-6 col-sm-4 col-md-3">
+  <a href="https://www.youtube.com/watch?v=v1">
+    <div class="col text-right name">猫又おかゆ</div>
+    <div class="col col-sm col-md col-lg col-xl"><img src="https://yt3.ggpht.com/okayu"></div>
+  </a>
+</div>'''
+
+
+@pytest.fixture
+def backend_args():
+    return {'holodule_html': HTML}
+
+
+def create_importer(enable_cache):
+    config = Configuration(aws=AwsConfiguration(),
+                           holodule=HoloduleConfiguration(holomenbers=['猫又おかゆ'], enable_cache=enable_cache),
+                           youtube=YoutubeConfiguration(api_key='fake'))
+    return holodule.Importer(config, None, load=False)
+
+
+def test_error_page_is_not_cached(backend):
+    importer = create_importer(enable_cache=True)
+    programs = importer._request_programs()
+    assert [p['video_id'] for p in programs] == ['v1']
+    cache = HoloduleCacheManager(importer.cnf).get_holodule_cache()
+
+    backend.fail('holodule.get', 503)
+    assert importer._request_programs() == programs
+    assert HoloduleCacheManager(importer.cnf).get_holodule_cache() == cache
+
+
+def test_error_without_cache_raises(backend):
+    backend.fail('holodule.get', 503)
+    with pytest.raises(RestError):
+        create_importer(enable_cache=True)._request_programs()
+
+
+def test_error_without_conditional_get_raises(backend):
+    backend.fail('holodule.get', 500)
+    with pytest.raises(RestError):
+        create_importer(enable_cache=False)._request_programs()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from holoscope.datamodel import AwsConfiguration
+from holoscope.datamodel import Configuration
+from holoscope.datamodel import HoloduleConfiguration
+from holoscope.datamodel import YoutubeConfiguration
+from holoscope import holodule_parser
+from holoscope.importer_plugin import holodule
+
+CARD = '''
+<div class="{card_class}">
+  <a href="{href}">
+    <div class="row">
+      <div class="col text-right name">
+        {name}
+      </div>
+    </div>
+    <div class="row">
+      {images}
+    </div>
+  </a>
+</div>'''
+IMAGE = '<div class="col col-sm col-md col-lg col-xl"><img src="{src}"></div>'
+
+
+def create_card(href, name, images, card_class=holodule_parser.CARD_CLASS):
+    return CARD.format(card_class=card_class, href=href, name=name,
+                       images=''.join(IMAGE.format(src=src) for src in images))
+
+
+PAGE = '<html><body><div class="container">' + ''.join([
+    create_card('https://www.youtube.com/watch?v=v1', '猫又おかゆ', ['https://yt3.ggpht.com/okayu']),
+    # コラボ相手のサムネイルが並ぶカード
+    create_card('https://www.youtube.com/watch?v=v2', 'さくらみこ',
+                ['https://yt3.ggpht.com/miko', 'https://yt3.ggpht.com/pekora']),
+    # YouTube以外の配信はprogramにしない
+    create_card('https://www.twitch.tv/videos/1', '桃鈴ねね', ['https://yt3.ggpht.com/nene']),
+    create_card('https://youtu.be/watch?v=v3', 'ラプラス', ['https://yt3.ggpht.com/laplus']),
+]) + '</div></body></html>'
+# classの区切りが空白2つになると、streaming parserではカードが見つからずsoupで解析し直す
+FALLBACK_PAGE = PAGE.replace(f'class="{holodule_parser.CARD_CLASS}"', 'class="col-6  col-sm-4 col-md-3"')
+
+
+@pytest.fixture
+def importer(backend):
+    config = Configuration(aws=AwsConfiguration(),
+                           holodule=HoloduleConfiguration(holomenbers=['猫又おかゆ']),
+                           youtube=YoutubeConfiguration(api_key='fake'))
+    return holodule.Importer(config, None, load=False)
+
+
+def test_streaming_parser_matches_soup(importer):
+    programs = holodule_parser.parse_programs(PAGE)
+    assert [p['video_id'] for p in programs] == ['v1', 'v2', 'v3']
+    assert programs[1]['collaborators'] == ['https://yt3.ggpht.com/pekora']
+    assert programs[2]['actor'] == 'ラプラス・ダークネス'
+    assert programs == importer._parse_programs_with_soup(PAGE)
+
+
+def test_soup_is_used_when_streaming_parser_finds_no_cards(importer):
+    assert holodule_parser.parse_programs(FALLBACK_PAGE) == []
+    programs = importer._parse_programs(FALLBACK_PAGE)
+    assert programs == importer._parse_programs_with_soup(FALLBACK_PAGE)
+    assert programs == holodule_parser.parse_programs(PAGE)
@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from googleapiclient.errors import HttpError
+from holoscope.fake_backends import FakeClientFactory
+from holoscope.metrics import start_metrics
+
+
+@pytest.fixture
+def backend_args():
+    return {'videos': [{'id': 'v1', 'snippet': {}, 'liveStreamingDetails': {}}]}
+
+
+def test_retries_count_attempts_after_the_first(backend):
+    metrics = start_metrics()
+    youtube = FakeClientFactory(backend).youtube('fake')
+    backend.fail('youtube.videos.list', 503, times=2)
+    youtube.videos().list(id='v1', part='snippet').execute(num_retries=3)
+    call = metrics.calls['youtube.videos.list']
+    assert (call['Count'], call['Errors'], call['Retries']) == (3, 2, 2)
+
+
+def test_failed_call_without_retry_is_not_counted_as_retry(backend):
+    metrics = start_metrics()
+    youtube = FakeClientFactory(backend).youtube('fake')
+    backend.fail('youtube.videos.list', 503)
+    with pytest.raises(HttpError):
+        youtube.videos().list(id='v1', part='snippet').execute()
+    youtube.videos().list(id='v2', part='snippet').execute()
+    call = metrics.calls['youtube.videos.list']
+    assert (call['Count'], call['Errors'], call['Retries']) == (2, 1, 0)
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import httplib2
+import pytest
+import time
+
+from holoscope.response_cache import CachedHttp
+from holoscope.response_cache import ResponseCache
+from holoscope.response_cache import set_response_cache
+
+URI = 'https://youtube.googleapis.com/youtube/v3/videos?id=v1'
+
+
+class StubHttp(object):
+    # 条件付きリクエストには304を返し、pruneがTrueなら保存した本文が削除済みになっている状況を作る
+    def __init__(self, cache, prune=False):
+        self.cache = cache
+        self.prune = prune
+        self.requests = []
+
+    def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+        self.requests.append(dict(headers or {}))
+        if 'If-None-Match' in (headers or {}):
+            if self.prune:
+                self.cache.entries.clear()
+            return httplib2.Response({'status': '304'}), b''
+        return httplib2.Response({'status': '200', 'etag': '"new"'}), b'{"items": []}'
+
+
+@pytest.fixture
+def cache():
+    cache = ResponseCache()
+    set_response_cache(cache)
+    yield cache
+    set_response_cache(None)
+
+
+def test_cached_response_is_returned_on_not_modified(cache):
+    key = cache.create_key('GET', URI)
+    cache.entries[key] = {'etag': '"old"', 'content': '{"items": [1]}', 'used_at': time.time()}
+    response, content = CachedHttp(StubHttp(cache)).request(URI)
+    assert response.status == 200
+    assert content == b'{"items": [1]}'
+
+
+def test_pruned_response_is_fetched_again_without_etag(cache):
+    inner = StubHttp(cache, prune=True)
+    key = cache.create_key('GET', URI)
+    cache.entries[key] = {'etag': '"old"', 'content': '{"items": [1]}', 'used_at': time.time()}
+    response, content = CachedHttp(inner).request(URI)
+    assert response.status == 200
+    assert content == b'{"items": []}'
+    assert [h.get('If-None-Match') for h in inner.requests] == ['"old"', None]
+    assert cache.entries[key]['etag'] == '"new"'